@@ -1,8 +1,8 @@
 from __future__ import annotations
 
-import json
 import logging
 import os
+import sys
 from datetime import datetime, timedelta
 
 from airflow import DAG
@@ -41,7 +41,6 @@ def fetch_from_institutions(**context):
 
 
 def validate_fhir(**context):
-    import sys
     sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
     from src.data import validate_fhir_record
 
@@ -55,37 +54,40 @@ def validate_fhir(**context):
     return validated
 
 
-def store_to_s3(**context):
-    import boto3
+def _object_store():
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+    from src.data.snapshots import LocalObjectStore, S3ObjectStore
 
-    validated = context["task_instance"].xcom_pull(key="validated_records", task_ids="validate_fhir")
-    execution_date = context["ds"]
+    if os.getenv("SNAPSHOT_LOCAL_DIR"):
+        return LocalObjectStore(os.environ["SNAPSHOT_LOCAL_DIR"])
+
+    import boto3
 
     s3_kwargs = {
         "endpoint_url": MINIO_ENDPOINT,
         "aws_access_key_id": os.getenv("ONPREM_S3_ACCESS_KEY", "minioadmin"),
         "aws_secret_access_key": os.getenv("ONPREM_S3_SECRET_KEY", "minioadmin"),
     } if MINIO_ENDPOINT else {}
-
-    s3 = boto3.client("s3", **s3_kwargs)
     bucket = os.getenv("ONPREM_S3_BUCKET", "healthalliance-onprem-data") if MINIO_ENDPOINT else S3_BUCKET
+    return S3ObjectStore(bucket, client=boto3.client("s3", **s3_kwargs))
 
-    for inst, records in validated.items():
-        key = f"fhir/{inst}/{execution_date}/records.json"
-        s3.put_object(Bucket=bucket, Key=key, Body=json.dumps(records), ContentType="application/json")
-        logger.info("Uploaded %d records to s3://%s/%s", len(records), bucket, key)
 
+def snapshot_institutions(**context):
+    """Upload only the chunks changed by today's records, plus one manifest per institution."""
+    validated = context["task_instance"].xcom_pull(key="validated_records",
+                                                   task_ids="validate_fhir")
+    execution_date = context["ds"]
 
-def trigger_dvc_push(**context):
-    import subprocess
-    try:
-        result = subprocess.run(["dvc", "push"], capture_output=True, text=True, timeout=120)
-        if result.returncode != 0:
-            logger.warning("dvc push stderr: %s", result.stderr)
-        else:
-            logger.info("dvc push succeeded")
-    except FileNotFoundError:
-        logger.warning("dvc not installed — skipping")
+    store = _object_store()
+    from src.data.snapshots import snapshot
+
+    for inst, records in validated.items():
+        manifest = snapshot(store, inst, execution_date, records)
+        stats = manifest["stats"]
+        logger.info("%s: %d records in, %d/%d chunks uploaded (%d bytes), "
+                    "snapshot holds %d records",
+                    inst, stats["records_in"], stats["chunks_uploaded"], len(manifest["chunks"]),
+                    stats["bytes_uploaded"], manifest["records"])
 
 
 with DAG(
@@ -99,7 +101,6 @@ with DAG(
 ) as dag:
     t1 = PythonOperator(task_id="fetch_from_institutions", python_callable=fetch_from_institutions)
     t2 = PythonOperator(task_id="validate_fhir", python_callable=validate_fhir)
-    t3 = PythonOperator(task_id="store_to_s3", python_callable=store_to_s3)
-    t4 = PythonOperator(task_id="trigger_dvc_push", python_callable=trigger_dvc_push)
+    t3 = PythonOperator(task_id="snapshot_institutions", python_callable=snapshot_institutions)
 
-    t1 >> t2 >> t3 >> t4
+    t1 >> t2 >> t3
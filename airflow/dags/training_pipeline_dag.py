@@ -5,10 +5,12 @@ import os
 from datetime import datetime, timedelta
 
 from airflow import DAG
+from airflow.exceptions import AirflowSkipException
 from airflow.operators.python import PythonOperator
 
 logger = logging.getLogger(__name__)
 
+# A CSV fetched by dvc pull, or a snapshot store (s3://bucket/prefix) streamed by src/data/loader.py
 DATA_PATH = os.getenv("TRAINING_DATA_PATH", "data/features/patient_features.csv")
 MLFLOW_URI = os.getenv("MLFLOW_TRACKING_URI", "http://mlflow:5000")
 
@@ -23,6 +25,9 @@ DEFAULT_ARGS = {
 
 def pull_data_dvc(**context):
     import subprocess
+    if DATA_PATH.startswith("s3://"):
+        logger.info("Training streams snapshots from %s — skipping dvc pull", DATA_PATH)
+        return
     try:
         result = subprocess.run(["dvc", "pull"], capture_output=True, text=True, timeout=300)
         if result.returncode != 0:
@@ -38,11 +43,23 @@ def run_training_pipeline_task(**context):
     sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
 
     import mlflow
+    from src.data.loader import is_snapshot_store
     from src.pipelines import run_training_pipeline
 
     mlflow.set_tracking_uri(MLFLOW_URI)
-    run_id = run_training_pipeline(DATA_PATH)
-    logger.info("Training complete — run_id: %s", run_id)
+    # Snapshot stores are read as of the run date, so a rerun trains on the same data and
+    # returns the earlier run's ID without training when code and options are unchanged too
+    # (PIPELINE_CACHE_DIR, see src/pipelines/cache.py); registration below then reuses its
+    # model version
+    as_of = context["ds"] if is_snapshot_store(DATA_PATH) else None
+    run_id = run_training_pipeline(DATA_PATH, as_of=as_of)
+    if run_id is None:
+        # Tracker degraded: the model was saved locally and the run spooled
+        # (TRACKING_SPOOL_DIR), not logged
+        logger.warning("Training complete but MLflow tracking was unavailable — "
+                       "nothing to register")
+    else:
+        logger.info("Training complete — run_id: %s", run_id)
     context["task_instance"].xcom_push(key="mlflow_run_id", value=run_id)
     return run_id
 
@@ -53,11 +70,17 @@ def register_model_mlflow(**context):
 
     run_id = context["task_instance"].xcom_pull(key="mlflow_run_id", task_ids="run_training_pipeline")
     if not run_id:
-        logger.warning("No run_id — skipping model registration")
-        return
+        # Tracking was degraded or spooling; registering runs:/None/model would fail,
+        # so skip visibly
+        raise AirflowSkipException("No MLflow run_id — skipping model registration")
 
     mlflow.set_tracking_uri(MLFLOW_URI)
     model_name = "HealthAllianceReadmissionModel"
+    existing = MlflowClient().search_model_versions(f"name='{model_name}' and run_id='{run_id}'")
+    if existing:
+        logger.info("Run %s is unchanged from a previous training — reusing '%s' v%s",
+                    run_id, model_name, max(int(mv.version) for mv in existing))
+        return
     mv = mlflow.register_model(model_uri=f"runs:/{run_id}/model", name=model_name)
     MlflowClient().transition_model_version_stage(
         name=model_name, version=mv.version, stage="Staging", archive_existing_versions=False
@@ -82,6 +105,8 @@ with DAG(
     t1 = PythonOperator(task_id="pull_data_dvc", python_callable=pull_data_dvc)
     t2 = PythonOperator(task_id="run_training_pipeline", python_callable=run_training_pipeline_task)
     t3 = PythonOperator(task_id="register_model_mlflow", python_callable=register_model_mlflow)
-    t4 = PythonOperator(task_id="notify_completion", python_callable=notify_completion)
+    # Still notify when registration was skipped for want of a run_id
+    t4 = PythonOperator(task_id="notify_completion", python_callable=notify_completion,
+                        trigger_rule="none_failed")
 
     t1 >> t2 >> t3 >> t4
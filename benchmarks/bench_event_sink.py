@@ -0,0 +1,75 @@
+"""Throughput of the buffered prediction event sink (src/monitoring/events.py).
+
+    python benchmarks/bench_event_sink.py --events 200000 --threads 4
+
+Compares the per-request cost of the old synchronous ``record_prediction``
+with ``PredictionEventSink.emit`` and measures how fast the background
+flusher persists events to the compressed audit log.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.monitoring import record_prediction
+from src.monitoring.events import AuditLog, PredictionEventSink
+
+
+def _run_threads(fn, n_events, n_threads):
+    per_thread = n_events // n_threads
+
+    def work():
+        for i in range(per_thread):
+            fn(i)
+
+    threads = [threading.Thread(target=work) for _ in range(n_threads)]
+    t = time.perf_counter()
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    return per_thread * n_threads / (time.perf_counter() - t)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=200_000)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    sync_rate = _run_threads(lambda i: record_prediction("LOW", 0.002, 0.8), args.events,
+                             args.threads)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log = AuditLog(tmp)
+        sink = PredictionEventSink(log, capacity=args.events, autostart=False)
+        emit_rate = _run_threads(
+            lambda i: sink.emit("user:bench", f"P{i}", "dkfz", "LOW", 0.1, 0.8, 0.002),
+            args.events, args.threads)
+
+        t = time.perf_counter()
+        flushed = sink.flush()
+        flush_rate = flushed / (time.perf_counter() - t)
+        size = sum(os.path.getsize(os.path.join(tmp, f)) for f in os.listdir(tmp))
+
+        dropping = PredictionEventSink(log, capacity=1, autostart=False)
+        dropping.emit("user:bench", "P0", "dkfz", "LOW", 0.1, 0.8, 0.002)
+        drop_rate = _run_threads(
+            lambda i: dropping.emit("user:bench", f"P{i}", "dkfz", "LOW", 0.1, 0.8, 0.002),
+            args.events, args.threads)
+
+    print(f"events: {args.events:,}  producer threads: {args.threads}")
+    print(f"{'synchronous record_prediction':<34} {sync_rate:>12,.0f} events/s")
+    speedup = sync_rate and emit_rate / sync_rate
+    print(f"{'sink.emit (buffer has room)':<34} {emit_rate:>12,.0f} events/s  ({speedup:.1f}x)")
+    print(f"{'sink.emit (buffer full, dropping)':<34} {drop_rate:>12,.0f} events/s")
+    print(f"{'background flush to audit log':<34} {flush_rate:>12,.0f} events/s  "
+          f"({size / flushed:.1f} bytes/event gz)")
+
+
+if __name__ == "__main__":
+    main()
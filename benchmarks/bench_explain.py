@@ -0,0 +1,71 @@
+"""Scoring latency with and without per-feature explanations (src/models/explain.py).
+
+    python benchmarks/bench_explain.py --patients 20000 --rows 1 100 10000
+
+Trains a forest with the default parameters on synthetic patients, then for
+each batch size times what /api/v1/predict (one row, ``predict_risk``) and
+/api/v1/predict/batch (``score_batch``) spend in the model, alone and with
+``explain`` on. The one-off explainer build that model loading pays is
+reported separately. HTTP and serialization are excluded.
+"""
+import argparse
+import os
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import numpy as np
+
+from src.data import generate_training_data
+from src.models import FEATURES, predict_risk, score_batch, train_model
+from src.models.explain import TreeExplainer
+
+
+def _best(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--patients", type=int, default=20_000, help="Synthetic training set size")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1, 100, 10_000])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+    df = generate_training_data(args.patients, seed=42)
+    model, scaler, _ = train_model(df)
+    t = time.perf_counter()
+    explainer = TreeExplainer(model, scaler)
+    print(f"{model.n_estimators} trees, {explainer.n_leaves:,} leaves: explainer built in "
+          f"{(time.perf_counter() - t) * 1000:.0f}ms, {explainer.nbytes / 1e6:.1f} MB")
+
+    X = df[FEATURES].to_numpy(dtype=float)
+    features = dict(zip(FEATURES, X[0]))
+    repeats = args.repeats * 20
+    plain = _best(lambda: predict_risk(model, scaler, features), repeats)
+    explained = _best(lambda: (predict_risk(model, scaler, features), explainer.explain(X[:1])),
+                      repeats)
+    print(f"\n/predict (1 row): {plain * 1000:.2f}ms, with explanation {explained * 1000:.2f}ms "
+          f"({explained / plain:.1f}x)")
+
+    print(f"\n  {'rows':>8} {'score':>11} {'score+explain':>14} {'ratio':>7} "
+          f"{'explain per row':>16}")
+    for n in args.rows:
+        rows = X[np.arange(n) % len(X)]
+        plain = _best(lambda: score_batch(model, scaler, rows), args.repeats)
+        explained = _best(
+            lambda: (score_batch(model, scaler, rows), explainer.contributions(rows)), args.repeats)
+        print(f"  {n:>8,} {plain * 1000:>9.2f}ms {explained * 1000:>12.2f}ms "
+              f"{explained / plain:>6.1f}x {(explained - plain) / n * 1e6:>14.1f}us")
+
+
+if __name__ == "__main__":
+    main()
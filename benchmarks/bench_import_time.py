@@ -0,0 +1,105 @@
+"""Import-time profile and startup budget of the API and CLI entry points.
+
+    python benchmarks/bench_import_time.py            # profile every target
+    python benchmarks/bench_import_time.py api --top 25
+    python benchmarks/bench_import_time.py --check    # exit 1 when a budget is exceeded
+
+Each target runs in a fresh interpreter under ``python -X importtime``. Its
+import time is the cumulative time of the modules it imports beyond what a
+bare interpreter loads at startup. The best of ``--repeats`` runs is reported.
+A target fails its budget when it is slower than ``budget_ms`` or loads one
+of its ``forbidden`` packages: these are heavy dependencies the entry point
+only needs on first use, so loading them at import time is a regression even
+on a fast machine. tests/test_startup.py checks only the forbidden packages;
+the millisecond budgets depend on the machine and are enforced by --check.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+HEAVY = ("sklearn", "scipy", "pandas", "mlflow", "requests", "jose", "pyarrow")
+
+# name -> (interpreter arguments, budget in ms, packages that must not be imported)
+TARGETS = {
+    "api": (["-c", "import src.api.main"], 1500, HEAVY),
+    "serve": (["-c", "import src.api.serve"], 300, HEAVY + ("fastapi",)),
+    "pipelines": (["-c", "import src.pipelines"], 800, HEAVY),
+    "train --help": (["scripts/train.py", "--help"], 800, HEAVY),
+    "score --help": (["scripts/score.py", "--help"], 800, HEAVY),
+    "prepare_data": (["-c", "import sys; sys.path.insert(0, 'scripts'); import prepare_data"], 1500,
+                     ("sklearn", "mlflow")),
+}
+
+
+def _run(args):
+    """``[(module, cumulative_us, depth)]`` from one ``-X importtime`` run."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", *args], cwd=ROOT,
+                          capture_output=True, text=True, env={**os.environ, "PYTHONPATH": ROOT})
+    if proc.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} failed:\n{proc.stderr[-2000:]}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), int(cumulative), depth))
+    return rows
+
+
+def profile(args, repeats=3):
+    """``(import_ms, modules)`` of the fastest of ``repeats`` runs; ``modules`` maps
+    name -> cumulative ms."""
+    startup = {name for name, _, _ in _run(["-c", "pass"])}
+    best = None
+    for _ in range(repeats):
+        rows = [row for row in _run(args) if row[0] not in startup]
+        total = sum(cumulative for _, cumulative, depth in rows if depth == 0) / 1000
+        if best is None or total < best[0]:
+            best = (total, {name: cumulative / 1000 for name, cumulative, _ in rows})
+    return best
+
+
+def check(name, repeats=3):
+    """``(problems, import_ms, modules)``; ``problems`` is empty when the target is within
+    budget."""
+    args, budget, forbidden = TARGETS[name]
+    total, modules = profile(args, repeats)
+    problems = [f"{name}: imports {pkg} at startup" for pkg in forbidden if pkg in modules]
+    if total > budget:
+        problems.append(f"{name}: {total:.0f}ms exceeds the {budget}ms budget")
+    return problems, total, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("targets", nargs="*",
+                        help=f"Targets to profile (default: all of {', '.join(TARGETS)})")
+    parser.add_argument("--top", type=int, default=10, help="Slowest modules to list per target")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--check", action="store_true",
+                        help="Exit 1 when a target exceeds its budget")
+    args = parser.parse_args()
+    unknown = set(args.targets) - set(TARGETS)
+    if unknown:
+        parser.error(f"unknown targets: {', '.join(sorted(unknown))}")
+
+    failed = False
+    for name in args.targets or TARGETS:
+        problems, total, modules = check(name, args.repeats)
+        failed |= bool(problems)
+        verdict = "OVER" if problems else "OK"
+        print(f"\n{name}: {total:.0f}ms (budget {TARGETS[name][1]}ms) {verdict}")
+        for problem in problems:
+            print(f"  ! {problem}")
+        for module, ms in sorted(modules.items(), key=lambda kv: -kv[1])[:args.top]:
+            print(f"  {ms:>9.1f}ms  {module}")
+    if args.check and failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
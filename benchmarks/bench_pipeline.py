@@ -0,0 +1,334 @@
+"""Wall time, memory and artifact size of the training pipeline stages by data size.
+
+    python benchmarks/bench_pipeline.py --rows 10000 100000 1000000 10000000 --jobs 1 4
+    python benchmarks/bench_pipeline.py --check
+
+For each size, generate_training_data makes the patients. prepare_data.process
+gets the same rows in the raw UCI layout; the other stages get them as
+data/processed/patients.csv has them. The stages are process,
+preprocess_features, train_model (once per --jobs value, passed as n_jobs),
+save_model and load_model of the model with its similar-patient index, and
+run_training_pipeline on a CSV with a file:// MLflow store and no stage cache.
+
+Inputs are built in the parent, and each stage runs in a process forked from
+it, so its peak RSS (resource.getrusage) covers that stage alone. Reported
+per stage:
+
+- ``seconds`` and ``rows_per_sec``.
+- ``rss_peak_mb``: peak RSS, including the inputs inherited from the parent.
+- ``rss_growth_mb``: peak RSS minus the RSS at the start of the stage.
+- ``alloc_peak_mb``: peak of Python and NumPy allocations (tracemalloc). It is
+  measured in a second run, because tracing slows the stage, and only up to
+  --trace-rows.
+- ``artifact_bytes``: the file the stage writes (processed CSV or model pickle).
+
+Results are written to --output as JSON. --check compares each (stage, rows,
+jobs) also in --baseline and exits 1 when a metric grew by more than
+--tolerance. Timings only compare on the machine that recorded the baseline;
+rerun with --update-baseline there after an intended change.
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing as mp
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "scripts"))
+
+import numpy as np
+
+from src.data import generate_training_data
+
+BASELINE = os.path.join(ROOT, "benchmarks", "baselines", "pipeline.json")
+STAGES = [
+    "process", "preprocess_features", "train_model", "save_model", "load_model",
+    "run_training_pipeline",
+]
+# Growth below these floors is noise, whatever the ratio
+METRICS = {"seconds": 0.05, "rss_growth_mb": 8.0, "alloc_peak_mb": 8.0, "artifact_bytes": 64 << 10}
+
+
+def _rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return _peak_rss_mb()
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, KiB on Linux
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def _raw(df):
+    """``df`` in the raw UCI layout prepare_data.process reads: age bands, Male/Female,
+    <30/>30/NO."""
+    import pandas as pd
+
+    decade = df["age"] // 10 * 10
+    return pd.DataFrame({
+        "age": decade.map({d: f"[{d}-{d + 10})" for d in decade.unique()}),
+        "gender": np.where(df["gender_encoded"] == 1, "Male", "Female"),
+        "number_diagnoses": df["num_conditions"],
+        "num_medications": df["num_medications"],
+        "number_inpatient": df["recent_encounters"],
+        "readmitted": np.where(df["readmitted"] == 1, "<30", np.where(df.index % 2, ">30", "NO")),
+    })
+
+
+def _patients(df):
+    """``df`` as data/processed/patients.csv has it, with a gender column instead of
+    gender_encoded."""
+    gender = np.where(df["gender_encoded"] == 1, "male", "female")
+    return df.assign(gender=gender).drop(columns="gender_encoded")
+
+
+# Each stage builds its inputs in the parent and returns (run, artifact): ``run`` is what is
+# measured in the child, ``artifact(result)`` runs after it there and returns the bytes written.
+
+def _stage_process(ctx, jobs):
+    import prepare_data
+
+    raw = _raw(ctx["df"])
+    path = os.path.join(ctx["workdir"], "data", "processed", "patients.csv")
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return prepare_data.process(raw)
+    return run, lambda result: os.path.getsize(path)
+
+
+def _stage_preprocess_features(ctx, jobs):
+    from src.data import preprocess_features
+
+    patients = _patients(ctx["df"])
+    return lambda: preprocess_features(patients), lambda result: None
+
+
+def _stage_train_model(ctx, jobs):
+    from src.models import save_model, train_model
+
+    def artifact(result):
+        # The first fit is kept for save_model and load_model
+        if not os.path.exists(ctx["model_path"]):
+            save_model(result[0], result[1], ctx["model_path"])
+        return None
+    return lambda: train_model(ctx["df"], n_jobs=jobs), artifact
+
+
+def _stage_save_model(ctx, jobs):
+    from src.models import load_model, save_model
+    from src.models.neighbors import build_index
+
+    _ensure_model(ctx)
+    model, scaler = load_model(ctx["model_path"])
+    index = build_index(ctx["df"], scaler)
+    path = os.path.join(ctx["workdir"], "saved.pkl")
+    return (lambda: save_model(model, scaler, path, index=index),
+            lambda result: os.path.getsize(path))
+
+
+def _stage_load_model(ctx, jobs):
+    from src.models import load_artifact
+
+    _ensure_model(ctx)
+    path = os.path.join(ctx["workdir"], "saved.pkl")
+    if not os.path.exists(path):
+        _stage_save_model(ctx, jobs)[0]()
+    return lambda: load_artifact(path), lambda result: os.path.getsize(path)
+
+
+def _stage_run_training_pipeline(ctx, jobs):
+    import src.pipelines as pipelines
+
+    data = os.path.join(ctx["workdir"], "patients.csv")
+    _patients(ctx["df"]).to_csv(data, index=False)
+    pipelines.MLFLOW_URI = f"file://{os.path.join(ctx['workdir'], 'mlruns')}"
+    pipelines.MODEL_PATH = os.path.join(ctx["workdir"], "readmission_model.pkl")
+    pipelines.TRACKING_SPOOL_DIR = os.path.join(ctx["workdir"], "spool")
+    return (lambda: pipelines.run_training_pipeline(data, cache_dir=None),
+            lambda result: os.path.getsize(pipelines.MODEL_PATH))
+
+
+def _ensure_model(ctx):
+    if not os.path.exists(ctx["model_path"]):
+        run, artifact = _stage_train_model(ctx, None)
+        artifact(run())
+
+
+def _child(run, artifact, rows, trace, conn):
+    try:
+        rss = _rss_mb()
+        start = time.perf_counter()
+        result = run()
+        seconds = time.perf_counter() - start
+        peak = _peak_rss_mb()
+        out = {"seconds": round(seconds, 4), "rows_per_sec": round(rows / seconds),
+               "rss_peak_mb": round(peak, 1), "rss_growth_mb": round(max(peak - rss, 0.0), 1),
+               "alloc_peak_mb": None, "artifact_bytes": artifact(result)}
+        del result
+        if trace:
+            tracemalloc.start()
+            run()
+            out["alloc_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+            tracemalloc.stop()
+        conn.send(out)
+    except BaseException as e:
+        conn.send({"error": f"{type(e).__name__}: {e}"})
+
+
+def measure(stage, ctx, jobs=None, trace=True):
+    """Metrics of one stage on ``ctx["df"]``, run in a forked process."""
+    run, artifact = globals()[f"_stage_{stage}"](ctx, jobs)
+    fork = mp.get_context("fork")
+    receiver, sender = fork.Pipe(duplex=False)
+    child = fork.Process(target=_child, args=(run, artifact, len(ctx["df"]), trace, sender))
+    child.start()
+    sender.close()
+    try:
+        out = receiver.recv()
+    except EOFError:
+        out = None
+    child.join()
+    if out is None:
+        out = {"error": f"exited with code {child.exitcode}"}  # e.g. -9 when killed out of memory
+    return {"stage": stage, "rows": len(ctx["df"]), "jobs": jobs, **out}
+
+
+def _meta():
+    import pandas
+    import sklearn
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "created_at": datetime.now().isoformat(timespec="seconds"), "commit": commit,
+        "machine": platform.machine(), "processor": platform.processor() or None,
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(), "numpy": np.__version__, "pandas": pandas.__version__,
+        "sklearn": sklearn.__version__,
+    }
+
+
+def _key(result):
+    return result["stage"], result["rows"], result["jobs"]
+
+
+def compare(results, baseline, tolerance=0.25):
+    """Entries of ``results`` that regressed against the same (stage, rows, jobs) of ``baseline``.
+
+    A metric regresses when it exceeds the baseline by more than ``tolerance``
+    (a fraction) and by more than its METRICS noise floor; a stage that fails
+    where the baseline did not is a regression too.
+    """
+    base = {_key(r): r for r in baseline["results"]}
+    regressions = []
+    for r in results["results"]:
+        b = base.get(_key(r))
+        if b is None or "error" in b:
+            continue
+        if "error" in r:
+            regressions.append({"stage": r["stage"], "rows": r["rows"], "jobs": r["jobs"],
+                                "metric": "error", "baseline": None, "value": r["error"]})
+            continue
+        for metric, floor in METRICS.items():
+            old, new = b.get(metric), r.get(metric)
+            if old is None or new is None:
+                continue
+            if new > old * (1 + tolerance) and new - old > floor:
+                regressions.append({"stage": r["stage"], "rows": r["rows"], "jobs": r["jobs"],
+                                    "metric": metric, "baseline": old, "value": new})
+    return regressions
+
+
+def _fmt(value, spec, width):
+    return (format(value, spec) if value is not None else "-").rjust(width)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1],
+                        help="n_jobs values to train with")
+    parser.add_argument("--trace-rows", type=int, default=1_000_000,
+                        help="Largest size to also run under tracemalloc (0 to skip)")
+    parser.add_argument("--output", default="bench_pipeline.json")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed growth of a metric, as a fraction")
+    parser.add_argument("--check", action="store_true",
+                        help="Exit 1 when a stage regressed against --baseline")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="Write the results to --baseline")
+    args = parser.parse_args()
+
+    results = {"meta": _meta(), "results": []}
+    for n in args.rows:
+        print(f"\n{n:,} rows")
+        print(f"  {'stage':<22} {'jobs':>4} {'seconds':>9} {'rows/s':>11} {'peak MB':>8} "
+              f"{'growth MB':>9} {'traced MB':>9} {'artifact B':>12}")
+        with tempfile.TemporaryDirectory(prefix="bench-pipeline-") as workdir:
+            cwd = os.getcwd()
+            # prepare_data.process writes data/processed/patients.csv under the cwd
+            os.chdir(workdir)
+            try:
+                ctx = {"df": generate_training_data(n, seed=42), "workdir": workdir,
+                       "model_path": os.path.join(workdir, "model.pkl")}
+                for stage in args.stages:
+                    for jobs in (args.jobs if stage == "train_model" else [None]):
+                        r = measure(stage, ctx, jobs, trace=n <= args.trace_rows)
+                        results["results"].append(r)
+                        if "error" in r:
+                            print(f"  {stage:<22} {_fmt(jobs, 'd', 4)} {r['error']}")
+                            continue
+                        print(f"  {stage:<22} {_fmt(jobs, 'd', 4)} {r['seconds']:>9.3f} "
+                              f"{r['rows_per_sec']:>11,} {r['rss_peak_mb']:>8.1f} "
+                              f"{r['rss_growth_mb']:>9.1f} {_fmt(r['alloc_peak_mb'], '.1f', 9)} "
+                              f"{_fmt(r['artifact_bytes'], ',', 12)}")
+            finally:
+                os.chdir(cwd)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline updated: {args.baseline}")
+    elif args.check:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if (baseline["meta"].get("machine"), baseline["meta"].get("cpu_count")) != (
+                results["meta"]["machine"], results["meta"]["cpu_count"]):
+            print(f"Warning: baseline was recorded on {baseline['meta'].get('machine')} with "
+                  f"{baseline['meta'].get('cpu_count')} CPUs; timings may not compare")
+        regressions = compare(results, baseline, args.tolerance)
+        for r in regressions:
+            print(f"REGRESSION {r['stage']} rows={r['rows']:,} jobs={r['jobs']}: {r['metric']} "
+                  f"{r['baseline']} -> {r['value']}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Serialization overhead of the prediction wire formats (src/api/codecs.py).
+
+    python benchmarks/bench_serialization.py --rows 1 100000
+
+For each format, measures what the server spends turning a request body into
+the feature matrix and the scores back into a response body, next to the
+per-row Pydantic path of /api/v1/predict (stdlib json + PatientRiskRequest /
+PatientRiskResponse). Model time is excluded: scores are precomputed.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import msgpack
+import numpy as np
+import pyarrow as pa
+
+from src.api import codecs
+from src.api.main import RECOMMENDATIONS, PatientRiskRequest, PatientRiskResponse
+from src.models import FEATURES
+
+
+def _columns(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return {
+        "patient_id": [f"P{i:07d}" for i in range(n)],
+        "age": rng.integers(18, 95, n),
+        "gender_encoded": rng.integers(0, 2, n),
+        "num_conditions": rng.integers(0, 16, n),
+        "num_medications": rng.integers(0, 40, n),
+        "recent_encounters": rng.integers(0, 10, n),
+    }
+
+
+def _bodies(cols):
+    n = len(cols["patient_id"])
+    numeric = {k: v for k, v in cols.items() if k != "patient_id"}
+    rows = [{"patient_id": cols["patient_id"][i], "age": int(cols["age"][i]),
+             "gender": "male" if cols["gender_encoded"][i] else "female",
+             "conditions": ["c"] * int(cols["num_conditions"][i]),
+             "medications": ["m"] * int(cols["num_medications"][i]),
+             "recent_encounters": int(cols["recent_encounters"][i])} for i in range(n)]
+    table = pa.table({"patient_id": cols["patient_id"],
+                      **{k: pa.array(v, pa.int32()) for k, v in numeric.items()}})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return {
+        "pydantic (per row)": json.dumps(rows).encode(),
+        "json (columnar)": codecs.dumps_json({"patient_id": cols["patient_id"], **numeric}),
+        "msgpack (lists)": msgpack.packb({"patient_id": cols["patient_id"],
+                                          **{k: v.tolist() for k, v in numeric.items()}}),
+        "msgpack (typed)": msgpack.packb({"patient_id": cols["patient_id"], **{
+            k: {"dtype": "<i8", "data": np.asarray(v, "<i8").tobytes()}
+            for k, v in numeric.items()}}),
+        "arrow": sink.getvalue().to_pybytes(),
+    }
+
+
+def _pydantic_roundtrip(body, risk, levels, confidence):
+    rows = [PatientRiskRequest.model_validate(r) for r in json.loads(body)]
+    X = np.array([[r.age, len(r.conditions), len(r.medications), r.recent_encounters,
+                   1 if r.gender.lower() == "male" else 0] for r in rows], dtype=float)
+    names = [codecs.LEVEL_NAMES[c] for c in levels.tolist()]
+    out = [PatientRiskResponse(patient_id=r.patient_id, readmission_risk=k, risk_level=lvl,
+                               confidence=c, recommendations=RECOMMENDATIONS[lvl]).model_dump()
+           for r, k, lvl, c in zip(rows, risk.tolist(), names, confidence.tolist())]
+    return X, json.dumps(out).encode()
+
+
+def _codec_roundtrip(body, media, risk, levels, confidence):
+    batch = codecs.decode_batch(body, media)
+    return batch["X"], codecs.encode_batch(media, batch["patient_id"], risk, levels, confidence)
+
+
+def _best(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        t = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - t)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1, 100_000])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    media = {"json (columnar)": codecs.JSON, "msgpack (lists)": codecs.MSGPACK,
+             "msgpack (typed)": codecs.MSGPACK, "arrow": codecs.ARROW}
+    for n in args.rows:
+        cols = _columns(n)
+        expected = np.column_stack([cols[c] for c in FEATURES]).astype(float)
+        risk = np.round(np.random.default_rng(1).random(n), 2)
+        levels = np.searchsorted([0.30, 0.60], risk, side="right").astype(np.int8)
+        confidence = np.round(0.5 + risk / 2, 2)
+
+        print(f"\n{n:,} row(s)")
+        print(f"  {'format':<20} {'request':>11} {'response':>11} {'server time':>12} "
+              f"{'per row':>10}")
+        for name, body in _bodies(cols).items():
+            repeats = args.repeats if n > 1000 else args.repeats * 200
+            if name.startswith("pydantic"):
+                elapsed, (X, out) = _best(
+                    lambda: _pydantic_roundtrip(body, risk, levels, confidence), repeats)
+            else:
+                elapsed, (X, out) = _best(
+                    lambda: _codec_roundtrip(body, media[name], risk, levels, confidence), repeats)
+            assert np.array_equal(X, expected), name
+            print(f"  {name:<20} {len(body):>10,}B {len(out):>10,}B {elapsed * 1000:>10.3f}ms "
+                  f"{elapsed / n * 1e6:>8.2f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Throughput scaling of the pre-forked API server (src/api/serve.py).
+
+    python benchmarks/bench_serving.py --workers 1,2,4 --duration 10
+
+For each worker count a fresh server is started, a pool of load-generator
+processes hammers /api/v1/predict over keep-alive connections, and the
+throughput per worker (core) and scaling efficiency against one worker are
+printed. Run it on a machine with at least as many free cores as
+``max(workers) + clients``; otherwise the load generator competes with the
+workers and the numbers flatten out.
+"""
+import argparse
+import http.client
+import json
+import multiprocessing as mp
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+PAYLOAD = json.dumps({
+    "patient_id": "BENCH-001", "age": 72, "gender": "female", "recent_encounters": 2,
+    "conditions": ["diabetes", "hypertension", "CHF"], "medications": ["metformin", "lisinopril"],
+})
+HEADERS = {"Content-Type": "application/json", "X-API-Key": "dev-key-dkfz"}
+
+
+def _client(port, duration, results):
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    done, deadline = 0, time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        conn.request("POST", "/api/v1/predict", body=PAYLOAD, headers=HEADERS)
+        resp = conn.getresponse()
+        resp.read()
+        done += resp.status == 200
+    results.put(done)
+
+
+def _wait_ready(port, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/health")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError("server did not become ready")
+
+
+def run(workers, clients, duration, port):
+    env = {**os.environ, "PYTHONWARNINGS": "ignore"}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "src.api.serve", "--workers", str(workers), "--port", str(port),
+         "--metrics-port", "0", "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+    try:
+        _wait_ready(port)
+        results = mp.Queue()
+        procs = [mp.Process(target=_client, args=(port, duration, results)) for _ in range(clients)]
+        for p in procs:
+            p.start()
+        total = sum(results.get() for _ in procs)
+        for p in procs:
+            p.join()
+        return total / duration
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", default="1,2,4", help="Comma-separated worker counts")
+    parser.add_argument("--clients", type=int, default=None,
+                        help="Load-generator processes (default 2 per worker)")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    counts = [int(w) for w in args.workers.split(",")]
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    print(f"cores available: {cores}")
+    print(f"{'workers':>8} {'clients':>8} {'req/s':>10} {'req/s/core':>11} {'efficiency':>11}")
+    base = None
+    for w in counts:
+        clients = args.clients or 2 * w
+        rps = run(w, clients, args.duration, args.port)
+        base = base or rps / w
+        print(f"{w:>8} {clients:>8} {rps:>10.1f} {rps / w:>11.1f} {rps / w / base:>10.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,12 @@ const COLORS: Record<string, string> = {
   embl: 'bg-purple-100 text-purple-800',
 }
 
+const LEVEL_COLORS: Record<string, string> = {
+  LOW: 'text-green-700',
+  MEDIUM: 'text-amber-700',
+  HIGH: 'text-red-700',
+}
+
 export default function InstitutionCard({ institution }: Props) {
   const badge = COLORS[institution.id] ?? 'bg-gray-100 text-gray-800'
 
@@ -29,6 +35,15 @@ export default function InstitutionCard({ institution }: Props) {
           </span>{' '}
           patients
         </p>
+        {institution.patient_count > 0 && (
+          <div className="flex gap-3 mt-2 text-xs">
+            {(['LOW', 'MEDIUM', 'HIGH'] as const).map((level) => (
+              <span key={level} className={LEVEL_COLORS[level]}>
+                {level} {institution.risk_levels[level].toLocaleString()}
+              </span>
+            ))}
+          </div>
+        )}
       </div>
     </div>
   )
@@ -21,6 +21,7 @@ export interface Institution {
   name: string
   location: string
   patient_count: number
+  risk_levels: Record<'LOW' | 'MEDIUM' | 'HIGH', number>
 }
 
 export interface HealthStatus {
@@ -54,7 +54,8 @@ def process(raw):
         'recent_encounters': df['number_inpatient'],
         'gender':            df['gender'].str.lower(),
         'readmitted':        df['readmitted'].map({'<30': 1, '>30': 0, 'NO': 0}),
-    }).dropna().astype(int)
+    }).dropna()
+    processed = processed.astype({col: int for col in processed.columns if col != 'gender'})
 
     os.makedirs("data/processed", exist_ok=True)
     processed.to_csv("data/processed/patients.csv", index=False)
@@ -0,0 +1,45 @@
+import argparse
+import logging
+import os
+import sys
+import warnings
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.pipelines.scoring import MissingColumnsError, score_file
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+logger = logging.getLogger("score")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Score a patient file (CSV or Parquet) with the readmission model")
+    parser.add_argument("input",
+                        help="Patient CSV or Parquet file, e.g. data/processed/patients.csv")
+    parser.add_argument("output",
+                        help="Output file; .parquet/.pq writes Parquet, anything else CSV")
+    parser.add_argument("--model",
+                        default=os.getenv("MODEL_OUTPUT_PATH", "models/readmission_model.pkl"))
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Scoring processes; default one per core")
+    parser.add_argument("--chunk-size", type=int, default=20_000,
+                        help="Rows read and scored per chunk")
+    args = parser.parse_args()
+    # The scaler was fitted on a DataFrame; chunks are scored as plain arrays
+    warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+    if not os.path.exists(args.model):
+        parser.error(f"model {args.model} not found; train one with scripts/train.py")
+    try:
+        stats = score_file(args.input, args.output, args.model, workers=args.workers,
+                           chunk_size=args.chunk_size)
+    except MissingColumnsError as e:
+        parser.error(str(e))
+    logger.info("Scored %d rows in %.2fs with %d worker(s): %d rows/s",
+                stats["rows"], stats["seconds"], stats["workers"], stats["rows_per_sec"])
+    logger.info("Results written to %s", args.output)
+
+
+if __name__ == "__main__":
+    main()
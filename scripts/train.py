@@ -5,9 +5,9 @@ import sys
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-import pandas as pd
 from src.data import generate_training_data, load_patient_data, preprocess_features
 from src.models import save_model, train_model
+from src.models.neighbors import build_index
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 logger = logging.getLogger("train")
@@ -19,17 +19,48 @@ def load_csv(path):
     df["num_medications"] = df["medications"].apply(lambda x: len([m for m in str(x).split(",") if m.strip()]))
     features = preprocess_features(df)
     features["readmitted"] = df["readmitted"].astype(int)
+    if "institution" in df.columns:
+        features["institution"] = df["institution"]
     return features
 
 
 def main():
     parser = argparse.ArgumentParser(description="Train the readmission risk model")
-    parser.add_argument("--data", default=None, help="Patient CSV file (omit to use synthetic data)")
+    parser.add_argument("--data", default=None,
+                        help="Patient CSV file, or snapshot store (s3://bucket/prefix or "
+                             "directory); omit for synthetic data")
+    parser.add_argument("--as-of", default=None,
+                        help="Snapshot date (YYYY-MM-DD) to train on; default latest")
     parser.add_argument("--output", default=os.getenv("MODEL_OUTPUT_PATH", "models/readmission_model.pkl"))
     parser.add_argument("--n-synthetic", type=int, default=1000)
+    parser.add_argument("--federated", action="store_true",
+                        help="Train per institution in parallel and merge the forests")
+    parser.add_argument("--strategy", choices=["trees", "weighted"], default="trees",
+                        help="Federated merge strategy")
+    parser.add_argument("--tune", action="store_true",
+                        help="Search hyperparameters with successive halving first")
+    parser.add_argument("--n-candidates", type=int, default=27,
+                        help="Configurations sampled for --tune")
+    parser.add_argument("--latency-weight", type=float, default=0.01,
+                        help="ROC-AUC traded per ms of latency (--tune)")
+    parser.add_argument("--optimize", action="store_true",
+                        help="Prune and quantize the forest after training")
+    parser.add_argument("--tolerance", type=float, default=0.005,
+                        help="Max ROC-AUC loss allowed when pruning trees")
+    parser.add_argument("--evaluate", action="store_true",
+                        help="Cross-validate with bootstrap confidence intervals")
+    parser.add_argument("--folds", type=int, default=5,
+                        help="Cross-validation folds for --evaluate")
+    parser.add_argument("--bootstrap", type=int, default=1000,
+                        help="Bootstrap resamples for --evaluate")
     args = parser.parse_args()
 
-    if args.data:
+    from src.data.loader import is_snapshot_store, read_training_frame
+    if args.data and is_snapshot_store(args.data):
+        logger.info("Streaming snapshot shards from %s", args.data)
+        cache_dir = os.getenv("SNAPSHOT_CACHE_DIR", "data/cache/snapshots")
+        df = read_training_frame(args.data, day=args.as_of, cache_dir=cache_dir)
+    elif args.data:
         logger.info("Loading data from %s", args.data)
         df = load_csv(args.data)
     else:
@@ -38,30 +69,81 @@ def main():
 
     logger.info("readmitted=1: %d  readmitted=0: %d", df["readmitted"].sum(), (df["readmitted"] == 0).sum())
 
-    model, scaler, metrics = train_model(df)
+    params, search = {}, None
+    if args.tune:
+        from src.models.tuning import successive_halving
+        params, search = successive_halving(df, n_candidates=args.n_candidates,
+                                            latency_weight=args.latency_weight)
+        logger.info("Pareto front (ROC-AUC vs single-row latency):")
+        for t in sorted(search["pareto_front"], key=lambda t: t["latency_ms"]):
+            logger.info("  auc=%.4f  latency=%.3fms  %s",
+                        t["roc_auc"], t["latency_ms"], t["params"])
+        logger.info("Best configuration: %s", params)
+
+    if args.federated:
+        from src.pipelines.federated import run_federated_training
+        model, scaler, metrics = run_federated_training(df, strategy=args.strategy, params=params)
+        for site, m in metrics["sites"].items():
+            logger.info("  %-6s n=%-7d local ROC-AUC=%.4f global ROC-AUC=%.4f",
+                        site, m["n_samples"], m["local_roc_auc"], m["global_roc_auc"])
+    else:
+        model, scaler, metrics = train_model(df, **params)
     logger.info("ROC-AUC: %.4f", metrics["roc_auc"])
     for feat, imp in sorted(metrics["feature_importance"].items(), key=lambda x: -x[1]):
         logger.info("  %-25s %.4f", feat, imp)
 
+    if args.evaluate:
+        from src.models.evaluation import evaluate_model
+        metrics["evaluation"] = evaluate_model(df, params=params, n_splits=args.folds,
+                                               n_bootstrap=args.bootstrap)
+        ev = metrics["evaluation"]
+        logger.info("%d-fold CV, %d bootstrap resamples (%.0f%% CI):",
+                    args.folds, args.bootstrap, 100 * ev["confidence"])
+        for name, m in ev["overall"].items():
+            logger.info("  %-8s %.4f  [%.4f, %.4f]", name, m["value"], m["ci_low"], m["ci_high"])
+        for group, values in ev["groups"].items():
+            for value, g in values.items():
+                auc = g["roc_auc"]
+                logger.info("  %s=%-6s n=%-7d ROC-AUC=%s [%s, %s]", group, value, g["n"],
+                            auc["value"], auc["ci_low"], auc["ci_high"])
+
+    metadata = None
+    if args.optimize:
+        from src.models.optimize import optimize_model
+        model, report = optimize_model(model, scaler, df, tolerance=args.tolerance)
+        logger.info("Optimized forest (before -> after):")
+        for key in ("n_trees", "n_nodes", "size_bytes", "latency_ms", "roc_auc"):
+            logger.info("  %-12s %s -> %s", key, *report[key])
+        metadata = {"optimization": report}
+
     os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
-    save_model(model, scaler, args.output)
+    index = build_index(df, scaler)
+    logger.info("Similar-patient index: %d patients in %d distinct profiles",
+                index.n_patients, index.n_profiles)
+    save_model(model, scaler, args.output, metadata=metadata, index=index)
     logger.info("Model saved to %s", args.output)
 
     mlflow_uri = os.getenv("MLFLOW_TRACKING_URI")
     if mlflow_uri:
-        try:
-            import mlflow, mlflow.sklearn
-            mlflow.set_tracking_uri(mlflow_uri)
-            mlflow.set_experiment(os.getenv("MLFLOW_EXPERIMENT_NAME", "healthalliance-readmission"))
-            with mlflow.start_run():
-                mlflow.log_params({"model_type": "RandomForestClassifier", "n_estimators": 100, "n_samples": len(df)})
-                mlflow.log_metric("roc_auc", metrics["roc_auc"])
-                for feat, imp in metrics["feature_importance"].items():
-                    mlflow.log_metric(f"importance_{feat}", imp)
-                mlflow.sklearn.log_model(model, artifact_path="model")
-            logger.info("Logged to MLflow at %s", mlflow_uri)
-        except Exception as e:
-            logger.warning("MLflow logging skipped: %s", e)
+        from src.pipelines.tracking import Tracker
+        with Tracker(mlflow_uri, os.getenv("MLFLOW_EXPERIMENT_NAME", "healthalliance-readmission"),
+                     timeout=float(os.getenv("MLFLOW_TRACKING_TIMEOUT", "120")),
+                     spool_dir=os.getenv("MLFLOW_SPOOL_DIR", "logs/mlflow_spool")) as run:
+            run.log_params({"model_type": type(model).__name__, "n_estimators": model.n_estimators,
+                            "n_samples": len(df), "federated": args.federated})
+            run.log_metric("roc_auc", metrics["roc_auc"])
+            run.log_metrics({
+                f"importance_{feat}": imp for feat, imp in metrics["feature_importance"].items()
+            })
+            if args.evaluate:
+                run.log_dict(metrics["evaluation"], "evaluation/cross_validation.json")
+            if search:
+                run.log_params({f"tuned_{k}": v for k, v in params.items()})
+                run.log_dict(search, "tuning/search.json")
+                run.log_dict({"pareto_front": search["pareto_front"]}, "tuning/pareto_front.json")
+            run.log_model_file(args.output)
+        if run.run_id:
+            logger.info("Logged to MLflow at %s (run %s)", mlflow_uri, run.run_id)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,290 @@
+"""Population risk aggregates per institution, age band and risk level.
+
+Every patient the API has seen, ingested or scored under a patient ID, has
+one current observation: features, institution and model probability. These
+are kept in a FeatureStore of their own under ``<directory>/patients``. The
+aggregates are a small fixed-size ``.npy`` array holding (patients,
+probability sum) per (institution, age band, risk level) cell. Like the
+feature store it is opened with mmap, so pre-forked workers share it.
+
+``observe`` applies a batch incrementally: each patient's previous cell is
+decremented and its new cell incremented, so the cost is O(batch) whatever the
+population size. When the model changes, ``rescore`` scores every patient in
+one vectorized ``score_batch`` and rebuilds the array with ``bincount``.
+Queries only read the array, so their cost depends on the number of cells,
+not on the number of patients. Writers serialize on a file lock.
+
+Institution IDs come from clients, so only the partner institutions of
+``src.data.INSTITUTIONS`` get cells of their own; patients of any other
+institution are counted under ``unknown``. Their stored keys keep the ID they
+were observed with.
+
+Single predictions go through ``submit``, which only appends to a buffer.
+A background thread applies the buffer as one ``observe`` batch every
+``flush_interval`` seconds, so /predict never waits on the file lock.
+"""
+import atexit
+import fcntl
+import logging
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from src.data import INSTITUTIONS
+from src.data.feature_store import FeatureStore
+from src.models import FEATURES, RISK_LEVELS, rule_scores, score_batch
+
+AGE_BANDS = [(18, "0-17"), (40, "18-39"), (65, "40-64"), (80, "65-79"), (float("inf"), "80+")]
+MAX_INSTITUTIONS = 256
+UNKNOWN = "unknown"  # patients without an institution_id or outside INSTITUTIONS
+COLUMNS = FEATURES + ["institution", "probability"]
+
+logger = logging.getLogger(__name__)
+
+_M = len(FEATURES)
+_AGE = FEATURES.index("age")
+
+
+def age_bands(age):
+    """Index into AGE_BANDS of each age."""
+    return np.searchsorted([upper for upper, _ in AGE_BANDS], age, side="right")
+
+
+def _bucket(institution):
+    """Aggregate cell of a (lower-cased) institution ID."""
+    return institution if institution in INSTITUTIONS else UNKNOWN
+
+
+def _summary(cells):
+    """Counts and mean probability of ``cells``, a ``(..., risk level, 2)`` slice of the
+    aggregates."""
+    cells = cells.reshape(-1, len(RISK_LEVELS), 2).sum(axis=0)
+    patients = int(round(cells[:, 0].sum()))
+    return {
+        "patients": patients,
+        "risk_levels": {level: int(round(n)) for (_, level), n in zip(RISK_LEVELS, cells[:, 0])},
+        "mean_probability": round(float(cells[:, 1].sum()) / patients, 4) if patients else None,
+    }
+
+
+class PopulationAnalytics:
+    def __init__(self, directory, flush_interval=1.0, capacity=65536):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.capacity = capacity
+        self.patients = FeatureStore(os.path.join(directory, "patients"), columns=COLUMNS)
+        self._aggregates_path = os.path.join(directory, "aggregates.npy")
+        self._institutions_path = os.path.join(directory, "institutions.tsv")
+        self._version_path = os.path.join(directory, "model_version")
+        self._lock_path = os.path.join(directory, "analytics.lock")
+        self._lock = threading.RLock()
+        self._institutions = []
+        self._ids = {}
+        self._offset = 0
+        self._buffer = deque()
+        self._wake = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        with self._file_lock():
+            if not os.path.exists(self._aggregates_path):
+                open_memmap(self._aggregates_path, mode="w+", dtype=np.float64,
+                            shape=(MAX_INSTITUTIONS, len(AGE_BANDS), len(RISK_LEVELS), 2)).flush()
+            open(self._institutions_path, "ab").close()
+        self._aggregates = np.load(self._aggregates_path, mmap_mode="r+")
+        self._cells = self._aggregates.reshape(-1, 2)
+        self._refresh()
+
+    def __len__(self):
+        return len(self.patients)
+
+    @contextmanager
+    def _file_lock(self):
+        with open(self._lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _refresh(self):
+        """Pick up institutions registered by other processes; line number = index."""
+        with self._lock:
+            if os.path.getsize(self._institutions_path) == self._offset:
+                return
+            with open(self._institutions_path, "rb") as f:
+                f.seek(self._offset)
+                data = f.read()
+            data = data[:data.rfind(b"\n") + 1]
+            for name in data.decode().splitlines():
+                self._ids[name] = len(self._institutions)
+                self._institutions.append(name)
+            self._offset += len(data)
+
+    def _institution_ids(self, names):
+        """Index of each institution name, registering new ones; call with the file lock held."""
+        new = sorted({n for n in names if n not in self._ids})
+        if new:
+            if len(self._institutions) + len(new) > MAX_INSTITUTIONS:
+                raise ValueError(f"More than {MAX_INSTITUTIONS} institutions")
+            with open(self._institutions_path, "ab") as f:
+                f.write("".join(f"{n}\n" for n in new).encode())
+            self._refresh()
+        return np.array([self._ids[n] for n in names], dtype=np.intp)
+
+    @staticmethod
+    def _cell(X, institution):
+        _, levels = rule_scores(X)
+        return (institution * len(AGE_BANDS) + age_bands(X[:, _AGE])) * len(RISK_LEVELS) + levels
+
+    def _add(self, cells, prob, sign=1):
+        self._cells[:, 0] += sign * np.bincount(cells, minlength=len(self._cells))
+        self._cells[:, 1] += sign * np.bincount(cells, weights=prob, minlength=len(self._cells))
+
+    def observe(self, keys, X, prob):
+        """Record the latest features and probability of ``(institution_id, patient_id)`` keys."""
+        X = np.asarray(X, dtype=float).reshape(len(keys), _M)
+        prob = np.asarray(prob, dtype=float).reshape(len(keys))
+        # A NaN age has no age band and would be counted in the next institution's cells
+        finite = np.isfinite(X).all(axis=1) & np.isfinite(prob)
+        if not finite.all():
+            logger.warning("Skipping %d observations with non-finite features or probability",
+                           int((~finite).sum()))
+        # Last observation wins within a batch, as in FeatureStore.upsert
+        latest, invalid = {}, 0
+        for i, k in enumerate(keys):
+            if not finite[i]:
+                continue
+            try:
+                latest[FeatureStore._key(*k)] = i
+            except ValueError:
+                invalid += 1
+        if invalid:
+            logger.warning("Skipping %d observations with tabs or newlines in their key", invalid)
+        if not latest:
+            return
+        keys, rows = list(latest), list(latest.values())
+        X, prob = X[rows], prob[rows]
+        with self._lock, self._file_lock():
+            self._refresh()
+            institution = self._institution_ids([_bucket(inst) for inst, _ in keys])
+            old, found = self.patients.lookup(keys)
+            old = old[found].astype(float)
+            old = old[np.isfinite(old[:, :_M]).all(axis=1)]
+            self._add(self._cell(old[:, :_M], old[:, _M].astype(np.intp)), old[:, _M + 1], sign=-1)
+            self._add(self._cell(X, institution), prob)
+            self._aggregates.flush()
+            self.patients.upsert(keys, np.column_stack([X, institution, prob]))
+
+    def submit(self, key, x, prob):
+        """Queue one observation for the background thread; dropped (False) when the buffer
+        is full."""
+        if self._thread is None:
+            self.start()
+        if len(self._buffer) >= self.capacity:
+            return False
+        self._buffer.append((key, x, prob))
+        return True
+
+    def flush(self):
+        """Apply everything ``submit`` has buffered."""
+        batch = []
+        while self._buffer:
+            batch.append(self._buffer.popleft())
+        if batch:
+            keys, X, prob = zip(*batch)
+            self.observe(keys, X, prob)
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="population-analytics",
+                                                daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def stop(self):
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            self._wake.set()
+            thread.join()
+        self.flush()
+
+    def _run(self):
+        while self._thread is not None:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to update population analytics")
+
+    @property
+    def model_version(self):
+        if not os.path.exists(self._version_path):
+            return None
+        with open(self._version_path) as f:
+            return f.read().strip() or None
+
+    def rescore(self, model, scaler, version, seed=None):
+        """Rescore every patient with ``model`` and rebuild the aggregates, unless ``version``
+        is current.
+
+        ``seed`` is an optional FeatureStore whose patients are imported first when
+        the population is empty. Returns whether anything was rescored.
+        """
+        with self._lock, self._file_lock():
+            if version is not None and version == self.model_version:
+                return False
+            self._refresh()
+            if seed is not None and not len(self.patients):
+                keys, X = seed.items()
+                if keys:
+                    institution = self._institution_ids([_bucket(inst) for inst, _ in keys])
+                    seeded = np.column_stack([X, institution, np.zeros(len(keys))])
+                    self.patients.upsert(keys, seeded)
+            _, rows = self.patients.items()
+            rows = rows.astype(float)
+            # Seeded patients with a missing feature stay stored but are neither scored nor counted
+            finite = np.isfinite(rows[:, :_M]).all(axis=1)
+            if len(rows):
+                rows[finite, _M + 1] = score_batch(model, scaler, rows[finite, :_M])[1]
+                self.patients.overwrite(rows)
+            rows = rows[finite]
+            self._cells[:] = 0
+            self._add(self._cell(rows[:, :_M], rows[:, _M].astype(np.intp)), rows[:, _M + 1])
+            self._aggregates.flush()
+            with open(self._version_path, "w") as f:
+                f.write(f"{version or ''}\n")
+        return True
+
+    def summary(self):
+        """Population totals and per-institution risk distribution."""
+        with self._lock:
+            self._refresh()
+            institutions = list(self._institutions)
+            aggregates = np.array(self._aggregates[:len(institutions)])
+        return {**_summary(aggregates), "model_version": self.model_version,
+                "institutions": {name: _summary(aggregates[i])
+                                 for i, name in enumerate(institutions)}}
+
+    def institution(self, name):
+        """Risk distribution of one institution by age band, or None when it has no patients."""
+        with self._lock:
+            self._refresh()
+            i = self._ids.get(str(name or UNKNOWN).lower())
+            if i is None:
+                return None
+            name = self._institutions[i]
+            aggregates = np.array(self._aggregates[i])
+        summary = _summary(aggregates)
+        if not summary["patients"]:
+            return None
+        return {"institution_id": name, **summary,
+                "age_bands": {band: _summary(aggregates[b])
+                              for b, (_, band) in enumerate(AGE_BANDS)}}
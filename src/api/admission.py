@@ -0,0 +1,266 @@
+"""Per-tenant admission control for prediction and ingest traffic.
+
+Every request is admitted in three steps, all on the event loop (no locks):
+
+1. Token bucket per (tenant, priority): a tenant over its rate gets 429 with
+   Retry-After instead of queuing behind everyone else.
+2. A bounded number of requests run at once per worker. Beyond that, requests
+   wait in one queue per priority class; interactive requests are always
+   dispatched before bulk ones, and within a class tenants are served by
+   start-time fair queuing, so a tenant with weight 2 gets twice the share of
+   one with weight 1 no matter how many requests either has queued.
+3. Load shedding: when the expected queue wait (queue position x recent
+   service time) exceeds the class latency target, or a queued request reaches
+   it, the request gets 503 with Retry-After.
+
+A request costs one token per ``rows_per_token`` rows, at least one. Admission
+takes one token because the body is not decoded yet; once the handler knows
+the row count, ``charge`` takes the rest, letting the bucket go into debt, and
+moves the tenant's fair-queuing tag on by the same amount. A 100k-row batch
+therefore delays that tenant's next requests, not everyone else's.
+
+The tenant is the audit principal (API key fingerprint or JWT user).
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+
+from fastapi import Depends, HTTPException, Request
+
+from src.monitoring import (
+    ADMISSION_DECISIONS, ADMISSION_IN_FLIGHT, ADMISSION_QUEUE_DEPTH, ADMISSION_WAIT,
+    RATE_LIMIT_TOKENS,
+)
+from src.monitoring.timing import span
+
+PRIORITIES = ("interactive", "bulk")
+
+
+def _weights(spec):
+    """``"key:ab12=2,user:admin=0.5"`` -> ``{"key:ab12": 2.0, "user:admin": 0.5}``."""
+    weights = {}
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        tenant, _, weight = item.rpartition("=")
+        weights[tenant] = float(weight)
+    return weights
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now=None):
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, cost=1.0, now=None):
+        """Take ``cost`` tokens; returns 0 on success, else the seconds until they
+        would be available."""
+        self._refill(now)
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate if self.rate > 0 else math.inf
+
+    def owe(self, cost, now=None):
+        """Take ``cost`` tokens unconditionally; a negative balance is refilled first."""
+        self._refill(now)
+        self.tokens -= cost
+
+
+class Rejected(Exception):
+    def __init__(self, status, reason, retry_after):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, limits, concurrency=4, targets=None, weights=None, max_queue=1000,
+                 enabled=True, rows_per_token=1000):
+        self.limits = limits  # priority -> (rate per second, burst)
+        self.concurrency = concurrency
+        self.targets = targets or {"interactive": 0.25, "bulk": 5.0}  # max queue wait in seconds
+        self.weights = weights or {}
+        self.max_queue = max_queue
+        self.enabled = enabled
+        self.rows_per_token = rows_per_token
+        self.in_flight = 0
+        self._buckets = {}
+        self._queues = {p: [] for p in PRIORITIES}
+        self._waiting = {p: 0 for p in PRIORITIES}
+        self._virtual = {p: 0.0 for p in PRIORITIES}
+        self._last_start = {}
+        self._service = {p: 0.0 for p in PRIORITIES}  # EWMA of seconds in flight
+        self._seq = itertools.count()
+
+    @classmethod
+    def from_env(cls):
+        env = os.getenv
+        return cls(
+            limits={
+                "interactive": (
+                    float(env("ADMISSION_INTERACTIVE_RATE", "100")),
+                    float(env("ADMISSION_INTERACTIVE_BURST", "200")),
+                ),
+                "bulk": (
+                    float(env("ADMISSION_BULK_RATE", "20")),
+                    float(env("ADMISSION_BULK_BURST", "40")),
+                ),
+            },
+            concurrency=int(env("ADMISSION_CONCURRENCY", "4")),
+            targets={"interactive": float(env("ADMISSION_INTERACTIVE_TARGET_MS", "250")) / 1000,
+                     "bulk": float(env("ADMISSION_BULK_TARGET_MS", "5000")) / 1000},
+            weights=_weights(env("ADMISSION_WEIGHTS", "")),
+            max_queue=int(env("ADMISSION_MAX_QUEUE", "1000")),
+            enabled=env("ADMISSION_ENABLED", "1").lower() not in ("0", "false", "no"),
+            rows_per_token=int(env("ADMISSION_ROWS_PER_TOKEN", "1000")),
+        )
+
+    def _bucket(self, tenant, priority):
+        bucket = self._buckets.get((tenant, priority))
+        if bucket is None:
+            bucket = self._buckets[(tenant, priority)] = TokenBucket(*self.limits[priority])
+        return bucket
+
+    def _expected_wait(self, priority):
+        ahead = self._waiting["interactive"] + (self._waiting["bulk"] if priority == "bulk" else 0)
+        return (ahead + 1) * self._service[priority] / self.concurrency
+
+    def _reject(self, tenant, priority, outcome, status, reason, retry_after):
+        ADMISSION_DECISIONS.labels(tenant=tenant, priority=priority, outcome=outcome).inc()
+        raise Rejected(status, reason, max(1, math.ceil(retry_after)))
+
+    async def acquire(self, tenant, priority, cost=1.0):
+        """Wait for a slot; raises ``Rejected`` (429/503). Pair every success with ``release``."""
+        if not self.enabled:
+            self.in_flight += 1
+            return
+        bucket = self._bucket(tenant, priority)
+        wait = bucket.take(cost)
+        RATE_LIMIT_TOKENS.labels(tenant=tenant, priority=priority).set(bucket.tokens)
+        if wait:
+            self._reject(tenant, priority, "rate_limited", 429, "Rate limit exceeded", wait)
+
+        if self.in_flight < self.concurrency and not any(self._waiting.values()):
+            self.in_flight += 1
+            ADMISSION_IN_FLIGHT.inc()
+            ADMISSION_DECISIONS.labels(tenant=tenant, priority=priority, outcome="admitted").inc()
+            ADMISSION_WAIT.labels(priority=priority).observe(0.0)
+            return
+
+        expected = self._expected_wait(priority)
+        if expected > self.targets[priority] or self._waiting[priority] >= self.max_queue:
+            self._reject(tenant, priority, "shed", 503, "Server overloaded", expected)
+
+        # Start-time fair queuing: a tenant's next start tag follows its previous one
+        key = (tenant, priority)
+        start = max(self._virtual[priority], self._last_start.get(key, 0.0))
+        self._last_start[key] = start + cost / self.weights.get(tenant, 1.0)
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queues[priority], (start, next(self._seq), future))
+        self._waiting[priority] += 1
+        ADMISSION_QUEUE_DEPTH.labels(priority=priority).inc()
+        self._dispatch()  # a slot may be free while earlier waiters are still resuming
+
+        t = time.perf_counter()
+        try:
+            await asyncio.wait_for(future, timeout=self.targets[priority])
+        except asyncio.TimeoutError:
+            # The slot may have been granted just as the timeout fired
+            if not (future.done() and not future.cancelled()):
+                self._reject(tenant, priority, "timeout", 503, "Queue wait exceeded latency target",
+                             self._expected_wait(priority))
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._free()
+            raise
+        finally:
+            self._waiting[priority] -= 1
+            ADMISSION_QUEUE_DEPTH.labels(priority=priority).dec()
+        # _dispatch already counted the slot
+        ADMISSION_DECISIONS.labels(tenant=tenant, priority=priority, outcome="admitted").inc()
+        ADMISSION_WAIT.labels(priority=priority).observe(time.perf_counter() - t)
+
+    def charge(self, tenant, priority, rows):
+        """Charge an admitted request for its ``rows``, beyond the token ``acquire`` took."""
+        extra = max(1.0, rows / self.rows_per_token) - 1
+        if not self.enabled or extra <= 0:
+            return
+        bucket = self._bucket(tenant, priority)
+        bucket.owe(extra)
+        RATE_LIMIT_TOKENS.labels(tenant=tenant, priority=priority).set(bucket.tokens)
+        key = (tenant, priority)
+        start = max(self._virtual[priority], self._last_start.get(key, 0.0))
+        self._last_start[key] = start + extra / self.weights.get(tenant, 1.0)
+
+    def release(self, priority, duration):
+        if not self.enabled:
+            self.in_flight -= 1
+            return
+        previous = self._service[priority]
+        self._service[priority] = duration if previous == 0 else 0.8 * previous + 0.2 * duration
+        self._free()
+
+    def _free(self):
+        self.in_flight -= 1
+        ADMISSION_IN_FLIGHT.dec()
+        self._dispatch()
+
+    def _dispatch(self):
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            while queue and self.in_flight < self.concurrency:
+                start, _, future = heapq.heappop(queue)
+                if future.done():  # timed out or client went away
+                    continue
+                self._virtual[priority] = start
+                self.in_flight += 1
+                ADMISSION_IN_FLIGHT.inc()
+                future.set_result(None)
+
+
+def admission_dependency(controller, priority, auth_dependency, tenant_of, classify=None):
+    """FastAPI dependency admitting a request before the handler runs; yields the auth result.
+
+    ``classify(request)``, when given, is awaited for the class instead of
+    ``priority``. Clients may downgrade an interactive endpoint with
+    ``X-Priority: bulk``; bulk endpoints cannot be upgraded. Handlers report
+    the size of the request with ``charge``.
+    """
+    async def admit(request: Request, auth=Depends(auth_dependency)):
+        cls = priority if classify is None else await classify(request)
+        if request.headers.get("x-priority", "").lower() == "bulk":
+            cls = "bulk"
+        tenant = tenant_of(auth)
+        try:
+            with span("admission"):
+                await controller.acquire(tenant, cls)
+        except Rejected as e:
+            raise HTTPException(e.status, e.reason, headers={"Retry-After": str(e.retry_after)})
+        request.state.admission = (controller, tenant, cls)
+        t = time.perf_counter()
+        try:
+            yield auth
+        finally:
+            controller.release(cls, time.perf_counter() - t)
+
+    return admit
+
+
+def charge(request, rows):
+    """Charge the request admitted by ``admission_dependency`` for ``rows`` rows."""
+    admitted = getattr(request.state, "admission", None)
+    if admitted is not None:
+        controller, tenant, priority = admitted
+        controller.charge(tenant, priority, rows)
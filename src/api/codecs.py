@@ -0,0 +1,243 @@
+"""Columnar wire formats for bulk prediction.
+
+A batch is a set of equal-length columns: ``patient_id``, optional
+``institution_id`` and the model features. ``conditions``/``medications``
+lists or ``num_conditions``/``num_medications`` counts are both accepted,
+and ``gender`` strings or ``gender_encoded`` values. IDs must be strings and
+features finite values within float32 range. Three encodings carry it:
+
+- Apache Arrow IPC stream (``application/vnd.apache.arrow.stream``): columns
+  go straight from Arrow buffers into the feature matrix.
+- msgpack (``application/msgpack``): a map of column name to either a list or
+  a typed array ``{"dtype": "<f8", "data": <bin>}`` read with ``np.frombuffer``.
+- JSON (``application/json``): a map of column name to list, parsed with orjson.
+
+Responses use the same layout with ``patient_id``, ``readmission_risk``,
+``risk_level`` and ``confidence`` columns, plus any extra float columns the
+caller passes (the explanation columns of ``?explain=true``). pyarrow, msgpack and orjson are
+optional; a missing one only disables its format (orjson falls back to json).
+"""
+import json
+
+import numpy as np
+
+from src.models import FEATURES, RISK_LEVELS
+
+ARROW = "application/vnd.apache.arrow.stream"
+MSGPACK = "application/msgpack"
+JSON = "application/json"
+MEDIA_TYPES = {ARROW: ARROW, MSGPACK: MSGPACK, "application/x-msgpack": MSGPACK, JSON: JSON}
+LEVEL_NAMES = [level for _, level in RISK_LEVELS]
+FLOAT32_MAX = float(np.finfo(np.float32).max)  # the forest compares features as float32
+
+try:
+    import orjson
+
+    HAVE_ORJSON = True
+except ImportError:  # pragma: no cover - exercised only without orjson installed
+    HAVE_ORJSON = False
+
+
+class CodecError(ValueError):
+    """Malformed batch; the API answers 422."""
+
+
+def dumps_json(content):
+    if HAVE_ORJSON:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(content, default=lambda o: o.tolist(), separators=(",", ":")).encode()
+
+
+def loads_json(body):
+    return orjson.loads(body) if HAVE_ORJSON else json.loads(body)
+
+
+def negotiate(header, default=JSON):
+    """Media type for a Content-Type/Accept header value, or None when unsupported."""
+    if not header or header.startswith("*/*"):
+        return default
+    for part in header.split(","):
+        media = part.split(";")[0].strip().lower()
+        if media in MEDIA_TYPES:
+            return MEDIA_TYPES[media]
+        if media == "*/*":
+            return default
+    return None
+
+
+def _column(value, name):
+    if isinstance(value, dict):
+        try:
+            return np.frombuffer(value["data"], dtype=np.dtype(value["dtype"]))
+        except (KeyError, TypeError, ValueError) as e:
+            raise CodecError(f"Column {name}: typed arrays need 'dtype' and binary 'data' ({e})")
+    return value
+
+
+def _matrix(get, n):
+    """Feature matrix from a column accessor; ``get(name)`` returns an array-like or None."""
+    X = np.empty((n, len(FEATURES)))
+    for j, col in enumerate(FEATURES):
+        values = get(col)
+        if values is None and col in ("num_conditions", "num_medications"):
+            values = get(col[len("num_"):], lengths=True)
+        if values is None and col == "gender_encoded":
+            values = get("gender", male=True)
+        if values is None:
+            raise CodecError(f"Missing column {col}")
+        values = np.asarray(values)
+        if len(values) != n:
+            raise CodecError(f"Column {col} has {len(values)} rows, expected {n}")
+        X[:, j] = values
+    # The forest scores NaN like any other value, so nulls are rejected as /predict rejects them
+    bad = np.argwhere(~np.isfinite(X))
+    if len(bad):
+        row, j = bad[0]
+        raise CodecError(f"Column {FEATURES[j]} has a null or non-finite value at row {row}")
+    bad = np.argwhere(np.abs(X) > FLOAT32_MAX)
+    if len(bad):
+        row, j = bad[0]
+        raise CodecError(f"Column {FEATURES[j]} has an out-of-range value at row {row}")
+    return X
+
+
+def _strings(values, name, n=None, nullable=False):
+    """Checks an id column: a list of strings (or nulls when ``nullable``), ``n`` long if given."""
+    if not isinstance(values, list):
+        raise CodecError(f"Column {name} must be a list of strings")
+    if n is not None and len(values) != n:
+        raise CodecError(f"Column {name} has {len(values)} rows, expected {n}")
+    for row, v in enumerate(values):
+        if not isinstance(v, str) and not (nullable and v is None):
+            raise CodecError(f"Column {name} has a non-string value at row {row}")
+    return values
+
+
+def _from_columns(columns):
+    if not isinstance(columns, dict) or "patient_id" not in columns:
+        raise CodecError("Batch must be a map of columns including patient_id")
+    patient_ids = _strings(columns["patient_id"], "patient_id")
+    n = len(patient_ids)
+
+    def get(name, lengths=False, male=False):
+        if name not in columns:
+            return None
+        values = _column(columns[name], name)
+        if lengths:
+            return [len(v or ()) for v in values]
+        if male:
+            return np.char.lower(np.asarray(values, dtype=str)) == "male"
+        return values
+
+    try:
+        X = _matrix(get, n)
+    except (TypeError, ValueError) as e:
+        if isinstance(e, CodecError):
+            raise
+        raise CodecError(f"Invalid column values: {e}")
+    institutions = columns.get("institution_id")
+    if institutions is not None:
+        _strings(institutions, "institution_id", n, nullable=True)
+    return {"patient_id": patient_ids, "institution_id": institutions, "X": X}
+
+
+def _decode_arrow(body):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    try:
+        table = pa.ipc.open_stream(body).read_all()
+    except pa.ArrowInvalid as e:
+        raise CodecError(f"Invalid Arrow IPC stream: {e}")
+    if "patient_id" not in table.column_names:
+        raise CodecError("Missing column patient_id")
+    for name in ("patient_id", "institution_id"):
+        if name in table.column_names and not (pa.types.is_string(table[name].type)
+                                               or pa.types.is_large_string(table[name].type)):
+            raise CodecError(f"Column {name} must be a string column")
+    if table["patient_id"].null_count:
+        raise CodecError("Column patient_id has null values")
+
+    def get(name, lengths=False, male=False):
+        if name not in table.column_names:
+            return None
+        col = table[name]
+        if lengths:
+            col = pc.fill_null(pc.list_value_length(col), 0)
+        elif male:
+            col = pc.fill_null(pc.equal(pc.utf8_lower(col), "male"), False)
+        return col.to_numpy()
+
+    try:
+        X = _matrix(get, table.num_rows)
+    except (pa.ArrowException, TypeError, ValueError) as e:
+        if isinstance(e, CodecError):
+            raise
+        raise CodecError(f"Invalid column values: {e}")
+    institution = table["institution_id"] if "institution_id" in table.column_names else None
+    return {"patient_id": table["patient_id"], "institution_id": institution, "X": X}
+
+
+def _decode_msgpack(body):
+    import msgpack
+
+    try:
+        columns = msgpack.unpackb(body, raw=False)
+    except (msgpack.UnpackException, ValueError) as e:
+        raise CodecError(f"Invalid msgpack body: {e}")
+    return _from_columns(columns)
+
+
+def _decode_json(body):
+    try:
+        columns = loads_json(body)
+    except ValueError as e:
+        raise CodecError(f"Invalid JSON body: {e}")
+    return _from_columns(columns)
+
+
+def decode_batch(body, media_type):
+    """Returns ``{"patient_id", "institution_id", "X"}``; ids are the format's own sequence type."""
+    return {ARROW: _decode_arrow, MSGPACK: _decode_msgpack, JSON: _decode_json}[media_type](body)
+
+
+def to_list(values):
+    if values is None or isinstance(values, list):
+        return values
+    return values.to_pylist() if hasattr(values, "to_pylist") else list(values)
+
+
+def encode_batch(media_type, patient_ids, risk, level_codes, confidence, extra=None):
+    extra = extra or {}
+    if media_type == ARROW:
+        import pyarrow as pa
+
+        if isinstance(patient_ids, pa.ChunkedArray):
+            ids = patient_ids.combine_chunks()
+        else:
+            ids = pa.array(patient_ids, pa.string())
+        batch = pa.RecordBatch.from_arrays([
+            ids,
+            pa.array(risk, pa.float64()),
+            pa.DictionaryArray.from_arrays(pa.array(level_codes, pa.int8()), pa.array(LEVEL_NAMES)),
+            pa.array(confidence, pa.float64()),
+            *(pa.array(v, pa.float64()) for v in extra.values()),
+        ], names=["patient_id", "readmission_risk", "risk_level", "confidence", *extra])
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, batch.schema) as writer:
+            writer.write_batch(batch)
+        return sink.getvalue().to_pybytes()
+
+    levels = np.array(LEVEL_NAMES, dtype=object)[level_codes].tolist()
+    if media_type == MSGPACK:
+        import msgpack
+
+        def typed(a):
+            a = np.ascontiguousarray(a, dtype="<f8")
+            return {"dtype": a.dtype.str, "data": a.tobytes()}
+
+        return msgpack.packb({"patient_id": to_list(patient_ids), "readmission_risk": typed(risk),
+                              "risk_level": levels, "confidence": typed(confidence),
+                              **{k: typed(v) for k, v in extra.items()}})
+    return dumps_json({"patient_id": to_list(patient_ids), "readmission_risk": risk,
+                       "risk_level": levels, "confidence": confidence, **extra})
@@ -0,0 +1,450 @@
+"""Durable job queue behind ``POST /api/v1/data/ingest`` (202 Accepted).
+
+Accepting a job appends it to a segment log on local disk and returns as soon
+as the entry is fsynced. A pool of worker threads stores the records later.
+
+Each process appends to its own directory ``<directory>/segments/<owner>/`` and
+holds an exclusive flock on it for its lifetime. An entry is
+``length | crc32 | JSON``. A torn or corrupt tail (a crash mid-write, never
+acknowledged to the client) ends a segment on replay. Appenders take turns at
+a single fsync: whoever gets there first syncs everything written so far, so
+concurrent uploads share one fsync (group commit) instead of paying one each.
+Segments roll at ``segment_bytes``.
+
+Delivery is at-least-once. An entry is acknowledged, by appending its offset
+to the segment's ``.acks`` file, only after all of its records are stored. A
+segment is deleted once every entry in it is acknowledged. When a process
+dies the kernel releases its flock. The next process that starts (serve.py
+respawns workers) or polls then adopts the directory and replays the entries
+that were never acknowledged. Ingest is an upsert, so replaying a job that was
+processed but not yet acknowledged is harmless.
+
+Job status lives in ``<directory>/jobs/<job_id>.json`` and is replaced
+atomically on every transition, so any worker process can answer a status
+request. The status of a finished job is deleted ``status_ttl`` seconds after
+it finished; the status of an unfinished one is kept.
+
+Only I/O errors (OSError, which includes a store lock that cannot be taken)
+are retried: the job is requeued after an exponential backoff, up to
+``max_attempts``. Any other error is about the data and fails the same way on
+every attempt. The batch is then stored record by record, so each failing
+record is counted as rejected and the rest are still stored. An unexpected
+error outside the records (a bug, not bad data) marks the job failed at once.
+"""
+import fcntl
+import json
+import logging
+import os
+import queue
+import shutil
+import struct
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timezone
+
+from src.monitoring import INGEST_JOBS, INGEST_QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct("<II")  # payload length, crc32
+MAX_ERRORS = 1000  # per job; ``rejected`` still counts every rejected record
+TERMINAL = ("done", "failed")
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class SegmentLog:
+    """The segment files of one owner directory; raises BlockingIOError while another owner
+    holds it."""
+
+    def __init__(self, directory, segment_bytes=64 << 20, writable=True):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.writable = writable
+        if writable:
+            os.makedirs(directory, exist_ok=True)
+        self._owner = open(os.path.join(directory, "owner.lock"), "a")
+        try:
+            fcntl.flock(self._owner, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._owner.close()
+            raise
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._pending = {}  # segment -> entries not yet acknowledged
+        self._fd = None
+        self._segment = None
+        self._size = 0
+        self._retired = []  # fds of rolled segments, fsynced and closed by the next sync
+        self._written = 0
+        self._synced = 0
+        self.stats = {"appends": 0, "fsyncs": 0}
+
+    def _path(self, segment, suffix=".log"):
+        return os.path.join(self.directory, f"{segment:08d}{suffix}")
+
+    def segments(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(int(n[:-len(".log")]) for n in names if n.endswith(".log"))
+
+    def _offsets(self, segment):
+        """Offsets of the complete entries of ``segment``, stopping at a torn or corrupt tail."""
+        with open(self._path(segment), "rb") as f:
+            data = f.read()
+        offset = 0
+        while offset + _HEADER.size <= len(data):
+            n, crc = _HEADER.unpack_from(data, offset)
+            payload = data[offset + _HEADER.size:offset + _HEADER.size + n]
+            if len(payload) < n or zlib.crc32(payload) != crc:
+                logger.warning("Ignoring %d bytes of torn ingest log at %s:%d",
+                               len(data) - offset, self._path(segment), offset)
+                break
+            yield offset
+            offset += _HEADER.size + n
+
+    def replay(self):
+        """``(segment, offset)`` of every unacknowledged entry; fully acknowledged segments
+        are deleted."""
+        pending = []
+        for segment in self.segments():
+            acks = self._path(segment, ".acks")
+            acked = set()
+            if os.path.exists(acks):
+                with open(acks) as f:
+                    acked = {int(line) for line in f if line.strip()}
+            todo = [(segment, offset) for offset in self._offsets(segment) if offset not in acked]
+            if todo:
+                self._pending[segment] = len(todo)
+                pending += todo
+            else:
+                self._delete(segment)
+        return pending
+
+    def _delete(self, segment):
+        for suffix in (".log", ".acks"):
+            try:
+                os.remove(self._path(segment, suffix))
+            except FileNotFoundError:
+                pass
+
+    def _roll(self):
+        if self._fd is not None:
+            self._retired.append(self._fd)
+            if not self._pending.get(self._segment):
+                self._delete(self._segment)
+        self._segment = max(self.segments() + [self._segment or 0]) + 1
+        self._fd = os.open(self._path(self._segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._size = 0
+        _fsync_dir(self.directory)
+
+    def append(self, payload):
+        """Write one entry and return ``(segment, offset)`` once it is on disk."""
+        if not self.writable:
+            raise RuntimeError(f"{self.directory} is being recovered, not appended to")
+        entry = _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+        with self._lock:
+            if self._fd is None or self._size >= self.segment_bytes:
+                self._roll()
+            segment, offset = self._segment, self._size
+            view = memoryview(entry)
+            while view:
+                view = view[os.write(self._fd, view):]
+            self._size += len(entry)
+            self._pending[segment] = self._pending.get(segment, 0) + 1
+            self._written += 1
+            self.stats["appends"] += 1
+            ticket = self._written
+        self._sync(ticket)
+        return segment, offset
+
+    def _sync(self, ticket):
+        with self._sync_lock:
+            if self._synced >= ticket:
+                return  # another appender's fsync covered this entry
+            with self._lock:
+                target, fd, retired, self._retired = self._written, self._fd, self._retired, []
+            for old in retired:
+                os.fsync(old)
+                os.close(old)
+            os.fsync(fd)
+            self._synced = target
+            self.stats["fsyncs"] += 1
+
+    def read(self, segment, offset):
+        with open(self._path(segment), "rb") as f:
+            f.seek(offset)
+            n, _ = _HEADER.unpack(f.read(_HEADER.size))
+            return f.read(n)
+
+    def ack(self, segment, offset):
+        """Mark an entry processed; returns True when nothing is left to process in this log."""
+        with self._lock:
+            with open(self._path(segment, ".acks"), "a") as f:
+                f.write(f"{offset}\n")
+            self._pending[segment] -= 1
+            if not self._pending[segment] and segment != self._segment:
+                del self._pending[segment]
+                self._delete(segment)
+            return not any(self._pending.values())
+
+    def close(self, remove=False):
+        with self._lock:
+            fds = self._retired + ([self._fd] if self._fd is not None else [])
+            self._fd, self._retired = None, []
+            for fd in fds:
+                os.fsync(fd)
+                os.close(fd)
+            if remove:
+                shutil.rmtree(self.directory, ignore_errors=True)
+            self._owner.close()
+
+
+class IngestQueue:
+    """Jobs of FHIR records, stored by ``process(records) -> (accepted, rejected, errors)``
+    on worker threads."""
+
+    def __init__(self, directory, process, workers=2, batch_size=1000, segment_bytes=64 << 20,
+                 max_attempts=3, adopt_interval=30.0, retry_delay=1.0, status_ttl=86400.0):
+        self.directory = directory
+        self.process = process
+        self.workers = workers
+        self.batch_size = batch_size
+        self.segment_bytes = segment_bytes
+        self.max_attempts = max_attempts
+        self.adopt_interval = adopt_interval
+        self.retry_delay = retry_delay
+        self.status_ttl = status_ttl
+        self._jobs_dir = os.path.join(directory, "jobs")
+        self._segments_dir = os.path.join(directory, "segments")
+        os.makedirs(self._jobs_dir, exist_ok=True)
+        os.makedirs(self._segments_dir, exist_ok=True)
+        self._log = None
+        self._adopted = {}
+        self._tasks = queue.Queue()
+        self._threads = []
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+
+    # -- jobs ----------------------------------------------------------------------------
+
+    def _status_path(self, job_id):
+        if not job_id.isalnum():
+            raise ValueError(f"Invalid job id {job_id!r}")
+        return os.path.join(self._jobs_dir, f"{job_id}.json")
+
+    def _write_status(self, status):
+        path = self._status_path(status["job_id"])
+        tmp = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(status, f)
+        os.replace(tmp, path)
+
+    def status(self, job_id):
+        """The job's status dict, or None for an unknown job."""
+        try:
+            with open(self._status_path(job_id)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def prune_statuses(self, now=None):
+        """Delete the status files of jobs that finished more than ``status_ttl`` seconds ago."""
+        cutoff = (time.time() if now is None else now) - self.status_ttl
+        removed = 0
+        for name in os.listdir(self._jobs_dir):
+            path = os.path.join(self._jobs_dir, name)
+            try:
+                if not name.endswith(".json") or os.path.getmtime(path) > cutoff:
+                    continue
+                with open(path) as f:
+                    finished = json.load(f).get("status") in TERMINAL
+                if finished:
+                    os.remove(path)
+                    removed += 1
+            except (FileNotFoundError, ValueError):
+                continue  # replaced or removed meanwhile
+        return removed
+
+    def wait(self, job_id, timeout=30.0, poll=0.005):
+        """Block until the job is done or failed; returns its status (None if still running
+        at ``timeout``)."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            status = self.status(job_id)
+            if status and status["status"] in TERMINAL:
+                return status
+            time.sleep(poll)
+        return None
+
+    def submit(self, records):
+        """Durably enqueue ``records`` (JSON-serializable dicts); returns the new job's status."""
+        with self._start_lock:
+            if self._log is None:
+                owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+                self._log = SegmentLog(os.path.join(self._segments_dir, owner),
+                                       segment_bytes=self.segment_bytes)
+        status = {"job_id": uuid.uuid4().hex, "status": "queued", "records": len(records),
+                  "processed": 0, "accepted": 0, "rejected": 0, "errors": [], "attempts": 0,
+                  "submitted_at": _now(), "started_at": None, "completed_at": None}
+        payload = json.dumps({"job_id": status["job_id"], "submitted_at": status["submitted_at"],
+                              "records": records}, separators=(",", ":")).encode()
+        segment, offset = self._log.append(payload)
+        self._write_status(status)
+        self.start()
+        self._enqueue(self._log, segment, offset)
+        INGEST_JOBS.labels(outcome="queued").inc()
+        return status
+
+    def _enqueue(self, log, segment, offset):
+        INGEST_QUEUE_DEPTH.inc()
+        self._tasks.put((log, segment, offset))
+
+    # -- workers -------------------------------------------------------------------------
+
+    def start(self):
+        with self._start_lock:
+            if self._threads:
+                return
+            self._stop.clear()
+            self._threads = [threading.Thread(target=self._run, name=f"ingest-{i}", daemon=True)
+                             for i in range(self.workers)]
+            self._threads.append(threading.Thread(target=self._watch_orphans,
+                                                  name="ingest-recovery", daemon=True))
+            for t in self._threads:
+                t.start()
+
+    def stop(self, timeout=30.0):
+        """Stop the workers after the job each is running; queued jobs stay on disk for the
+        next start."""
+        with self._start_lock:
+            threads, self._threads = self._threads, []
+        self._stop.set()
+        for _ in threads:
+            self._tasks.put(None)
+        for t in threads:
+            t.join(timeout)
+        while not self._tasks.empty():
+            if self._tasks.get_nowait() is not None:
+                INGEST_QUEUE_DEPTH.dec()
+
+    def _watch_orphans(self):
+        while not self._stop.is_set():
+            try:
+                self.adopt_orphans()
+            except Exception:
+                logger.exception("Failed to scan for orphaned ingest logs")
+            try:
+                self.prune_statuses()
+            except Exception:
+                logger.exception("Failed to prune finished ingest job statuses")
+            self._stop.wait(self.adopt_interval)
+
+    def adopt_orphans(self):
+        """Take over the logs of processes that died and queue their unacknowledged jobs."""
+        for name in sorted(os.listdir(self._segments_dir)):
+            path = os.path.join(self._segments_dir, name)
+            if path in self._adopted or (self._log is not None and path == self._log.directory):
+                continue
+            try:
+                log = SegmentLog(path, writable=False)
+            except (BlockingIOError, FileNotFoundError):
+                continue  # alive, or removed by whoever adopted it first
+            pending = log.replay()
+            if not pending:
+                log.close(remove=True)
+                continue
+            logger.warning("Recovering %d unacknowledged ingest job(s) from %s", len(pending), name)
+            self._adopted[path] = log
+            INGEST_JOBS.labels(outcome="recovered").inc(len(pending))
+            for segment, offset in pending:
+                self._enqueue(log, segment, offset)
+
+    def _run(self):
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                return
+            INGEST_QUEUE_DEPTH.dec()
+            try:
+                self._process(*task)
+            except Exception:
+                logger.exception("Ingest worker failed on %s:%d; the job stays queued",
+                                 task[0].directory, task[1])
+
+    def _store(self, records):
+        """``process`` one batch; after a non-I/O error, one record at a time, rejecting the
+        ones that raise."""
+        try:
+            return self.process(records)
+        except OSError:
+            raise
+        except Exception as e:
+            if len(records) == 1:
+                logger.warning("Rejecting ingest record %r: %s", records[0].get("id"), e)
+                return 0, 1, [f"Record {records[0].get('id')!r}: {e}"]
+        accepted = rejected = 0
+        errors = []
+        for record in records:
+            a, r, errs = self._store([record])
+            accepted, rejected, errors = accepted + a, rejected + r, errors + errs
+        return accepted, rejected, errors
+
+    def _process(self, log, segment, offset):
+        job = json.loads(log.read(segment, offset))
+        status = self.status(job["job_id"]) or {
+            "job_id": job["job_id"], "records": len(job["records"]), "attempts": 0,
+            "submitted_at": job["submitted_at"], "completed_at": None}
+        if status.get("status") not in TERMINAL:
+            # A redelivered job starts over: its first attempt may have stored some batches
+            # but not all
+            status.update(status="processing", processed=0, accepted=0, rejected=0, errors=[],
+                          started_at=_now(), attempts=status["attempts"] + 1)
+            self._write_status(status)
+            try:
+                records = job["records"]
+                for start in range(0, len(records), self.batch_size):
+                    accepted, rejected, errors = self._store(records[start:start + self.batch_size])
+                    status["processed"] += accepted + rejected
+                    status["accepted"] += accepted
+                    status["rejected"] += rejected
+                    status["errors"] = (status["errors"] + errors)[:MAX_ERRORS]
+                    self._write_status(status)
+                status.update(status="done", completed_at=_now())
+            except OSError as e:
+                if status["attempts"] < self.max_attempts:
+                    delay = self.retry_delay * 2 ** (status["attempts"] - 1)
+                    logger.exception("Ingest job %s failed (attempt %d); retrying in %.1fs",
+                                     job["job_id"], status["attempts"], delay)
+                    status.update(status="queued",
+                                  errors=[f"Attempt {status['attempts']} failed: {e}"])
+                    self._write_status(status)
+                    retry = threading.Timer(delay, self._enqueue, (log, segment, offset))
+                    retry.daemon = True
+                    retry.start()
+                    return
+                status.update(status="failed", completed_at=_now(),
+                              errors=status["errors"] + [str(e)])
+            except Exception as e:
+                logger.exception("Ingest job %s failed", job["job_id"])
+                status.update(status="failed", completed_at=_now(),
+                              errors=status["errors"] + [f"{type(e).__name__}: {e}"])
+            self._write_status(status)
+            INGEST_JOBS.labels(outcome=status["status"]).inc()
+        if log.ack(segment, offset) and not log.writable:
+            self._adopted.pop(log.directory, None)
+            log.close(remove=True)
@@ -1,3 +1,6 @@
+import asyncio
+import hashlib
+import itertools
 import logging
 import os
 import socket
@@ -6,17 +9,29 @@ import time
 from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 
-import requests as _requests
-from fastapi import Depends, FastAPI, HTTPException, Request
+import numpy as np
+from fastapi import Depends, FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import APIKeyHeader, HTTPAuthorizationCredentials, HTTPBearer
-from jose import JWTError, jwt
-from pydantic import BaseModel
-import uvicorn
-
-from src.data import generate_training_data
-from src.models import load_model, predict_risk, save_model, train_model
-from src.monitoring import ACTIVE_CONNECTIONS, REQUEST_COUNT, REQUEST_DURATION, record_prediction, start_metrics_server
+from pydantic import BaseModel, Field
+
+from src.analytics import PopulationAnalytics
+from src.api import codecs
+from src.api.admission import AdmissionController, admission_dependency, charge
+from src.api.ingest_queue import IngestQueue
+from src.api.shadow import ShadowScorer, record_variant
+from src.data import age_from_birth_date, generate_training_data
+from src.data.feature_store import FeatureStore
+from src.models import (
+    FEATURES, RISK_LEVELS, RISK_RULES, load_artifact, predict_risk, risk_level,
+    rule_contributions, rule_risk, save_model, score_batch, train_model,
+)
+from src.models.neighbors import build_index
+from src.monitoring import (
+    ACTIVE_CONNECTIONS, REQUEST_COUNT, REQUEST_DURATION, event_sink, start_metrics_server,
+)
+from src.monitoring import timing
+from src.monitoring.timing import record_gap, sampled_profile, span, start_timeline
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
 logger = logging.getLogger("healthalliance.api")
@@ -26,6 +41,16 @@ ALLOWED_ORIGINS = [o.strip() for o in os.getenv("ALLOWED_ORIGINS", "http://local
 MODEL_PATH = os.getenv("MODEL_OUTPUT_PATH", "models/readmission_model.pkl")
 JWT_SECRET = os.getenv("JWT_SECRET", "healthalliance-secret-key-change-in-production")
 JWT_ALGO = "HS256"
+FEATURE_STORE_PATH = os.getenv("FEATURE_STORE_PATH", "data/feature_store")
+ANALYTICS_PATH = os.getenv("ANALYTICS_PATH", "data/analytics")
+INGEST_QUEUE_PATH = os.getenv("INGEST_QUEUE_PATH", "data/ingest_queue")
+
+RECOMMENDATIONS = {
+    "LOW": ["Regular follow-up in 3 months"],
+    "MEDIUM": ["Schedule follow-up in 2 weeks", "Monitor medication adherence"],
+    "HIGH": ["Immediate follow-up within 48 hours", "Consider home health services",
+             "Review medication plan"],
+}
 
 _USERS = [
     {"id": 1, "username": "admin",   "password": "admin123",   "role": "admin"},
@@ -36,17 +61,22 @@ _training = {"running": False, "started_at": None, "completed_at": None, "roc_au
 _model = None
 _scaler = None
 _roc_auc = None
+_index = None  # similar-patient index saved with the model, see src/models/neighbors.py
+_store = None
+_population = None
+_ingest = None
 
 
 REAL_DATA_PATH = os.getenv("TRAINING_DATA_PATH", "data/processed/patients.csv")
 
 
 def _load_model():
-    global _model, _scaler, _roc_auc
+    global _model, _scaler, _roc_auc, _index
     if _model is not None:
         return
     if os.path.exists(MODEL_PATH):
-        _model, _scaler = load_model(MODEL_PATH)
+        artifact = load_artifact(MODEL_PATH)
+        _model, _scaler, _index = artifact["model"], artifact["scaler"], artifact.get("index")
     else:
         import pandas as pd
         if os.path.exists(REAL_DATA_PATH):
@@ -60,19 +90,79 @@ def _load_model():
             logger.info("No real data found — training on 1000 synthetic patients")
         _model, _scaler, metrics = train_model(df)
         _roc_auc = metrics["roc_auc"]
+        _index = build_index(df, _scaler)
         os.makedirs(os.path.dirname(MODEL_PATH) or ".", exist_ok=True)
-        save_model(_model, _scaler, MODEL_PATH)
+        save_model(_model, _scaler, MODEL_PATH, index=_index)
         logger.info("Model trained. ROC-AUC=%.4f", _roc_auc)
+    _prepare_explainer(_model, _scaler)
+    _rescore_population(_model, _scaler)
+
+
+def _prepare_explainer(model, scaler):
+    """Precompute the model's TreeSHAP tables now rather than on the first ``explain`` request."""
+    from src.models.explain import explainer_for
+    try:
+        explainer = explainer_for(model, scaler)
+    except TypeError as e:
+        logger.warning("Explanations unavailable: %s", e)
+        return
+    logger.info("Explainer ready: %d leaves, %.1f MB", explainer.n_leaves, explainer.nbytes / 1e6)
+
+
+def _explainer(model, scaler):
+    from src.models.explain import explainer_for
+    try:
+        return explainer_for(model, scaler)
+    except TypeError as e:
+        raise HTTPException(501, str(e))
+
+
+def _feature_store():
+    global _store
+    if _store is None:
+        _store = FeatureStore(FEATURE_STORE_PATH)
+        logger.info("Feature store at %s: %d patients", FEATURE_STORE_PATH, len(_store))
+    return _store
+
+
+def _analytics():
+    global _population
+    if _population is None:
+        _population = PopulationAnalytics(ANALYTICS_PATH)
+    return _population
+
+
+def _ingest_queue():
+    # Created per worker process (never before serve.py forks): each process owns its own
+    # segment log
+    global _ingest
+    if _ingest is None:
+        _ingest = IngestQueue(INGEST_QUEUE_PATH, _ingest_records,
+                              workers=int(os.getenv("INGEST_WORKERS", "2")))
+    return _ingest
+
+
+def _rescore_population(model, scaler):
+    """Rebuild the population aggregates when the model file changed since they were computed."""
+    stat = os.stat(MODEL_PATH)
+    t = time.time()
+    version = f"{stat.st_size}-{stat.st_mtime_ns}"
+    if _analytics().rescore(model, scaler, version, seed=_feature_store()):
+        logger.info("Rescored %d patients for population analytics in %.2fs",
+                    len(_analytics()), time.time() - t)
 
 
 def _retrain(n_patients=1000):
-    global _model, _scaler, _roc_auc
+    global _model, _scaler, _roc_auc, _index
     _training.update(running=True, started_at=datetime.utcnow().isoformat(), error=None, completed_at=None)
     try:
         df = generate_training_data(n_patients, seed=int(time.time()))
         model, scaler, metrics = train_model(df)
-        save_model(model, scaler, MODEL_PATH)
-        _model, _scaler, _roc_auc = model, scaler, metrics["roc_auc"]
+        index = build_index(df, scaler)
+        save_model(model, scaler, MODEL_PATH, index=index)
+        _prepare_explainer(model, scaler)
+        _rescore_population(model, scaler)
+        _model, _scaler, _roc_auc, _index = model, scaler, metrics["roc_auc"], index
         _training.update(roc_auc=metrics["roc_auc"], n_samples=n_patients, completed_at=datetime.utcnow().isoformat())
     except Exception as e:
         _training["error"] = str(e)
@@ -80,12 +170,16 @@ def _retrain(n_patients=1000):
         _training["running"] = False
 
 
+# python-jose, requests and uvicorn are imported where used, keeping the app import light
+# for cold starts
 def _make_token(username, role):
+    from jose import jwt
     payload = {"sub": username, "role": role, "exp": datetime.utcnow() + timedelta(hours=8)}
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGO)
 
 
 def _check_token(token):
+    from jose import JWTError, jwt
     try:
         return jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGO])
     except JWTError:
@@ -115,19 +209,64 @@ async def require_admin(user=Depends(require_jwt)):
 
 
 async def require_auth(key=Depends(api_key_header), creds: HTTPAuthorizationCredentials | None = Depends(_bearer)):
-    if key and key in VALID_API_KEYS:
-        return key
-    if creds:
-        return _check_token(creds.credentials).get("sub", "unknown")
-    raise HTTPException(403, "Invalid or missing authentication")
+    # FastAPI reads and JSON-decodes the body before resolving dependencies
+    record_gap("parse")
+    with span("auth"):
+        if key and key in VALID_API_KEYS:
+            return key
+        if creds:
+            return _check_token(creds.credentials).get("sub", "unknown")
+        raise HTTPException(403, "Invalid or missing authentication")
+
+
+_principals = {}
+
+
+def _principal(auth):
+    """Audit identity: an API key's fingerprint (never the key itself), else the JWT subject."""
+    if auth not in _principals:
+        if auth in VALID_API_KEYS:
+            _principals[auth] = f"key:{hashlib.sha256(auth.encode()).hexdigest()[:12]}"
+        else:
+            _principals[auth] = f"user:{auth}"
+    return _principals[auth]
+
+
+# Per-tenant rate limits, fair queuing and load shedding; see src/api/admission.py
+ADMISSION = AdmissionController.from_env()
+admit_interactive = admission_dependency(ADMISSION, "interactive", require_auth, _principal)
+admit_bulk = admission_dependency(ADMISSION, "bulk", require_auth, _principal)
+
+
+async def _keys_class(request):
+    # A list of keys is bulk scoring; only a single key is interactive
+    body = await request.body()
+    return "bulk" if body.lstrip()[:1] == b"[" else "interactive"
+
+
+admit_by_id = admission_dependency(ADMISSION, "interactive", require_auth, _principal,
+                                   classify=_keys_class)
+
+# Candidate model in shadow and/or canary mode; see src/api/shadow.py
+SHADOW = ShadowScorer.from_env()
 
 
 @asynccontextmanager
 async def lifespan(app):
     _load_model()
+    _feature_store()
+    _analytics()
+    _ingest_queue().start()  # also recovers jobs left unacknowledged by a crashed process
+    SHADOW.preload()
+    event_sink().start()
     port = int(os.getenv("METRICS_PORT", "8001"))
-    threading.Thread(target=lambda: start_metrics_server(port), daemon=True).start()
+    if port:
+        threading.Thread(target=lambda: start_metrics_server(port), daemon=True).start()
     yield
+    SHADOW.shutdown()
+    _ingest_queue().stop()
+    _analytics().stop()
+    event_sink().stop()
 
 
 app = FastAPI(title="HealthAlliance DataSpace API", version="1.0.0", lifespan=lifespan)
@@ -145,7 +284,12 @@ app.add_middleware(
 async def metrics_middleware(request: Request, call_next):
     ACTIVE_CONNECTIONS.inc()
     t = time.time()
-    resp = await call_next(request)
+    timeline = start_timeline()
+    with sampled_profile(request.url.path):
+        resp = await call_next(request)
+    record_gap("serialize")
+    if timing.SERVER_TIMING:
+        resp.headers["Server-Timing"] = timeline.server_timing()
     REQUEST_COUNT.labels(method=request.method, endpoint=request.url.path, status=str(resp.status_code)).inc()
     REQUEST_DURATION.labels(method=request.method, endpoint=request.url.path).observe(time.time() - t)
     ACTIVE_CONNECTIONS.dec()
@@ -160,6 +304,19 @@ class PatientRiskRequest(BaseModel):
     medications: list[str]
     recent_encounters: int
     institution_id: str | None = None
+    explain: bool = False
+
+
+class PatientKey(BaseModel):
+    patient_id: str
+    institution_id: str
+
+
+class Explanation(BaseModel):
+    base_value: float               # mean model probability over the training data
+    contributions: dict[str, float]  # per feature; base_value + sum = model probability
+    # per RISK_RULES feature; sum = readmission_risk (before the 1.0 cap)
+    rules: dict[str, float]
 
 
 class PatientRiskResponse(BaseModel):
@@ -168,6 +325,30 @@ class PatientRiskResponse(BaseModel):
     risk_level: str
     confidence: float
     recommendations: list[str]
+    explanation: Explanation | None = None  # only when the request sets explain
+
+
+class SimilarPatientsRequest(BaseModel):
+    age: int
+    gender: str
+    conditions: list[str]
+    medications: list[str]
+    recent_encounters: int
+    k: int = Field(10, ge=1, le=500)
+
+
+class SimilarPatient(BaseModel):
+    features: dict[str, float]
+    distance: float           # in the model's standardized feature space
+    patients: int             # of this profile's patients counted among the k
+    profile_patients: int     # historical patients with exactly these features
+    readmission_rate: float   # among profile_patients
+
+
+class SimilarPatientsResponse(BaseModel):
+    patients: int
+    readmission_rate: float | None  # over the k nearest patients
+    neighbors: list[SimilarPatient]
 
 
 class FHIRRecord(BaseModel):
@@ -176,12 +357,28 @@ class FHIRRecord(BaseModel):
     birthDate: str
     gender: str | None = None
     institution_id: str | None = None
+    conditions: list[str] | None = None
+    medications: list[str] | None = None
+    recent_encounters: int | None = None
 
 
-class IngestResponse(BaseModel):
+class IngestJob(BaseModel):
+    job_id: str
+    status: str  # queued, processing, done or failed
+    records: int
+    processed: int
     accepted: int
     rejected: int
     errors: list[str]
+    attempts: int
+    submitted_at: str
+    started_at: str | None = None
+    completed_at: str | None = None
+
+
+class BulkRiskResponse(BaseModel):
+    predictions: list[PatientRiskResponse]
+    not_found: list[PatientKey]
 
 
 class LoginRequest(BaseModel):
@@ -241,8 +438,11 @@ async def me(user=Depends(require_jwt)):
 
 
 @app.post("/api/v1/predict", response_model=PatientRiskResponse)
-async def predict(request: PatientRiskRequest, auth=Depends(require_auth)):
-    _load_model()
+async def predict(request: PatientRiskRequest, auth=Depends(admit_interactive)):
+    # Body validation runs after the auth dependency, right before the handler
+    record_gap("validation")
+    with span("ensure_model"):
+        _load_model()
     t = time.time()
     n_cond = len(request.conditions)
     n_meds = len(request.medications)
@@ -255,49 +455,260 @@ async def predict(request: PatientRiskRequest, auth=Depends(require_auth)):
         "gender_encoded": 1 if request.gender.lower() == "male" else 0,
     }
 
-    # Thresholds calibrated on 101,763 real diabetic patients (UCI dataset)
-    # Feature importance order: encounters(45%) > medications(25%) > age(14%) > conditions(13%)
-    risk = round(min(1.0,
-        (0.35 if request.recent_encounters > 1 else 0)
-        + (0.25 if n_meds > 15 else 0)
-        + (0.20 if request.age > 65 else 0)
-        + (0.20 if n_cond > 7 else 0)
-    ), 2)
-
-    prob = predict_risk(_model, _scaler, features)
+    risk = rule_risk(features)
+    variant = "candidate" if SHADOW.routes_to_candidate(request.patient_id) else "production"
+    model, scaler = SHADOW.candidate() if variant == "candidate" else (_model, _scaler)
+    scored = time.perf_counter()
+    prob = predict_risk(model, scaler, features)
+    if variant == "production":
+        SHADOW.maybe_submit(features, prob, time.perf_counter() - scored)
+    record_variant(variant)
+    _analytics().submit((request.institution_id, request.patient_id),
+                        [features[c] for c in FEATURES], prob)
     confidence = round(abs(prob - 0.5) * 2 * 0.5 + 0.5, 2)
+    level = risk_level(risk)
+    recs = RECOMMENDATIONS[level]
+
+    event_sink().emit(_principal(auth), request.patient_id, request.institution_id, level, risk,
+                      confidence, time.time() - t)
+    content = {"patient_id": request.patient_id, "readmission_risk": risk, "risk_level": level,
+               "confidence": confidence, "recommendations": recs}
+    if request.explain:
+        with span("explain"):
+            explainer = _explainer(model, scaler)
+            contributions = explainer.explain([[features[c] for c in FEATURES]])[0]
+        content["explanation"] = {"base_value": round(explainer.base_value, 4),
+                                  "contributions": contributions,
+                                  "rules": rule_contributions(features)}
+    resp = _json(content)
+    resp.headers["X-Model-Variant"] = variant
+    return resp
 
-    if risk < 0.30:
-        level, recs = "LOW", ["Regular follow-up in 3 months"]
-    elif risk < 0.60:
-        level, recs = "MEDIUM", ["Schedule follow-up in 2 weeks", "Monitor medication adherence"]
-    else:
-        level, recs = "HIGH", ["Immediate follow-up within 48 hours", "Consider home health services", "Review medication plan"]
 
-    record_prediction(risk_level=level, duration=time.time() - t, confidence=confidence)
-    return {"patient_id": request.patient_id, "readmission_risk": risk, "risk_level": level,
-            "confidence": confidence, "recommendations": recs}
+def _json(content):
+    # Handlers build response_model-shaped dicts; skip FastAPI's re-validation and encode directly
+    return Response(codecs.dumps_json(content), media_type=codecs.JSON)
+
+
+@app.post("/api/v1/predict/by-id", response_model=PatientRiskResponse | BulkRiskResponse)
+async def predict_by_id(request: PatientKey | list[PatientKey], http: Request,
+                        auth=Depends(admit_by_id)):
+    """Score patients from their stored feature vectors; one key or a list of keys.
+
+    A list is admitted as bulk and charged per key.
+    """
+    record_gap("validation")
+    with span("ensure_model"):
+        _load_model()
+    t = time.time()
+    keys = request if isinstance(request, list) else [request]
+    charge(http, len(keys))
+    with span("feature_lookup"):
+        X, found = _feature_store().lookup([(k.institution_id, k.patient_id) for k in keys])
+    if not isinstance(request, list) and not found[0]:
+        raise HTTPException(404, f"No stored features for patient {request.patient_id} "
+                                 f"at {request.institution_id}")
+
+    hits = [k for k, ok in zip(keys, found) if ok]
+    with span("predict_proba"):
+        risk, prob, levels, confidence = score_batch(_model, _scaler, X[found])
+    hit_keys = [(k.institution_id, k.patient_id) for k in hits]
+    await asyncio.to_thread(_analytics().observe, hit_keys, X[found], prob)
+    duration = (time.time() - t) / max(len(hits), 1)
+    principal = _principal(auth)
+    predictions = []
+    for k, r, code, c in zip(hits, risk.tolist(), levels.tolist(), confidence.tolist()):
+        level = RISK_LEVELS[code][1]
+        event_sink().emit(principal, k.patient_id, k.institution_id, level, r, c, duration)
+        predictions.append({"patient_id": k.patient_id, "readmission_risk": r, "risk_level": level,
+                            "confidence": c, "recommendations": RECOMMENDATIONS[level]})
+    if not isinstance(request, list):
+        return _json(predictions[0])
+    return _json({"predictions": predictions,
+                  "not_found": [k.model_dump() for k, ok in zip(keys, found) if not ok]})
+
+
+@app.post("/api/v1/predict/batch")
+async def predict_batch(request: Request, explain: bool = False, auth=Depends(admit_bulk)):
+    """Bulk scoring of a columnar batch as JSON, msgpack or Arrow IPC; see src/api/codecs.py.
+
+    The request format comes from Content-Type, the response format from
+    Accept (defaulting to the request format). ``?explain=true`` adds the
+    ``/predict`` explanation as ``base_value``, ``contribution_<feature>``
+    and ``rule_<feature>`` columns.
+    """
+    supported = sorted(set(codecs.MEDIA_TYPES.values()))
+    content_type = codecs.negotiate(request.headers.get("content-type"))
+    if content_type is None:
+        raise HTTPException(415, f"Unsupported Content-Type; use one of {supported}")
+    accept = codecs.negotiate(request.headers.get("accept"), default=content_type)
+    if accept is None:
+        raise HTTPException(406, f"Unsupported Accept; use one of {supported}")
+
+    body = await request.body()
+    record_gap("read_body")
+    try:
+        with span("decode"):
+            batch = codecs.decode_batch(body, content_type)
+    except codecs.CodecError as e:
+        raise HTTPException(422, str(e))
+    except ImportError as e:
+        raise HTTPException(415, f"{content_type} is not available on this server: {e}")
+    charge(request, len(batch["X"]))
+
+    with span("ensure_model"):
+        _load_model()
+    t = time.time()
+    with span("predict_proba"):
+        risk, prob, levels, confidence = score_batch(_model, _scaler, batch["X"])
+    patient_ids = codecs.to_list(batch["patient_id"])
+    institutions = codecs.to_list(batch["institution_id"])
+    # observe takes the analytics file lock, so keep it off the event loop like emit_many below
+    if institutions is None:
+        institutions = itertools.repeat(None)
+    await asyncio.to_thread(_analytics().observe, list(zip(institutions, patient_ids)),
+                            batch["X"], prob)
+    extra = None
+    if explain:
+        with span("explain"):
+            explainer = _explainer(_model, _scaler)
+            contributions = explainer.contributions(batch["X"])
+        extra = {"base_value": np.full(len(risk), round(explainer.base_value, 4))}
+        extra.update((f"contribution_{col}", np.round(contributions[:, j], 4))
+                     for j, col in enumerate(FEATURES))
+        extra.update((f"rule_{col}", weight * (batch["X"][:, FEATURES.index(col)] > limit))
+                     for col, limit, weight in RISK_RULES)
+    try:
+        with span("encode"):
+            payload = codecs.encode_batch(accept, batch["patient_id"], risk, levels, confidence,
+                                          extra)
+    except ImportError as e:
+        raise HTTPException(406, f"{accept} is not available on this server: {e}")
+
+    # With EVENT_OVERFLOW=write an overflowing batch is written and fsynced by the caller, so
+    # keep it off the event loop
+    await asyncio.to_thread(event_sink().emit_many, _principal(auth), patient_ids,
+                            itertools.repeat(None) if institutions is None else institutions,
+                            [RISK_LEVELS[c][1] for c in levels.tolist()], risk.tolist(),
+                            confidence.tolist(), (time.time() - t) / max(len(risk), 1))
+    return Response(payload, media_type=accept)
+
+
+@app.post("/api/v1/patients/similar", response_model=SimilarPatientsResponse)
+async def similar_patients(request: SimilarPatientsRequest, auth=Depends(admit_interactive)):
+    """The k nearest patients of the training population and their readmission outcomes."""
+    with span("ensure_model"):
+        _load_model()
+    if _index is None:
+        raise HTTPException(501, "The loaded model was saved without a similar-patient index; "
+                                 "retrain to build one")
+    features = {
+        "age": request.age,
+        "num_conditions": len(request.conditions),
+        "num_medications": len(request.medications),
+        "recent_encounters": request.recent_encounters,
+        "gender_encoded": 1 if request.gender.lower() == "male" else 0,
+    }
+    with span("similar_patients"):
+        result = _index.query([features[c] for c in FEATURES], k=request.k)
+    return _json(result)
 
 
 @app.get("/api/v1/institutions")
 async def institutions(auth=Depends(require_auth)):
+    population = _analytics().summary()["institutions"]
+    empty = {"patients": 0, "risk_levels": {level: 0 for _, level in RISK_LEVELS}}
     return {"institutions": [
-        {"id": "dkfz", "name": "German Cancer Research Center",         "location": "Heidelberg", "patient_count": 500},
-        {"id": "ukhd", "name": "University Hospital Heidelberg",        "location": "Heidelberg", "patient_count": 700},
-        {"id": "embl", "name": "European Molecular Biology Laboratory", "location": "Heidelberg", "patient_count": 300},
+        {**i, "patient_count": population.get(i["id"], empty)["patients"],
+         "risk_levels": population.get(i["id"], empty)["risk_levels"]}
+        for i in [
+            {"id": "dkfz", "name": "German Cancer Research Center", "location": "Heidelberg"},
+            {"id": "ukhd", "name": "University Hospital Heidelberg", "location": "Heidelberg"},
+            {"id": "embl", "name": "European Molecular Biology Laboratory",
+             "location": "Heidelberg"},
+        ]
     ]}
 
 
-@app.post("/api/v1/data/ingest", response_model=IngestResponse)
-async def ingest(records: list[FHIRRecord], auth=Depends(require_auth)):
+@app.get("/api/v1/analytics/summary")
+async def analytics_summary(auth=Depends(require_auth)):
+    """Patients and risk distribution per institution, from the precomputed aggregates;
+    see src/analytics."""
+    return _json(_analytics().summary())
+
+
+@app.get("/api/v1/analytics/institutions/{institution_id}")
+async def analytics_institution(institution_id: str, auth=Depends(require_auth)):
+    """One institution's risk distribution by age band."""
+    result = _analytics().institution(institution_id)
+    if result is None:
+        raise HTTPException(404, f"No patients recorded for institution {institution_id}")
+    return _json(result)
+
+
+def _ingest_records(records):
+    """Store one batch of an ingest job (FHIRRecord dicts); returns
+    ``(accepted, rejected, errors)``."""
     accepted, rejected, errors = 0, 0, []
-    for r in records:
+    keys, vectors = [], []
+    for r in map(FHIRRecord.model_validate, records):
         if r.resourceType != "Patient":
             errors.append(f"Record {r.id}: resourceType must be 'Patient'")
             rejected += 1
-        else:
-            accepted += 1
-    return {"accepted": accepted, "rejected": rejected, "errors": errors}
+            continue
+        try:
+            age = age_from_birth_date(r.birthDate)
+        except ValueError:
+            errors.append(f"Record {r.id}: birthDate must be an ISO date (YYYY-MM-DD)")
+            rejected += 1
+            continue
+        try:
+            key = FeatureStore._key(r.institution_id, r.id)
+        except ValueError:
+            errors.append(f"Record {r.id!r}: id and institution_id must not contain tabs "
+                          "or newlines")
+            rejected += 1
+            continue
+        features = {
+            "age": age,
+            "num_conditions": len(r.conditions or []),
+            "num_medications": len(r.medications or []),
+            "recent_encounters": r.recent_encounters or 0,
+            "gender_encoded": 1 if (r.gender or "").lower() == "male" else 0,
+        }
+        keys.append(key)
+        vectors.append([features[c] for c in FEATURES])
+        accepted += 1
+    if keys:
+        _feature_store().upsert(keys, vectors)
+        # The records are stored now; an analytics failure must not report them as rejected
+        try:
+            _load_model()
+            _analytics().observe(keys, vectors, score_batch(_model, _scaler, vectors)[1])
+        except Exception:
+            logger.exception("Failed to update population analytics for %d ingested records",
+                             len(keys))
+    return accepted, rejected, errors
+
+
+@app.post("/api/v1/data/ingest", response_model=IngestJob, status_code=202)
+async def ingest(records: list[FHIRRecord], response: Response, http: Request,
+                 auth=Depends(admit_bulk)):
+    """Queue the records durably and return at once; poll the status URL for the outcome."""
+    charge(http, len(records))
+    payload = [r.model_dump(exclude_none=True) for r in records]
+    # Returns once the job is fsynced
+    job = await asyncio.to_thread(_ingest_queue().submit, payload)
+    response.headers["Location"] = f"/api/v1/data/ingest/{job['job_id']}"
+    return job
+
+
+@app.get("/api/v1/data/ingest/{job_id}", response_model=IngestJob)
+async def ingest_status(job_id: str, auth=Depends(require_auth)):
+    job = _ingest_queue().status(job_id)
+    if job is None:
+        raise HTTPException(404, f"Unknown ingest job {job_id}")
+    return job
 
 
 @app.get("/api/v1/admin/users")
@@ -344,8 +755,9 @@ async def retrain_status(user=Depends(require_jwt)):
 
 
 def _http_ok(url, timeout=1.5):
+    import requests
     try:
-        return _requests.get(url, timeout=timeout).status_code < 500
+        return requests.get(url, timeout=timeout).status_code < 500
     except Exception:
         return False
 
@@ -382,9 +794,9 @@ async def services(user=Depends(require_jwt)):
 @app.get("/api/v1/model/info")
 async def model_info(user=Depends(require_jwt)):
     return {
-        "model_type": "RandomForestClassifier",
-        "n_estimators": 100,
-        "features": ["age", "num_conditions", "num_medications", "recent_encounters", "gender_encoded"],
+        "model_type": type(_model).__name__ if _model is not None else None,
+        "n_estimators": getattr(_model, "n_estimators", None),
+        "features": FEATURES,
         "roc_auc": _roc_auc,
         "model_path": MODEL_PATH,
         "model_exists": os.path.exists(MODEL_PATH),
@@ -393,4 +805,5 @@ async def model_info(user=Depends(require_jwt)):
 
 
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,179 @@
+"""Production serving entry point.
+
+    python -m src.api.serve --workers 4
+
+The parent process loads (or trains) the model once, freezes the GC so the
+model's objects are never written to again, then forks N uvicorn workers that
+accept on one shared socket. The forest arrays stay in copy-on-write pages
+shared by every worker instead of being loaded N times. Prometheus runs in
+multiprocess mode: workers write to PROMETHEUS_MULTIPROC_DIR and the parent
+serves the aggregated metrics on METRICS_PORT.
+
+A worker that dies is respawned. One that dies within ``MIN_UPTIME`` seconds
+of starting counts as a crash on startup: respawns then back off
+exponentially, and after ``MAX_FAST_RESTARTS`` of them in a row the server
+stops instead of fork-looping on a worker that can never start.
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import tempfile
+import time
+
+logger = logging.getLogger("healthalliance.serve")
+
+MIN_UPTIME = 10.0  # seconds; a worker exiting sooner crashed on startup
+RESTART_BACKOFF = 0.5  # seconds before the first respawn after a crash on startup
+MAX_RESTART_BACKOFF = 30.0
+MAX_FAST_RESTARTS = 10
+
+
+def _restart_delay(fast_failures):
+    """Seconds to wait before respawning after ``fast_failures`` crashes on startup in a row."""
+    if not fast_failures:
+        return 0.0
+    return min(MAX_RESTART_BACKOFF, RESTART_BACKOFF * 2 ** (fast_failures - 1))
+
+
+def _prepare_multiproc_dir():
+    # Must happen before prometheus_client is first imported
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR") or tempfile.mkdtemp(prefix="prometheus-")
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = path
+    os.makedirs(path, exist_ok=True)
+    for name in os.listdir(path):
+        if name.endswith(".db"):
+            os.remove(os.path.join(path, name))
+    return path
+
+
+def _bind(host, port, backlog=2048):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(app, sock, log_level):
+    import uvicorn
+
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # The parent serves the aggregated metrics; workers must not bind METRICS_PORT
+    os.environ["METRICS_PORT"] = "0"
+    uvicorn.Server(uvicorn.Config(app, log_level=log_level)).run(sockets=[sock])
+
+
+def _spawn(app, sock, log_level):
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            _run_worker(app, sock, log_level)
+        except BaseException:
+            logger.exception("Worker %d crashed", os.getpid())
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def serve(host="0.0.0.0", port=8000, workers=1, metrics_port=8001, log_level="info"):
+    if workers > 1:
+        _prepare_multiproc_dir()
+
+    from src.api.main import SHADOW, _feature_store, _load_model, app
+
+    t = time.perf_counter()
+    _load_model()
+    _feature_store()
+    # Canary candidate only; the shadow process pool starts per worker after the fork.
+    SHADOW.preload()
+    logger.info("Model ready in %.2fs — forking %d worker(s)", time.perf_counter() - t, workers)
+
+    if workers <= 1:
+        import uvicorn
+        os.environ["METRICS_PORT"] = str(metrics_port)
+        uvicorn.run(app, host=host, port=port, log_level=log_level)
+        return
+
+    from prometheus_client import CollectorRegistry, start_http_server
+    from prometheus_client.multiprocess import MultiProcessCollector, mark_process_dead
+
+    sock = _bind(host, port)
+    gc.collect()
+    gc.freeze()
+    children = {_spawn(app, sock, log_level): time.monotonic() for _ in range(workers)}
+
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry)
+    if metrics_port:
+        start_http_server(metrics_port, registry=registry)
+
+    stopping = False
+
+    def _stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    fast_failures = 0
+    exit_code = 0
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = children.pop(pid, None)
+        mark_process_dead(pid)
+        if stopping:
+            continue
+        if started is not None and time.monotonic() - started < MIN_UPTIME:
+            fast_failures += 1
+        else:
+            fast_failures = 0
+        if fast_failures > MAX_FAST_RESTARTS:
+            logger.error("Workers keep crashing on startup (%d times in a row) — shutting down",
+                         fast_failures)
+            exit_code = 1
+            _stop(None, None)
+            continue
+        delay = _restart_delay(fast_failures)
+        logger.warning("Worker %d exited (status %d) — respawning in %.1fs", pid, status, delay)
+        deadline = time.monotonic() + delay
+        while not stopping and time.monotonic() < deadline:
+            time.sleep(min(0.1, deadline - time.monotonic()))
+        if not stopping:
+            children[_spawn(app, sock, log_level)] = time.monotonic()
+    sock.close()
+    return exit_code
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    parser = argparse.ArgumentParser(
+        description="Serve the HealthAlliance API with pre-forked workers")
+    parser.add_argument("--host", default=os.getenv("API_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("API_PORT", "8000")))
+    parser.add_argument("--workers", type=int,
+                        default=int(os.getenv("API_WORKERS", str(os.cpu_count() or 1))))
+    parser.add_argument("--metrics-port", type=int, default=int(os.getenv("METRICS_PORT", "8001")))
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "info"))
+    args = parser.parse_args(argv)
+    return serve(args.host, args.port, args.workers, args.metrics_port, args.log_level)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+"""Shadow and canary scoring of a candidate model on live /predict traffic.
+
+Shadow: a sampled fraction of requests is also scored by the candidate in a
+separate low-priority process, so its CPU time and GIL never compete with the
+request path. The request only hands over a few floats; at most
+``max_pending`` jobs may be outstanding and anything beyond that is dropped
+and counted, never queued. Results are compared with production in a
+callback thread and aggregated into Prometheus metrics. The scoring process
+is started and loads the candidate in ``preload`` (per worker, at startup), so
+no request waits for it. When it dies a background thread starts a new one, at
+most ``max_restarts`` times, and samples taken meanwhile are dropped; after
+that shadow scoring stays off until the service restarts.
+
+Canary: a fixed percentage of patients (sticky by patient ID hash) is served
+by the candidate instead of production.
+
+The served ``risk_level`` comes from the clinical rule, which is the same for
+both models. Flips therefore compare the level each model's *probability*
+falls in, which is what would change if the model drove the level.
+"""
+import hashlib
+import logging
+import multiprocessing
+import os
+import random
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from src.models import load_model, predict_risk, risk_level
+from src.monitoring import (
+    PREDICTION_VARIANT,
+    SHADOW_LATENCY_DELTA,
+    SHADOW_LEVEL_FLIPS,
+    SHADOW_PREDICTIONS,
+    SHADOW_PROB_DELTA,
+)
+
+logger = logging.getLogger(__name__)
+
+_candidate = {}
+
+
+def _init_worker(path):
+    os.nice(10)
+    _candidate["model"], _candidate["scaler"] = load_model(path)
+
+
+def _score(features):
+    t = time.perf_counter()
+    prob = predict_risk(_candidate["model"], _candidate["scaler"], features)
+    return prob, time.perf_counter() - t
+
+
+class ShadowScorer:
+    def __init__(self, path, fraction=0.0, canary_percent=0.0, max_pending=64, max_restarts=5):
+        self.path = path
+        self.fraction = fraction
+        self.canary_percent = canary_percent
+        self.max_pending = max_pending
+        self.max_restarts = max_restarts
+        self._pending = 0
+        self._restarts = 0
+        self._lock = threading.Lock()
+        self._executor = None
+        self._closed = False
+        self._model = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            os.getenv("CANDIDATE_MODEL_PATH", ""),
+            fraction=float(os.getenv("SHADOW_FRACTION", "0")),
+            canary_percent=float(os.getenv("CANARY_PERCENT", "0")),
+            max_pending=int(os.getenv("SHADOW_MAX_PENDING", "64")),
+            max_restarts=int(os.getenv("SHADOW_MAX_RESTARTS", "5")),
+        )
+
+    def routes_to_candidate(self, patient_id):
+        """Canary routing; sticky per patient so repeated requests see one model."""
+        if not self.path or self.canary_percent <= 0:
+            return False
+        digest = hashlib.sha256(str(patient_id).encode()).digest()
+        bucket = int.from_bytes(digest[:4], "big") % 10000
+        return bucket < self.canary_percent * 100
+
+    def candidate(self):
+        """The candidate (model, scaler) loaded in this process, for canary responses."""
+        if self._model is None:
+            self._model = load_model(self.path)
+            logger.info("Canary candidate loaded from %s", self.path)
+        return self._model
+
+    def preload(self):
+        if self.path and self.canary_percent > 0:
+            self.candidate()
+        if self.path and self.fraction > 0:
+            self._start()
+
+    def _start(self):
+        # spawn: never fork a process that is running the event loop and its threads
+        executor = ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker, initargs=(self.path,),
+        )
+        executor.submit(os.getpid)  # starts the process, which loads the candidate
+        with self._lock:
+            closed = self._closed
+            if not closed:
+                self._executor = executor
+        if closed:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _discard(self, executor):
+        """Drop a broken pool and start a new one in the background, up to ``max_restarts``
+        times."""
+        with self._lock:
+            if self._executor is not executor:
+                return  # already replaced after another failed job
+            self._executor = None
+            self._restarts += 1
+            restarts = self._restarts
+        executor.shutdown(wait=False, cancel_futures=True)
+        if restarts > self.max_restarts:
+            logger.error(
+                "Shadow scoring process died %d times; shadow scoring is off until restart",
+                restarts,
+            )
+        else:
+            logger.warning("Shadow scoring process died; starting a new one (restart %d of %d)",
+                           restarts, self.max_restarts)
+            threading.Thread(target=self._start, name="shadow-restart", daemon=True).start()
+
+    def maybe_submit(self, features, prob, latency):
+        """Score ``features`` with the candidate in the background if sampled; never blocks."""
+        if not self.path or self.fraction <= 0 or random.random() >= self.fraction:
+            return False
+        if self._restarts > self.max_restarts:
+            return False
+        with self._lock:
+            executor = self._executor
+            if executor is None or self._pending >= self.max_pending:
+                SHADOW_PREDICTIONS.labels(outcome="dropped").inc()
+                return False
+            self._pending += 1
+        try:
+            future = executor.submit(_score, features)
+        except Exception as e:
+            with self._lock:
+                self._pending -= 1
+            SHADOW_PREDICTIONS.labels(outcome="error").inc()
+            logger.exception("Could not submit shadow prediction")
+            if isinstance(e, BrokenProcessPool):
+                self._discard(executor)
+            return False
+        future.add_done_callback(lambda f: self._record(f, prob, latency, executor))
+        return True
+
+    def _record(self, future, prod_prob, prod_latency, executor):
+        with self._lock:
+            self._pending -= 1
+        try:
+            cand_prob, cand_latency = future.result()
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                self._discard(executor)
+            SHADOW_PREDICTIONS.labels(outcome="error").inc()
+            logger.warning("Shadow prediction failed: %s", e)
+            return
+        SHADOW_PREDICTIONS.labels(outcome="scored").inc()
+        SHADOW_PROB_DELTA.observe(abs(cand_prob - prod_prob))
+        SHADOW_LATENCY_DELTA.observe(cand_latency - prod_latency)
+        before, after = risk_level(prod_prob), risk_level(cand_prob)
+        if before != after:
+            SHADOW_LEVEL_FLIPS.labels(production=before, candidate=after).inc()
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def record_variant(variant):
+    PREDICTION_VARIANT.labels(variant=variant).inc()
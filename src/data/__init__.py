@@ -1,8 +1,12 @@
+from datetime import date
+
 import numpy as np
-import pandas as pd
+
+INSTITUTIONS = ["dkfz", "ukhd", "embl"]
 
 
 def load_patient_data(filepath):
+    import pandas as pd
     return pd.read_csv(filepath)
 
 
@@ -18,8 +22,15 @@ def validate_fhir_record(record):
     return all(f in record for f in ["resourceType", "id", "gender", "birthDate"])
 
 
+def age_from_birth_date(birth_date, today=None):
+    born = date.fromisoformat(str(birth_date)[:10])
+    today = today or date.today()
+    return today.year - born.year - ((today.month, today.day) < (born.month, born.day))
+
+
 def generate_training_data(n_patients=1000, seed=42):
     """Synthetic fallback — used only when data/patients.csv is not available."""
+    import pandas as pd
     rng = np.random.default_rng(seed)
     age = rng.integers(18, 95, n_patients)
     conditions = rng.integers(1, 16, n_patients)
@@ -47,9 +58,25 @@ def generate_training_data(n_patients=1000, seed=42):
 
 
 def parse_institution_data(institution_id, records):
+    import pandas as pd
     rows = [
         {"patient_id": r["id"], "institution": institution_id,
          "gender": r["gender"], "birth_date": r["birthDate"]}
         for r in records if validate_fhir_record(r)
     ]
     return pd.DataFrame(rows)
+
+
+def partition_by_institution(df, institutions=INSTITUTIONS, seed=42):
+    """Split a frame into per-institution partitions.
+
+    Uses the ``institution`` column when present; otherwise rows are assigned
+    to institutions at random (seeded) to simulate a multi-site data space.
+    """
+    if "institution" in df.columns:
+        site = df["institution"].astype(str).str.lower()
+    else:
+        import pandas as pd
+        site = pd.Series(np.random.default_rng(seed).choice(institutions, len(df)), index=df.index)
+    return {inst: df[site == inst].drop(columns="institution", errors="ignore")
+            for inst in institutions}
@@ -0,0 +1,158 @@
+"""Array-backed store of the latest feature vector per patient.
+
+Vectors live in one float32 ``.npy`` matrix opened with mmap, so startup does
+not read the matrix and pre-forked workers share its pages. Keys are appended
+to a tab-separated text file whose line number is the matrix row; a dict built
+from it maps ``(institution_id, patient_id)`` to rows. Upserts overwrite rows
+in place and new patients append a row, doubling the matrix when it is full.
+Writers serialize on a file lock, and every process picks up rows appended by
+others on its next lookup. Within a process, refreshes and reads share the
+writers' lock, so the keys file is never indexed twice.
+
+Institution IDs are case-insensitive. A patient without one is keyed under
+the empty institution ``""``, so ``(None, id)`` and ``("", id)`` are the same
+patient. Tabs and newlines, which would break the keys file, raise ValueError.
+"""
+import fcntl
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from src.models import FEATURES
+
+
+class FeatureStore:
+    def __init__(self, directory, columns=FEATURES, initial_capacity=1024):
+        self.directory = directory
+        self.columns = list(columns)
+        self._matrix_path = os.path.join(directory, "features.npy")
+        self._keys_path = os.path.join(directory, "keys.tsv")
+        self._lock_path = os.path.join(directory, "store.lock")
+        self._lock = threading.RLock()
+        self._index = {}
+        self._n = 0
+        self._offset = 0
+
+        os.makedirs(directory, exist_ok=True)
+        with self._file_lock():
+            if not os.path.exists(self._matrix_path):
+                open_memmap(self._matrix_path, mode="w+", dtype=np.float32,
+                            shape=(initial_capacity, len(self.columns))).flush()
+            open(self._keys_path, "ab").close()
+        self._open()
+        self.refresh()
+
+    def __len__(self):
+        return self._n
+
+    def __contains__(self, key):
+        return self._key(*key) in self._index
+
+    @staticmethod
+    def _key(institution_id, patient_id):
+        key = (str(institution_id or "").lower(), str(patient_id))
+        if any(c in part for part in key for c in "\t\n"):
+            raise ValueError(f"Invalid patient key {key!r}: tabs and newlines are not allowed")
+        return key
+
+    @contextmanager
+    def _file_lock(self):
+        with open(self._lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _open(self):
+        self._matrix = np.load(self._matrix_path, mmap_mode="r+")
+        self._inode = os.stat(self._matrix_path).st_ino
+        if self._matrix.shape[1] != len(self.columns):
+            raise ValueError(f"{self._matrix_path} has {self._matrix.shape[1]} columns, "
+                             f"expected {len(self.columns)}")
+
+    def refresh(self):
+        """Index keys appended since the last call and remap the matrix if it was regrown."""
+        with self._lock:
+            if os.stat(self._matrix_path).st_ino != self._inode:
+                self._open()
+            if os.path.getsize(self._keys_path) == self._offset:
+                return
+            with open(self._keys_path, "rb") as f:
+                f.seek(self._offset)
+                data = f.read()
+            # A line still being written by another process is picked up next time
+            data = data[:data.rfind(b"\n") + 1]
+            for line in data.decode().splitlines():
+                self._index[tuple(line.split("\t"))] = self._n
+                self._n += 1
+            self._offset += len(data)
+
+    def _grow(self, rows):
+        capacity = len(self._matrix)
+        while capacity < rows:
+            capacity *= 2
+        tmp = self._matrix_path + ".tmp"
+        grown = open_memmap(tmp, mode="w+", dtype=np.float32, shape=(capacity, len(self.columns)))
+        grown[:self._n] = self._matrix[:self._n]
+        grown.flush()
+        del grown
+        os.replace(tmp, self._matrix_path)
+        self._open()
+
+    def upsert(self, keys, vectors):
+        """Store ``vectors`` (rows in ``columns`` order) under ``(institution_id, patient_id)``.
+
+        Returns the number of patients that were not in the store before.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(keys), len(self.columns))
+        latest = {self._key(*k): i for i, k in enumerate(keys)}  # last write wins within a batch
+        with self._lock, self._file_lock():
+            self.refresh()
+            new = [k for k in latest if k not in self._index]
+            if self._n + len(new) > len(self._matrix):
+                self._grow(self._n + len(new))
+            rows = np.array([self._index.get(k, -1) for k in latest], dtype=np.intp)
+            rows[rows < 0] = np.arange(self._n, self._n + len(new))
+            self._matrix[rows] = vectors[list(latest.values())]
+            self._matrix.flush()
+            # Rows are written before their keys, so a key on disk always has its vector
+            if new:
+                lines = "".join(f"{inst}\t{pid}\n" for inst, pid in new).encode()
+                with open(self._keys_path, "ab") as f:
+                    f.write(lines)
+                self.refresh()
+        return len(new)
+
+    def lookup(self, keys):
+        """Returns ``(vectors, found)``; rows of patients not in the store are zero."""
+        keys = [self._key(*k) for k in keys]
+        out = np.zeros((len(keys), len(self.columns)), dtype=np.float32)
+        with self._lock:
+            self.refresh()
+            rows = np.array([self._index.get(k, -1) for k in keys], dtype=np.intp)
+            found = rows >= 0
+            out[found] = self._matrix[rows[found]]
+        return out, found
+
+    def items(self):
+        """``(keys, vectors)`` of every stored patient in row order; ``vectors`` is a copy."""
+        with self._lock:
+            self.refresh()
+            keys = sorted(self._index, key=self._index.__getitem__)
+            return keys, np.array(self._matrix[:len(keys)])
+
+    def overwrite(self, vectors):
+        """Replace the vectors of the first ``len(vectors)`` patients, in ``items()`` order,
+        in one write."""
+        with self._lock, self._file_lock():
+            self.refresh()
+            self._matrix[:len(vectors)] = vectors
+            self._matrix.flush()
+
+    def get(self, institution_id, patient_id):
+        vectors, found = self.lookup([(institution_id, patient_id)])
+        return dict(zip(self.columns, vectors[0].tolist())) if found[0] else None
@@ -0,0 +1,152 @@
+"""Streaming training data reader over incremental snapshots (src/data/snapshots.py).
+
+The dataset as of a day is the chunks listed in each institution's manifest.
+Chunks are fetched by a thread pool at most ``prefetch`` ahead of the
+consumer, so memory holds a bounded number of shards however large the
+dataset is. Each shard is decoded into a feature batch in the worker thread.
+
+Chunks are immutable (their key is their SHA-256), so a local cache never
+goes stale: a chunk already in ``cache_dir`` is never fetched again, and only
+the chunks that changed since the last run are downloaded.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from src.data import INSTITUTIONS, age_from_birth_date
+from src.data.snapshots import LocalObjectStore, S3ObjectStore, _chunk_key, latest_manifest
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = [
+    "patient_id", "institution", "age", "num_conditions", "num_medications",
+    "recent_encounters", "gender_encoded", "readmitted",
+]
+
+
+def open_store(url):
+    """``s3://bucket[/prefix]`` or a local directory."""
+    if url.startswith("s3://"):
+        bucket, _, prefix = url[len("s3://"):].partition("/")
+        return S3ObjectStore(bucket, prefix=prefix or "snapshots")
+    return LocalObjectStore(url)
+
+
+def is_snapshot_store(path):
+    return path.startswith("s3://") or os.path.isdir(os.path.join(path, "manifests"))
+
+
+def features_from_records(records, institution, as_of):
+    """Feature rows of FHIR records; ``readmitted`` is NaN where a record carries no outcome."""
+    n = len(records)
+    out = {c: np.zeros(n) for c in COLUMNS[2:]}
+    for i, r in enumerate(records):
+        out["age"][i] = age_from_birth_date(r["birthDate"], today=as_of)
+        out["num_conditions"][i] = len(r.get("conditions") or ())
+        out["num_medications"][i] = len(r.get("medications") or ())
+        out["recent_encounters"][i] = r.get("recent_encounters") or 0
+        out["gender_encoded"][i] = str(r.get("gender", "")).lower() == "male"
+        out["readmitted"][i] = np.nan if r.get("readmitted") is None else int(r["readmitted"])
+    ids = [str(r["id"]) for r in records]
+    return pd.DataFrame({"patient_id": ids, "institution": institution, **out})
+
+
+class ShardedReader:
+    def __init__(self, store, day=None, institutions=INSTITUTIONS, cache_dir=None, prefetch=4,
+                 max_workers=4):
+        self.store = store
+        self.day = day
+        self.institutions = list(institutions)
+        self.cache_dir = cache_dir
+        self.prefetch = max(1, prefetch)
+        self.max_workers = max_workers
+        self.stats = {"shards": 0, "fetched": 0, "cached": 0, "bytes_fetched": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, **counts):
+        with self._lock:
+            for key, n in counts.items():
+                self.stats[key] += n
+
+    def shards(self):
+        """``(institution, sha256, as_of)`` of every chunk in the dataset as of ``day``."""
+        out = []
+        for inst in self.institutions:
+            manifest = latest_manifest(self.store, inst, self.day)
+            if manifest is None:
+                logger.warning("No snapshot of %s on or before %s", inst, self.day or "today")
+                continue
+            as_of = date.fromisoformat(str(self.day or manifest["date"]))
+            out.extend((inst, c["sha256"], as_of) for c in manifest["chunks"])
+        return out
+
+    def _fetch(self, digest):
+        cached = self.cache_dir and os.path.join(self.cache_dir, digest[:2], f"{digest}.jsonl.gz")
+        if cached and os.path.exists(cached):
+            with open(cached, "rb") as f:
+                data = f.read()
+            self._count(cached=1)
+            return data
+        data = self.store.get(_chunk_key(digest))
+        if hashlib.sha256(gzip.decompress(data)).hexdigest() != digest:
+            raise ValueError(f"Chunk {digest} is corrupt")
+        self._count(fetched=1, bytes_fetched=len(data))
+        if cached:
+            os.makedirs(os.path.dirname(cached), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(cached))
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, cached)
+        return data
+
+    def _load(self, shard):
+        inst, digest, as_of = shard
+        records = [json.loads(line) for line in gzip.decompress(self._fetch(digest)).splitlines()]
+        return features_from_records(records, inst, as_of)
+
+    def __iter__(self):
+        """Feature batches, one per shard, in manifest order."""
+        shards = iter(self.shards())
+        with ThreadPoolExecutor(self.max_workers, thread_name_prefix="shard") as pool:
+            window = deque(pool.submit(self._load, s) for _, s in zip(range(self.prefetch), shards))
+            while window:
+                batch = window.popleft().result()
+                shard = next(shards, None)
+                if shard is not None:
+                    window.append(pool.submit(self._load, shard))
+                self.stats["shards"] += 1
+                yield batch
+
+    def read(self, labelled=True):
+        """All batches as one frame; with ``labelled``, only records carrying a
+        ``readmitted`` outcome."""
+        batches = [b[b["readmitted"].notna()] if labelled else b for b in self]
+        df = pd.concat(batches, ignore_index=True) if batches else pd.DataFrame(columns=COLUMNS)
+        if labelled:
+            df["readmitted"] = df["readmitted"].astype(int)
+        return df
+
+
+def read_training_frame(url, day=None, cache_dir=None, **kwargs):
+    """Labelled feature frame (model features, ``readmitted``, ``institution``) of a
+    snapshot store. Only records carrying a ``readmitted`` outcome are used, so a
+    store of unlabelled snapshots raises ValueError."""
+    reader = ShardedReader(open_store(url), day=day, cache_dir=cache_dir, **kwargs)
+    df = reader.read().drop(columns="patient_id")
+    if df.empty:
+        raise ValueError(f"No labelled records in {url} as of {day or 'today'}: training "
+                         "snapshots need a readmitted outcome")
+    logger.info("Read %d labelled records from %d shards (%d fetched, %d bytes; %d cached)",
+                len(df), reader.stats["shards"], reader.stats["fetched"],
+                reader.stats["bytes_fetched"], reader.stats["cached"])
+    return df
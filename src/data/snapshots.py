@@ -0,0 +1,227 @@
+"""Incremental, content-addressed snapshots of ingested FHIR records.
+
+An institution's dataset is its records sorted by ``id`` and cut into chunks.
+A record ends a chunk when the hash of its canonical JSON falls in a
+1-in-``chunk_records`` bucket, so boundaries depend only on record content:
+changing or adding a record rewrites its own chunk and leaves every other
+chunk byte-identical. Chunks are gzipped and stored under the SHA-256 of
+their content, so identical chunks are uploaded once across days and
+institutions.
+
+A manifest per institution and day lists the chunks with their first and last
+record id. Ingesting a day's records downloads only the chunks whose id range
+they fall in, re-chunks those, uploads the chunks that do not exist yet and
+writes the new manifest. The dataset as of any day is rebuilt from that day's
+manifest alone.
+
+Layout in the object store::
+
+    chunks/<sha[:2]>/<sha>.jsonl.gz
+    manifests/<institution>/<YYYY-MM-DD>.json
+"""
+import bisect
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+
+import pandas as pd
+
+from src.data import INSTITUTIONS, parse_institution_data
+
+CHUNK_RECORDS = 256
+
+
+class LocalObjectStore:
+    """Object store on a local directory; the stand-in for S3 in tests and on-prem dev."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split("/"))
+
+    def put(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def get(self, key):
+        with open(self._path(key), "rb") as f:
+            return f.read()
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def list(self, prefix):
+        base = self._path(prefix)
+        if not os.path.isdir(base):
+            return []
+        prefix = prefix.rstrip("/")
+        return sorted(f"{prefix}/{name}" for name in os.listdir(base) if not name.startswith("tmp"))
+
+
+class S3ObjectStore:
+    def __init__(self, bucket, client=None, prefix="snapshots"):
+        if client is None:
+            import boto3
+            client = boto3.client("s3")
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+
+    def _key(self, key):
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def put(self, key, data):
+        self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=data)
+
+    def get(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=self._key(key))["Body"].read()
+
+    def exists(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def list(self, prefix):
+        keys = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            keys.extend(obj["Key"] for obj in page.get("Contents", ()))
+        strip = len(self.prefix) + 1 if self.prefix else 0
+        return sorted(k[strip:] for k in keys)
+
+
+def _canonical(record):
+    return json.dumps(record, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def _chunk_key(digest):
+    return f"chunks/{digest[:2]}/{digest}.jsonl.gz"
+
+
+def _manifest_key(institution, day):
+    return f"manifests/{institution}/{day}.json"
+
+
+def _chunks(records, chunk_records):
+    """Cut id-sorted records at content-defined boundaries; yields lists of (id, line)."""
+    chunk = []
+    for rid, line in records:
+        chunk.append((rid, line))
+        if int.from_bytes(hashlib.sha256(line).digest()[:8], "big") % chunk_records == 0:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _read_chunk(store, digest):
+    lines = gzip.decompress(store.get(_chunk_key(digest))).splitlines()
+    return [(str(json.loads(line)["id"]), line) for line in lines]
+
+
+def latest_manifest(store, institution, day=None, before=False):
+    """The manifest of ``institution``'s latest snapshot on (or ``before``) ``day``
+    (YYYY-MM-DD), or None."""
+    days = [k.rsplit("/", 1)[1][:-len(".json")] for k in store.list(f"manifests/{institution}")]
+    if day is not None:
+        days = [d for d in days if d < str(day) or (d == str(day) and not before)]
+    return json.loads(store.get(_manifest_key(institution, max(days)))) if days else None
+
+
+def snapshot(store, institution, day, records, chunk_records=CHUNK_RECORDS):
+    """Upsert ``records`` (by ``id``) into ``institution``'s dataset and write the
+    manifest for ``day``.
+
+    Returns the manifest; its ``stats`` show what this call uploaded.
+    """
+    day = str(day)
+    # Build on the previous day, so a rerun of the same day replaces its manifest
+    parent = latest_manifest(store, institution, day, before=True)
+    chunks = parent["chunks"] if parent else []
+
+    incoming = {str(r["id"]): _canonical(r) for r in records}  # last one wins
+
+    # Incoming ids belong to the chunk whose range they fall in (before the first: the first chunk)
+    starts = [c["first"] for c in chunks]
+    touched = {}
+    for rid in incoming:
+        touched.setdefault(max(bisect.bisect_right(starts, rid) - 1, 0), []).append(rid)
+
+    stats = {
+        "records_in": len(incoming), "chunks_read": 0, "chunks_uploaded": 0, "bytes_uploaded": 0,
+    }
+    if not chunks:  # first snapshot of this institution
+        out = _write_chunks(store, sorted(incoming.items()), chunk_records, stats)
+    else:
+        out, done = [], 0
+        # Runs of adjacent touched chunks are re-chunked together; untouched chunks are carried over
+        for start in sorted(touched):
+            if start < done:
+                continue
+            end = start
+            while end + 1 in touched:
+                end += 1
+            merged = {}
+            for i in range(start, end + 1):
+                merged.update(_read_chunk(store, chunks[i]["sha256"]))
+                merged.update((rid, incoming[rid]) for rid in touched[i])
+            stats["chunks_read"] += end + 1 - start
+            out.extend(chunks[done:start])
+            out.extend(_write_chunks(store, sorted(merged.items()), chunk_records, stats))
+            done = end + 1
+        out.extend(chunks[done:])
+
+    manifest = {
+        "institution": institution, "date": day, "parent": parent["date"] if parent else None,
+        "records": sum(c["records"] for c in out), "bytes": sum(c["bytes"] for c in out),
+        "chunks": out, "stats": stats,
+    }
+    store.put(_manifest_key(institution, day), json.dumps(manifest, separators=(",", ":")).encode())
+    return manifest
+
+
+def _write_chunks(store, records, chunk_records, stats):
+    entries = []
+    for chunk in _chunks(records, chunk_records):
+        content = b"\n".join(line for _, line in chunk)
+        digest = hashlib.sha256(content).hexdigest()
+        key = _chunk_key(digest)
+        data = gzip.compress(content, mtime=0)
+        if not store.exists(key):
+            store.put(key, data)
+            stats["chunks_uploaded"] += 1
+            stats["bytes_uploaded"] += len(data)
+        entries.append({"sha256": digest, "first": chunk[0][0], "last": chunk[-1][0],
+                        "records": len(chunk), "bytes": len(data)})
+    return entries
+
+
+def load_records(store, institution, day=None):
+    """All records of ``institution`` as of ``day`` (default: latest), in id order."""
+    manifest = latest_manifest(store, institution, day)
+    if manifest is None:
+        return []
+    return [
+        json.loads(line)
+        for c in manifest["chunks"]
+        for _, line in _read_chunk(store, c["sha256"])
+    ]
+
+
+def rebuild_dataset(store, day=None, institutions=INSTITUTIONS):
+    """Patient frame (see ``parse_institution_data``) of every institution as of ``day``."""
+    frames = [parse_institution_data(inst, load_records(store, inst, day)) for inst in institutions]
+    frames = [f for f in frames if len(f)]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
@@ -0,0 +1,225 @@
+"""Cross-validated evaluation with vectorized bootstrap confidence intervals.
+
+``evaluate_model`` fits one forest per stratified fold in parallel worker
+processes and scores every row out-of-fold. Metrics are then bootstrapped
+without Python loops over resamples: each chunk of resamples is a
+(resamples x rows) index matrix, reduced with one ``bincount`` to per-row
+counts and with one sparse product to label counts per distinct score, from
+which ROC-AUC, average precision (PR-AUC), Brier score and expected
+calibration error follow by cumulative sums. Institutions and age bands are
+scored from the same resamples.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict
+
+import numpy as np
+from scipy import sparse
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import StratifiedKFold
+from sklearn.preprocessing import StandardScaler
+
+from src.models import DEFAULT_PARAMS, FEATURES
+
+AGE_BANDS = [(0, 40, "<40"), (40, 65, "40-64"), (65, 80, "65-79"), (80, 200, "80+")]
+CALIBRATION_BINS = 10
+METRICS = ("roc_auc", "pr_auc", "brier", "ece")
+
+_data: Dict[str, Any] = {}
+
+
+def _init_worker(X, y):
+    _data.update(X=X, y=y)
+
+
+def _fit_fold(train_idx, test_idx, params):
+    X, y = _data["X"], _data["y"]
+    scaler = StandardScaler().fit(X[train_idx])
+    model = RandomForestClassifier(**{**DEFAULT_PARAMS, **params}, random_state=42, n_jobs=1)
+    model.fit(scaler.transform(X[train_idx]), y[train_idx])
+    return model.predict_proba(scaler.transform(X[test_idx]))[:, 1]
+
+
+def out_of_fold_predictions(X, y, params=None, n_splits=5, max_workers=None, seed=42):
+    folds = list(StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=seed).split(X, y))
+    oof = np.empty(len(y))
+    with ProcessPoolExecutor(max_workers=max_workers or min(n_splits, os.cpu_count() or 1),
+                             initializer=_init_worker, initargs=(X, y)) as pool:
+        results = pool.map(_fit_fold, *zip(*folds), [params or {}] * n_splits)
+        for (_, test_idx), prob in zip(folds, results):
+            oof[test_idx] = prob
+    return oof, folds
+
+
+def _ranking_metrics(pos, neg):
+    """ROC-AUC and average precision per row of (resamples x score levels) counts.
+
+    Levels are in ascending score order.
+    """
+    P, N = pos.sum(axis=1), neg.sum(axis=1)
+    cum_pos, cum_neg = np.cumsum(pos, axis=1), np.cumsum(neg, axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Negatives ranked below each level, ties counted as half
+        roc_auc = np.einsum("ij,ij->i", pos, cum_neg - 0.5 * neg) / (P * N)
+        # Precision when thresholding at each level: rows scoring at or above it
+        tp = P[:, None] - cum_pos + pos
+        predicted = (P + N)[:, None] - cum_pos - cum_neg + pos + neg
+        pr_auc = np.einsum("ij,ij->i", pos, tp / np.maximum(predicted, 1)) / P
+    return roc_auc, pr_auc
+
+
+def _count_matrix(y, prob, rows):
+    """Sparse map from per-row counts to every statistic the metrics need, for ``rows`` only.
+
+    Columns are [positives per level | negatives per level | prob - label per
+    calibration bin | squared error]. Runs of score levels holding no positive
+    are collapsed into one level: neither ROC-AUC nor average precision can
+    tell them apart, and it shrinks the level axis several-fold.
+    """
+    y, prob = y[rows], prob[rows]
+    _, levels = np.unique(prob, return_inverse=True)
+    has_pos = np.bincount(levels[y], minlength=levels.max() + 1) > 0
+    boundary = has_pos | np.r_[True, has_pos[:-1]]
+    levels = (np.cumsum(boundary) - 1)[levels]
+    L = int(levels.max()) + 1
+
+    err = prob - y
+    bins = np.minimum((prob * CALIBRATION_BINS).astype(np.intp), CALIBRATION_BINS - 1)
+    cols = np.concatenate([np.where(y, levels, L + levels), 2 * L + bins,
+                           np.full(len(rows), 2 * L + CALIBRATION_BINS)])
+    data = np.concatenate([np.ones(len(rows)), err, err ** 2])
+    return (np.tile(rows, 3), cols, data), L
+
+
+def _block_metrics(stats, L):
+    roc_auc, pr_auc = _ranking_metrics(stats[:, :L], stats[:, L:2 * L])
+    n = stats[:, :2 * L].sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        brier = stats[:, -1] / n
+        ece = np.abs(stats[:, 2 * L:-1]).sum(axis=1) / n
+        return np.column_stack([roc_auc, pr_auc, brier, ece])
+
+
+def bootstrap_metrics(y, prob, n_bootstrap=1000, alpha=0.05, seed=42, subsets=None,
+                      chunk_size=None):
+    """Point estimates and percentile CIs of ROC-AUC, PR-AUC, Brier score and ECE.
+
+    Each chunk of resamples is a (resamples x rows) index matrix; one
+    ``bincount`` turns it into per-row counts and one sparse product into
+    per-level label counts and calibration sums for every resample at once.
+    ``subsets`` (a list of boolean row masks) are scored from the same
+    resamples and returned as a list after the overall metrics.
+    """
+    y = np.asarray(y).astype(bool)
+    prob = np.asarray(prob, dtype=float)
+    n = len(y)
+    masks = [np.ones(n, dtype=bool)] + list(subsets or [])
+
+    blocks, entries, offset = [], ([], [], []), 0
+    for mask in masks:
+        rows = np.flatnonzero(mask)
+        if len(rows) == 0:
+            blocks.append((offset, 0))
+            continue
+        (r, c, d), L = _count_matrix(y, prob, rows)
+        for acc, part in zip(entries, (r, c + offset, d)):
+            acc.append(part)
+        blocks.append((offset, L))
+        offset += 2 * L + CALIBRATION_BINS + 1
+    r, c, d = (np.concatenate(e) for e in entries)
+    M = sparse.csr_matrix((d, (r, c)), shape=(n, offset)).T.tocsr()
+
+    def metrics(counts):
+        stats = np.asarray(M @ counts.T).T
+        return [_block_metrics(stats[:, o:o + 2 * L + CALIBRATION_BINS + 1], L) if L else None
+                for o, L in blocks]
+
+    point = metrics(np.ones((1, n)))
+
+    # Keep each (chunk x n) index matrix around 4M entries
+    chunk = chunk_size or max(1, min(n_bootstrap, 4_000_000 // max(n, 1)))
+    rng = np.random.default_rng(seed)
+    samples = []
+    for start in range(0, n_bootstrap, chunk):
+        B = min(chunk, n_bootstrap - start)
+        idx = rng.integers(0, n, size=(B, n))
+        flat = (idx + n * np.arange(B)[:, None]).ravel()
+        counts = np.bincount(flat, minlength=B * n).reshape(B, n)
+        samples.append(metrics(counts.astype(float)))
+
+    results = []
+    for k, (_, L) in enumerate(blocks):
+        if samples and L:
+            boot = np.concatenate([s[k] for s in samples])
+        else:
+            boot = np.empty((0, len(METRICS)))
+        result = {}
+        for j, name in enumerate(METRICS):
+            value = point[k][0, j] if L else np.nan
+            low = high = np.nan
+            if np.isfinite(boot[:, j]).any():
+                low, high = np.nanpercentile(boot[:, j], [100 * alpha / 2, 100 * (1 - alpha / 2)])
+            result[name] = {"value": _round(value), "ci_low": _round(low), "ci_high": _round(high)}
+        results.append(result)
+    return results if subsets is not None else results[0]
+
+
+def calibration_curve(y, prob):
+    y = np.asarray(y)
+    bins = np.minimum((np.asarray(prob) * CALIBRATION_BINS).astype(int), CALIBRATION_BINS - 1)
+    curve = []
+    for b in range(CALIBRATION_BINS):
+        mask = bins == b
+        if mask.any():
+            curve.append({"bin": f"{b / CALIBRATION_BINS:.1f}-{(b + 1) / CALIBRATION_BINS:.1f}",
+                          "n": int(mask.sum()), "mean_predicted": _round(prob[mask].mean()),
+                          "observed_rate": _round(y[mask].mean())})
+    return curve
+
+
+def _round(x):
+    return None if x is None or not np.isfinite(x) else round(float(x), 4)
+
+
+def age_band(age):
+    labels = np.full(len(age), AGE_BANDS[-1][2], dtype=object)
+    for low, high, label in AGE_BANDS:
+        labels[(age >= low) & (age < high)] = label
+    return labels
+
+
+def evaluate_model(df, target="readmitted", params=None, n_splits=5, n_bootstrap=1000, alpha=0.05,
+                   max_workers=None, seed=42):
+    """Stratified k-fold evaluation with bootstrap CIs, overall and per subgroup.
+
+    ``df`` holds FEATURES and ``target``; an ``institution`` column, if present,
+    adds per-institution metrics.
+    """
+    X = df[FEATURES].to_numpy(dtype=float)
+    y = df[target].to_numpy().astype(int)
+    oof, folds = out_of_fold_predictions(X, y, params, n_splits, max_workers, seed)
+
+    fold_auc = [bootstrap_metrics(y[test], oof[test], n_bootstrap=0)["roc_auc"]["value"]
+                for _, test in folds]
+
+    groups = {"age_band": age_band(df["age"].to_numpy())}
+    if "institution" in df.columns:
+        groups["institution"] = df["institution"].astype(str).str.lower().to_numpy()
+    subsets = [(name, value, labels == value)
+               for name, labels in groups.items() for value in sorted(set(labels))]
+
+    overall, *per_subset = bootstrap_metrics(y, oof, n_bootstrap, alpha, seed,
+                                             subsets=[m for _, _, m in subsets])
+    by_group = {name: {} for name in groups}
+    for (name, value, mask), result in zip(subsets, per_subset):
+        by_group[name][value] = {"n": int(mask.sum()), "prevalence": _round(y[mask].mean()),
+                                 **result}
+
+    return {
+        "n_samples": len(y), "n_splits": n_splits, "n_bootstrap": n_bootstrap,
+        "confidence": 1 - alpha,
+        "fold_roc_auc": fold_auc,
+        "overall": overall,
+        "calibration_curve": calibration_curve(y, oof),
+        "groups": by_group,
+    }
@@ -0,0 +1,187 @@
+"""Per-prediction feature contributions (path-dependent TreeSHAP) for the served forest.
+
+A tree's expected output given the features in a coalition ``S`` is a sum
+over its leaves: each leaf's value times, per feature, either "x lies in the
+leaf's interval for that feature" (feature in ``S``) or the product of the
+cover ratios of the splits on that feature along the leaf's path (feature
+not in ``S``). The Shapley values of that game are what TreeSHAP computes.
+
+With only ``len(FEATURES)`` features, the whole game of a leaf is fixed by
+which of its feature intervals contain ``x``, i.e. by a ``2**M`` bit
+pattern. ``TreeExplainer`` precomputes, once per model, every leaf's
+interval bounds and its contribution vector for each of those patterns.
+Explaining a row is then a lookup of each leaf's pattern (from per-feature
+bins of the split thresholds) and a sum of the matching table rows: cost
+linear in the number of leaves, with no per-tree Python.
+
+Contributions are in probability units and add up exactly:
+``base_value + sum(contributions) == predict_proba(X)[:, 1]``.
+"""
+import threading
+import weakref
+from math import factorial
+from typing import Any
+
+import numpy as np
+
+from src.models import FEATURES
+from src.monitoring.timing import span
+
+MAX_FEATURES = 12  # the tables hold 2**M patterns per leaf
+
+
+def _trees(model):
+    """``[(sklearn tree, weight)]`` whose weighted leaf class-1 fractions sum to
+    ``predict_proba``."""
+    if hasattr(model, "forests"):  # src.models.federated.WeightedForestEnsemble
+        return [(t, w * tw) for f, w in zip(model.forests, model.weights) for t, tw in _trees(f)]
+    if hasattr(model, "estimators_"):
+        return [(est.tree_, 1 / len(model.estimators_)) for est in model.estimators_]
+    raise TypeError("Explanations need a forest of sklearn trees with training covers, "
+                    f"not {type(model).__name__}")
+
+
+def _leaves(tree, n_features):
+    """Per-leaf ``(lo, hi, cover_ratio, class-1 fraction)``; x reaches the leaf iff
+    ``lo < x <= hi`` everywhere."""
+    n = tree.node_count
+    lo = np.full((n, n_features), -np.inf)
+    hi = np.full((n, n_features), np.inf)
+    ratio = np.ones((n, n_features))
+    cover = tree.weighted_n_node_samples
+    frontier = np.array([0])
+    while len(frontier):
+        nodes = frontier[tree.children_left[frontier] != -1]
+        left, right = tree.children_left[nodes], tree.children_right[nodes]
+        f, thr = tree.feature[nodes], tree.threshold[nodes]
+        for child in (left, right):
+            lo[child], hi[child], ratio[child] = lo[nodes], hi[nodes], ratio[nodes]
+            ratio[child, f] *= cover[child] / cover[nodes]
+        hi[left, f] = np.minimum(hi[nodes, f], thr)
+        lo[right, f] = np.maximum(lo[nodes, f], thr)
+        frontier = np.concatenate([left, right])
+    leaf = tree.children_left == -1
+    value = tree.value[leaf, 0, :]
+    return lo[leaf], hi[leaf], ratio[leaf], value[:, 1] / value.sum(axis=1)
+
+
+def _bin_patterns(lo, hi, j):
+    """``(cuts, bits)`` for feature ``j``: ``bits[searchsorted(cuts, x)]`` is each leaf's
+    pattern bit for ``x``.
+
+    ``cuts`` are the distinct finite leaf bounds as float32 rounded toward -inf, which
+    keeps ``lo < x <= hi`` exact for the float32 inputs the trees compare. Bin ``b``
+    holds the ``x`` above exactly ``b`` cuts.
+    """
+    def down32(a):
+        a32 = a.astype(np.float32)
+        return np.where(a32 > a, np.nextafter(a32, np.float32(-np.inf)), a32)
+
+    lo32, hi32 = down32(lo), down32(hi)
+    cuts = np.unique(np.concatenate([lo32[np.isfinite(lo32)], hi32[np.isfinite(hi32)]]))
+    lo_rank = np.where(np.isfinite(lo32), np.searchsorted(cuts, lo32), -1)
+    hi_rank = np.where(np.isfinite(hi32), np.searchsorted(cuts, hi32), len(cuts))
+    b = np.arange(len(cuts) + 1)[:, None]
+    inside = (lo_rank < b) & (b <= hi_rank)  # (bins, L)
+    return cuts, inside.astype(np.uint16 if j >= 8 else np.uint8) << j
+
+
+class TreeExplainer:
+    """Exact path-dependent TreeSHAP for a fitted forest and its scaler.
+
+    Build with ``TreeExplainer(model, scaler)`` (or the cached
+    ``explainer_for``); construction does all per-tree work.
+    """
+
+    def __init__(self, model, scaler, features=FEATURES):
+        self.scaler = scaler
+        self.features = list(features)
+        M = len(self.features)
+        if M > MAX_FEATURES:
+            raise ValueError(f"{M} features exceed the {MAX_FEATURES} this explainer tabulates")
+        with span("explainer_build"):
+            parts = [(*_leaves(tree, M), weight) for tree, weight in _trees(model)]
+            lo, hi = (np.concatenate([p[k] for p in parts]) for k in (0, 1))
+            self._bins = [_bin_patterns(lo[:, j], hi[:, j], j) for j in range(M)]
+            ratio = np.concatenate([p[2] for p in parts])
+            value = np.concatenate([p[3] * p[4] for p in parts])
+
+            subsets = np.arange(2 ** M)
+            members = (subsets[:, None] >> np.arange(M)) & 1  # (S, M): feature j in coalition S
+            size = members.sum(axis=1)
+            # Coalition S's weight on a leaf, for features outside S: prod of their cover ratios
+            outside = np.ones((2 ** M, len(value)))  # (S, L)
+            for j in range(M):
+                outside *= np.where(members[:, j, None], 1.0, ratio[None, :, j])
+            # Features inside S count only when x is in the leaf's interval:
+            # patterns a with S subset of a
+            allowed = (subsets[None, :] & ~subsets[:, None]) == 0  # (a, S)
+            # Shapley weight by coalition size; the trailing 0 absorbs the unused branch of
+            # np.where below
+            w = np.array([factorial(s) * factorial(M - s - 1) / factorial(M) for s in range(M)]
+                         + [0.0])
+            table = np.empty((len(value), 2 ** M, M), dtype=np.float32)
+            for j in range(M):
+                # phi_j = sum over S without j of w(|S|) * (v(S + j) - v(S));
+                # indexed here by S' = S or S + j
+                coef = np.where(members[:, j], w[size - 1], -w[size]) * allowed  # (a, S')
+                table[:, :, j] = (coef @ outside).T * value[:, None]
+            self.base_value = float(outside[0] @ value)
+        self._table = table.reshape(-1, M)
+        self._offset = np.arange(len(value), dtype=np.int32) * 2 ** M
+
+    @property
+    def n_leaves(self):
+        return len(self._offset)
+
+    @property
+    def nbytes(self):
+        bins = sum(c.nbytes + b.nbytes for c, b in self._bins)
+        return self._table.nbytes + self._offset.nbytes + bins
+
+    def contributions(self, X, max_cells=2 ** 22):
+        """``(n, M)`` contributions of the unscaled FEATURES matrix ``X`` to the class-1
+        probability.
+
+        Rows are processed in chunks of at most ``max_cells`` (row, leaf) pairs to bound memory.
+        """
+        from scipy import sparse
+
+        Xs = self.scaler.transform(np.asarray(X, dtype=float)).astype(np.float32)
+        L = self.n_leaves
+        out = np.empty(Xs.shape)
+        chunk_size = max(1, max_cells // L)
+        for start in range(0, len(Xs), chunk_size):
+            x = Xs[start:start + chunk_size]
+            pattern = None
+            for j, (cuts, bits) in enumerate(self._bins):
+                b = bits[np.searchsorted(cuts, x[:, j])]
+                pattern = b if pattern is None else pattern | b
+            # Summing each leaf's table row for its pattern is a one-hot (row, leaf pattern) product
+            onehot = sparse.csr_matrix(
+                (np.ones(pattern.size, dtype=np.float32), (self._offset + pattern).ravel(),
+                 np.arange(0, pattern.size + 1, L, dtype=np.int32)),
+                shape=(len(x), len(self._table)),
+            )
+            out[start:start + len(x)] = onehot @ self._table
+        return out
+
+    def explain(self, X):
+        """List of ``{feature: contribution}`` dicts, rounded for the API."""
+        return [
+            dict(zip(self.features, np.round(row, 4).tolist())) for row in self.contributions(X)
+        ]
+
+
+_cache: "weakref.WeakKeyDictionary[Any, TreeExplainer]" = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def explainer_for(model, scaler):
+    """The ``TreeExplainer`` of a loaded model, built on first use and reused while the
+    model lives."""
+    with _lock:
+        explainer = _cache.get(model)
+        if explainer is None or explainer.scaler is not scaler:
+            explainer = _cache[model] = TreeExplainer(model, scaler)
+        return explainer
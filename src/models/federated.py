@@ -0,0 +1,65 @@
+import copy
+
+import numpy as np
+from sklearn.preprocessing import StandardScaler
+
+
+def merge_scaler_stats(stats, columns):
+    """Build a global StandardScaler from per-site (n, mean, var) aggregates."""
+    n = np.array([s[0] for s in stats], dtype=float)
+    means = np.array([s[1] for s in stats], dtype=float)
+    variances = np.array([s[2] for s in stats], dtype=float)
+
+    total = n.sum()
+    mean = (n[:, None] * means).sum(axis=0) / total
+    var = (n[:, None] * (variances + (means - mean) ** 2)).sum(axis=0) / total
+
+    scaler = StandardScaler()
+    scaler.mean_, scaler.var_ = mean, var
+    scaler.scale_ = np.where(var > 0, np.sqrt(var), 1.0)
+    scaler.n_samples_seen_ = int(total)
+    scaler.n_features_in_ = len(columns)
+    scaler.feature_names_in_ = np.array(columns, dtype=object)
+    return scaler
+
+
+class WeightedForestEnsemble:
+    """Soft-voting ensemble of site forests, weighted by each site's sample count."""
+
+    def __init__(self, forests, weights):
+        w = np.asarray(weights, dtype=float)
+        self.forests = list(forests)
+        self.weights = w / w.sum()
+        self.classes_ = forests[0].classes_
+
+    @property
+    def n_estimators(self):
+        return sum(f.n_estimators for f in self.forests)
+
+    @property
+    def feature_importances_(self):
+        return sum(w * f.feature_importances_ for f, w in zip(self.forests, self.weights))
+
+    def predict_proba(self, X):
+        return sum(w * f.predict_proba(X) for f, w in zip(self.forests, self.weights))
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+def merge_forests(forests, weights=None, strategy="trees"):
+    """Combine site forests into one model.
+
+    ``trees`` concatenates every site's trees into a single forest-of-forests;
+    ``weighted`` keeps the forests separate and averages their probabilities.
+    """
+    if strategy == "weighted":
+        return WeightedForestEnsemble(forests,
+                                      weights if weights is not None else [1] * len(forests))
+    if strategy != "trees":
+        raise ValueError(f"Unknown merge strategy: {strategy}")
+
+    merged = copy.deepcopy(forests[0])
+    merged.estimators_ = [t for f in forests for t in f.estimators_]
+    merged.n_estimators = len(merged.estimators_)
+    return merged
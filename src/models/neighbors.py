@@ -0,0 +1,74 @@
+"""Nearest historical patients for /api/v1/patients/similar.
+
+The features are small integers (age, counts, gender), so the 101,763 rows
+of data/processed/patients.csv collapse to about 13k distinct profiles.
+``PatientIndex`` keeps one entry per profile with its patient and
+readmission counts, and a KD-tree over the profiles scaled with the model's
+StandardScaler, the same distance the forest sees. The k nearest patients are
+then the nearest profiles taken until k patients are covered. That is one
+tree query of at most k points, in tens of microseconds.
+
+The index is built from the training frame when the model is trained and is
+pickled with it by ``save_model(..., index=...)``.
+"""
+import numpy as np
+
+from src.models import FEATURES
+
+
+class PatientIndex:
+    def __init__(self, X, outcomes, scaler, features=FEATURES):
+        from scipy.spatial import cKDTree
+
+        self.features = list(features)
+        X = np.asarray(X, dtype=float)
+        self.profiles, inverse, counts = np.unique(X, axis=0, return_inverse=True,
+                                                   return_counts=True)
+        self.counts = counts.astype(np.int32)
+        self.readmitted = np.bincount(inverse.ravel(), weights=np.asarray(outcomes, dtype=float),
+                                      minlength=len(self.profiles)).astype(np.int32)
+        # Scaling by hand keeps sklearn's input validation out of the query path
+        self.mean = np.asarray(scaler.mean_, dtype=float)
+        self.scale = np.asarray(scaler.scale_, dtype=float)
+        self.tree = cKDTree((self.profiles - self.mean) / self.scale)
+
+    @property
+    def n_patients(self):
+        return int(self.counts.sum())
+
+    @property
+    def n_profiles(self):
+        return len(self.profiles)
+
+    def query(self, x, k=10):
+        """The ``k`` historical patients nearest to the unscaled FEATURES vector ``x``,
+        grouped by profile.
+
+        Returns ``{patients, readmission_rate, neighbors}``; each neighbor is a
+        profile with its distance and the number of its patients among the k.
+        """
+        k = min(k, self.n_patients)
+        scaled = (np.asarray(x, dtype=float) - self.mean) / self.scale
+        distance, rows = self.tree.query(scaled, k=min(k, self.n_profiles))
+        neighbors, remaining, readmitted = [], k, 0.0
+        for d, i in zip(np.atleast_1d(distance).tolist(), np.atleast_1d(rows).tolist()):
+            if remaining <= 0:
+                break
+            taken = min(int(self.counts[i]), remaining)
+            rate = self.readmitted[i] / self.counts[i]
+            remaining -= taken
+            readmitted += taken * rate
+            neighbors.append({
+                "features": dict(zip(self.features, self.profiles[i].tolist())),
+                "distance": round(d, 4),
+                "patients": taken,
+                "profile_patients": int(self.counts[i]),
+                "readmission_rate": round(float(rate), 4),
+            })
+        return {"patients": k, "readmission_rate": round(readmitted / k, 4) if k else None,
+                "neighbors": neighbors}
+
+
+def build_index(df, scaler, target="readmitted"):
+    """``PatientIndex`` of a training frame (FEATURES and ``target`` columns)."""
+    return PatientIndex(df[FEATURES].to_numpy(dtype=float), df[target].to_numpy(), scaler)
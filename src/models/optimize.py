@@ -0,0 +1,178 @@
+"""Post-training forest optimization: tree pruning, subtree merging, quantization.
+
+``optimize_model`` greedily keeps the trees that preserve validation ROC-AUC
+within a tolerance and converts them into a ``CompactForest``: all trees share
+one flat node table in which identical subtrees (across trees) are stored once,
+thresholds are 8/16-bit cut indices and leaf probabilities uint8. Prediction
+walks every tree at once with vectorized NumPy indexing, so single-row latency
+no longer pays sklearn's per-tree overhead.
+"""
+import pickle
+import time
+
+import numpy as np
+from sklearn.metrics import roc_auc_score
+from sklearn.model_selection import train_test_split
+
+from src.models import split_data
+
+
+class CompactForest:
+    """Quantized forest stored as one node table; leaves loop back to themselves.
+
+    Thresholds are stored as uint8/uint16 indices into per-feature sorted cut
+    tables; inputs are binned once per row with ``searchsorted``, which keeps
+    every split decision identical to the float64 thresholds sklearn learned.
+    """
+
+    classes_ = np.array([0, 1])
+
+    def __init__(self, cuts, feature, threshold, children, value, roots, depth,
+                 feature_importances):
+        self.cuts = cuts
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.value = value
+        self.roots = roots
+        self.depth = depth
+        self.feature_importances_ = feature_importances
+
+    @property
+    def n_estimators(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    @classmethod
+    def from_trees(cls, trees):
+        n_features = trees[0].n_features_in_
+        cuts = []
+        for f in range(n_features):
+            thr = [est.tree_.threshold[(est.tree_.feature == f) & (est.tree_.children_left != -1)]
+                   for est in trees]
+            cuts.append(np.unique(np.concatenate(thr)))
+
+        index, depth = {}, []
+        feature, threshold, children, value = [], [], [], []
+
+        def add(key, f, code, left, right, v, d):
+            idx = index.get(key)
+            if idx is None:
+                idx = index[key] = len(feature)
+                feature.append(f)
+                threshold.append(code)
+                children.append((idx if left is None else left, idx if right is None else right))
+                value.append(v)
+                depth.append(d)
+            return idx
+
+        def build(tree, i):
+            if tree.children_left[i] == -1:
+                v = tree.value[i][0]
+                q = int(round(255 * v[1] / v.sum()))
+                return add(("leaf", q), 0, 0, None, None, q, 0)
+            left = build(tree, tree.children_left[i])
+            right = build(tree, tree.children_right[i])
+            if left == right:  # both branches collapsed to the same subtree
+                return left
+            f = int(tree.feature[i])
+            code = int(np.searchsorted(cuts[f], tree.threshold[i]))
+            return add((f, code, left, right), f, code, left, right, 0,
+                       1 + max(depth[left], depth[right]))
+
+        roots = [build(est.tree_, 0) for est in trees]
+        idx_dtype = np.min_scalar_type(len(feature))
+        return cls(
+            cuts=cuts,
+            feature=np.array(feature, dtype=np.min_scalar_type(n_features)),
+            threshold=np.array(threshold, dtype=np.min_scalar_type(max(len(c) for c in cuts))),
+            children=np.array(children, dtype=idx_dtype),
+            value=np.array(value, dtype=np.uint8),
+            roots=np.array(roots, dtype=idx_dtype),
+            depth=max(depth[r] for r in roots),
+            feature_importances=np.mean([est.feature_importances_ for est in trees], axis=0),
+        )
+
+    def predict_proba(self, X, chunk_size=16384):
+        # sklearn compares float32 inputs against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        bins = np.column_stack([np.searchsorted(c, X[:, f]) for f, c in enumerate(self.cuts)])
+        out = np.empty(len(X))
+        for start in range(0, len(X), chunk_size):
+            Xb = bins[start:start + chunk_size]
+            rows = np.arange(len(Xb))[:, None]
+            node = np.broadcast_to(self.roots.astype(np.intp), (len(Xb), len(self.roots)))
+            for _ in range(self.depth):
+                go_right = Xb[rows, self.feature[node]] > self.threshold[node]
+                node = self.children[node, go_right.view(np.uint8)]
+            out[start:start + len(Xb)] = self.value[node].mean(axis=1) / 255
+        return np.column_stack([1 - out, out])
+
+    def predict(self, X):
+        return self.classes_[(self.predict_proba(X)[:, 1] > 0.5).astype(int)]
+
+
+def prune_trees(trees, X_val, y_val, tolerance=0.005, min_trees=10):
+    """Greedy forward selection of trees until ROC-AUC is within ``tolerance`` of the full forest.
+
+    ``min_trees`` guards against a handful of trees that happen to fit the
+    validation half well but generalize worse than the full forest.
+    """
+    P = np.array([est.predict_proba(X_val)[:, 1] for est in trees])
+    target = roc_auc_score(y_val, P.mean(axis=0)) - tolerance
+
+    selected, remaining, total = [], list(range(len(trees))), np.zeros(P.shape[1])
+    while remaining:
+        scores = [roc_auc_score(y_val, (total + P[i]) / (len(selected) + 1)) for i in remaining]
+        best = int(np.argmax(scores))
+        total += P[remaining[best]]
+        selected.append(remaining.pop(best))
+        if scores[best] >= target and len(selected) >= min_trees:
+            break
+    return sorted(selected)
+
+
+def _latency(model, X, repeats=200):
+    row = X[:1]
+    model.predict_proba(row)
+    times = []
+    for _ in range(repeats):
+        t = time.perf_counter()
+        model.predict_proba(row)
+        times.append(time.perf_counter() - t)
+    return float(np.median(times))
+
+
+def optimize_model(model, scaler, df, target="readmitted", tolerance=0.005):
+    """Prune, merge and quantize a trained RandomForest.
+
+    The holdout split of ``train_model`` is halved: one half drives pruning,
+    the other is used for the before/after report. Returns ``(compact, report)``.
+    """
+    if not hasattr(model, "estimators_"):
+        raise ValueError(f"Cannot optimize {type(model).__name__}: expected a fitted random forest")
+
+    _, X_hold, _, y_hold = split_data(df, target)
+    X_val, X_rep, y_val, y_rep = train_test_split(
+        scaler.transform(X_hold), y_hold, test_size=0.5, random_state=0, stratify=y_hold)
+
+    trees = [model.estimators_[i] for i in prune_trees(model.estimators_, X_val, y_val, tolerance)]
+    compact = CompactForest.from_trees(trees)
+    auc_before = roc_auc_score(y_rep, model.predict_proba(X_rep)[:, 1])
+    auc_after = roc_auc_score(y_rep, compact.predict_proba(X_rep)[:, 1])
+
+    report = {
+        "n_trees": [len(model.estimators_), compact.n_estimators],
+        "n_nodes": [int(sum(est.tree_.node_count for est in model.estimators_)), compact.n_nodes],
+        "threshold_dtype": compact.threshold.dtype.name,
+        "leaf_dtype": compact.value.dtype.name,
+        "size_bytes": [len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)),
+                       len(pickle.dumps(compact, protocol=pickle.HIGHEST_PROTOCOL))],
+        "latency_ms": [round(_latency(model, X_rep) * 1000, 3),
+                       round(_latency(compact, X_rep) * 1000, 3)],
+        "roc_auc": [round(auc_before, 4), round(auc_after, 4)],
+    }
+    return compact, report
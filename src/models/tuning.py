@@ -0,0 +1,121 @@
+"""Parallel hyperparameter search with successive halving.
+
+Candidates are sampled from SEARCH_SPACE and trained on a small random
+slice of the training split; after every round only the best 1/eta survive and
+the slice grows eta-fold, so the last round trains the few remaining
+candidates on all training rows. Candidates of one round are fitted in
+parallel worker processes. Each candidate is scored on ROC-AUC minus a penalty
+per millisecond of single-row inference latency, because a forest that scores
+the same but answers twice as fast is the one we want to deploy. Latency is
+measured inside the workers, so run with fewer workers than cores when the
+latency term matters.
+
+The held-out split of ``train_model`` is never touched: validation rows are
+carved out of the training split.
+"""
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import roc_auc_score
+from sklearn.model_selection import train_test_split
+
+from src.models import split_data
+
+SEARCH_SPACE = {
+    "n_estimators": [25, 50, 100, 200],
+    "max_depth": [4, 6, 8, 10, 14],
+    "min_samples_leaf": [1, 5, 20, 50],
+    "class_weight": ["balanced", "balanced_subsample", None],
+}
+
+_data: Dict[str, Any] = {}
+
+
+def _init_worker(X_train, y_train, X_val, y_val):
+    _data.update(X_train=X_train, y_train=y_train, X_val=X_val, y_val=y_val)
+
+
+def _latency_ms(model, row, repeats=30):
+    model.predict_proba(row)
+    times = []
+    for _ in range(repeats):
+        t = time.perf_counter()
+        model.predict_proba(row)
+        times.append(time.perf_counter() - t)
+    return float(np.median(times)) * 1000
+
+
+def _evaluate(params, rows):
+    X, y = _data["X_train"][rows], _data["y_train"][rows]
+    model = RandomForestClassifier(**params, random_state=42, n_jobs=1).fit(X, y)
+    auc = roc_auc_score(_data["y_val"], model.predict_proba(_data["X_val"])[:, 1])
+    return float(auc), _latency_ms(model, _data["X_val"][:1])
+
+
+def sample_candidates(n_candidates, space=SEARCH_SPACE, seed=42):
+    grid = [dict(zip(space, values)) for values in itertools.product(*space.values())]
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(grid), size=min(n_candidates, len(grid)), replace=False)
+    return [grid[i] for i in picks]
+
+
+def pareto_front(trials):
+    """Trials not dominated on (higher ROC-AUC, lower latency)."""
+    return [
+        t for t in trials
+        if not any(o["roc_auc"] >= t["roc_auc"] and o["latency_ms"] <= t["latency_ms"]
+                   and (o["roc_auc"] > t["roc_auc"] or o["latency_ms"] < t["latency_ms"])
+                   for o in trials)
+    ]
+
+
+def successive_halving(df, target="readmitted", n_candidates=27, eta=3, latency_weight=0.01,
+                       min_rows=2000, max_workers=None, seed=42):
+    """Search SEARCH_SPACE; returns ``(best_params, search)``.
+
+    ``latency_weight`` is the ROC-AUC a candidate must gain to justify one more
+    millisecond of single-row latency. ``search`` holds every trial, the final
+    round's Pareto front and the best trial.
+    """
+    X_train, _, y_train, _ = split_data(df, target)
+    X_fit, X_val, y_fit, y_val = train_test_split(
+        X_train.to_numpy(), y_train.to_numpy(), test_size=0.2, random_state=seed, stratify=y_train)
+
+    candidates = sample_candidates(n_candidates, seed=seed)
+    # Stop halving while the last round still compares at least eta candidates
+    n_rounds, n = 1, len(candidates)
+    while n >= eta * eta:
+        n, n_rounds = n // eta, n_rounds + 1
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(X_fit))
+
+    trials, survivors = [], list(range(len(candidates)))
+    workers = max_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(X_fit, y_fit, X_val, y_val)) as pool:
+        for r in range(n_rounds):
+            n_rows = len(X_fit)
+            if r < n_rounds - 1:
+                n_rows = max(min_rows, len(X_fit) // eta ** (n_rounds - 1 - r))
+            rows = np.sort(order[:min(n_rows, len(X_fit))])
+            results = list(pool.map(_evaluate, [candidates[i] for i in survivors],
+                                    [rows] * len(survivors)))
+
+            round_trials = [
+                {"round": r, "n_rows": len(rows), "params": candidates[i], "roc_auc": round(auc, 4),
+                 "latency_ms": round(lat, 3), "score": round(auc - latency_weight * lat, 4)}
+                for i, (auc, lat) in zip(survivors, results)
+            ]
+            trials += round_trials
+            keep = max(1, len(survivors) // eta) if r < n_rounds - 1 else len(survivors)
+            ranked = sorted(range(len(survivors)), key=lambda k: -round_trials[k]["score"])
+            survivors = [survivors[k] for k in ranked[:keep]]
+
+    final = [t for t in trials if t["round"] == n_rounds - 1]
+    best = max(final, key=lambda t: t["score"])
+    return best["params"], {"trials": trials, "pareto_front": pareto_front(final), "best": best}
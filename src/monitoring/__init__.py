@@ -1,5 +1,10 @@
+import os
+import threading
+
 from prometheus_client import Counter, Histogram, Gauge, start_http_server
 
+from src.monitoring.events import AuditLog, PredictionEventSink
+
 REQUEST_COUNT = Counter(
     "http_requests_total", "Total HTTP requests", ["method", "endpoint", "status"]
 )
@@ -7,7 +12,9 @@ REQUEST_DURATION = Histogram(
     "http_request_duration_seconds", "Request duration in seconds", ["method", "endpoint"],
     buckets=[0.01, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0],
 )
-ACTIVE_CONNECTIONS = Gauge("active_connections", "Active HTTP connections")
+ACTIVE_CONNECTIONS = Gauge(
+    "active_connections", "Active HTTP connections", multiprocess_mode="livesum",
+)
 
 PREDICTION_COUNT = Counter(
     "predictions_total", "Total prediction requests", ["status", "risk_level"]
@@ -21,6 +28,78 @@ MODEL_CONFIDENCE = Histogram(
     buckets=[0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0],
 )
 
+ADMISSION_DECISIONS = Counter(
+    "admission_decisions_total",
+    "Admission control outcomes (admitted, rate_limited, shed, timeout)",
+    ["tenant", "priority", "outcome"],
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "admission_queue_depth", "Requests waiting for an execution slot", ["priority"],
+    multiprocess_mode="livesum",
+)
+ADMISSION_IN_FLIGHT = Gauge(
+    "admission_in_flight", "Admitted requests running", multiprocess_mode="livesum",
+)
+ADMISSION_WAIT = Histogram(
+    "admission_queue_wait_seconds", "Time spent queued before admission", ["priority"],
+    buckets=[0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0],
+)
+RATE_LIMIT_TOKENS = Gauge(
+    "rate_limit_tokens", "Tokens left in the tenant's bucket after its last request",
+    ["tenant", "priority"],
+    multiprocess_mode="liveall",
+)
+
+SHADOW_PREDICTIONS = Counter(
+    "shadow_predictions_total",
+    "Candidate model shadow scoring outcomes (scored, dropped, error)",
+    ["outcome"],
+)
+SHADOW_PROB_DELTA = Histogram(
+    "shadow_probability_delta", "Absolute difference between candidate and production probability",
+    buckets=[0.01, 0.02, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0],
+)
+SHADOW_LEVEL_FLIPS = Counter(
+    "shadow_risk_level_flips_total",
+    "Shadowed predictions whose probability falls in a different risk level",
+    ["production", "candidate"],
+)
+SHADOW_LATENCY_DELTA = Histogram(
+    "shadow_latency_delta_seconds", "Candidate minus production model scoring time",
+    buckets=[-0.05, -0.01, -0.005, -0.001, 0.0, 0.001, 0.005, 0.01, 0.05],
+)
+PREDICTION_VARIANT = Counter(
+    "prediction_variant_total", "Predictions served per model variant", ["variant"],
+)
+
+INGEST_JOBS = Counter(
+    "ingest_jobs_total", "Ingest job transitions (queued, recovered, done, failed)", ["outcome"],
+)
+INGEST_QUEUE_DEPTH = Gauge(
+    "ingest_queue_depth", "Ingest jobs on disk waiting for a worker", multiprocess_mode="livesum",
+)
+
+_event_sink = None
+_event_sink_lock = threading.Lock()
+
+
+def event_sink():
+    """The process's prediction event sink, created on first use; see src/monitoring/events.py.
+
+    Predictions are audited and counted off the request path. Nothing is
+    created at import, so importing this package reads no audit settings.
+    """
+    global _event_sink
+    if _event_sink is None:
+        with _event_sink_lock:
+            if _event_sink is None:
+                _event_sink = PredictionEventSink(
+                    AuditLog(os.getenv("AUDIT_LOG_DIR", "logs/audit")),
+                    capacity=int(os.getenv("EVENT_BUFFER_SIZE", "65536")),
+                    overflow=os.getenv("EVENT_OVERFLOW", "drop"),
+                )
+    return _event_sink
+
 
 def record_prediction(risk_level, duration, confidence, success=True):
     PREDICTION_COUNT.labels(status="success" if success else "error", risk_level=risk_level).inc()
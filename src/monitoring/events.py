@@ -0,0 +1,204 @@
+"""Non-blocking prediction event sink with an append-only audit log.
+
+The request path only appends a tuple to a bounded ring buffer (a deque:
+``append``/``popleft`` are atomic, so producers never take a lock). A
+background thread drains the buffer in batches, appends each batch to a
+gzip-compressed JSON-lines audit log and updates the aggregated prediction
+metrics. When the buffer is full the event is dropped and counted rather
+than blocking the request. Bulk callers get the same policy by default;
+with ``overflow="write"`` a batch that does not fit is instead written by
+the calling thread, trading backpressure for no lost audit records.
+
+Patient IDs are hashed with the ``AUDIT_HASH_SALT`` in the environment when
+the AuditLog is created, not when this module is imported.
+"""
+import atexit
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter as _Tally
+from collections import deque
+from datetime import datetime, timezone
+
+from prometheus_client import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+EVENTS_DROPPED = Counter(
+    "prediction_events_dropped_total", "Prediction events dropped because the buffer was full",
+)
+EVENTS_BUFFERED = Gauge(
+    "prediction_events_buffered", "Prediction events waiting to be flushed",
+    multiprocess_mode="livesum",
+)
+
+FIELDS = ("ts", "principal", "patient_id", "institution_id", "risk_level", "risk", "confidence",
+          "duration")
+
+
+def hash_patient_id(patient_id, salt=None):
+    if salt is None:
+        salt = os.getenv("AUDIT_HASH_SALT", "")
+    return hashlib.sha256(f"{salt}{patient_id}".encode()).hexdigest()[:16]
+
+
+class AuditLog:
+    """Rotating, gzip-compressed, append-only JSON-lines log.
+
+    Every batch is appended as its own gzip member, so a crash never corrupts
+    what was already written. Each process writes its own file (pre-forked
+    workers share the directory) and rotated files are made read-only.
+    """
+
+    def __init__(self, directory, name="predictions", max_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.name = name
+        self.max_bytes = max_bytes
+        self.salt = os.getenv("AUDIT_HASH_SALT", "")
+        if not self.salt:
+            logger.warning("AUDIT_HASH_SALT is not set: audit log patient IDs are unsalted SHA-256 "
+                           "hashes, which can be reversed by enumerating IDs. Set a secret salt "
+                           "outside local development.")
+
+    def _record(self, event):
+        record = dict(zip(FIELDS, event))
+        # Patient IDs are stored hashed, as required by docs/hipaa_compliance.md
+        record["patient_id"] = hash_patient_id(record["patient_id"], self.salt)
+        return record
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, f"{self.name}.{os.getpid()}.jsonl.gz")
+
+    def write(self, events):
+        lines = "".join(json.dumps(self._record(e), separators=(",", ":")) + "\n" for e in events)
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.path, "ab") as raw:
+            raw.write(gzip.compress(lines.encode(), compresslevel=6))
+            raw.flush()
+            os.fsync(raw.fileno())
+            size = raw.tell()
+        if size >= self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        path = self.path
+        if not os.path.exists(path):
+            return
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        rotated = os.path.join(self.directory, f"{self.name}.{os.getpid()}-{stamp}.jsonl.gz")
+        os.replace(path, rotated)
+        os.chmod(rotated, 0o440)
+
+
+class PredictionEventSink:
+    def __init__(self, writer=None, capacity=65536, batch_size=4096, flush_interval=1.0,
+                 autostart=True, overflow="drop"):
+        if overflow not in ("drop", "write"):
+            raise ValueError(f"overflow must be 'drop' or 'write', not {overflow!r}")
+        self.writer = writer
+        self.overflow = overflow
+        self.autostart = autostart
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer = deque()
+        self._drain_lock = threading.Lock()  # consumers only; producers never lock
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        atexit.register(self.stop)
+
+    def emit(self, principal, patient_id, institution_id, risk_level, risk, confidence, duration):
+        if self._thread is None and self.autostart:
+            self.start()
+        if len(self._buffer) >= self.capacity:
+            EVENTS_DROPPED.inc()
+            return False
+        self._buffer.append((time.time(), principal, patient_id, institution_id, risk_level, risk,
+                             confidence, duration))
+        return True
+
+    def emit_many(self, principal, patient_ids, institution_ids, risk_levels, risks, confidences,
+                  duration):
+        """Buffer one event per row of a bulk prediction; returns the number buffered.
+
+        Rows that do not fit in the buffer are dropped and counted, like
+        ``emit``. With ``overflow="write"`` a batch that does not fit is
+        written by the calling thread instead; that write blocks, so async
+        callers should run this in a thread (``asyncio.to_thread``).
+        """
+        now = time.time()
+        events = [(now, principal, p, i, lvl, r, c, duration)
+                  for p, i, lvl, r, c in zip(patient_ids, institution_ids, risk_levels, risks,
+                                             confidences)]
+        room = self.capacity - len(self._buffer)
+        if len(events) <= room or self.overflow == "drop":
+            if self._thread is None and self.autostart:
+                self.start()
+            kept = events[:max(room, 0)]
+            self._buffer.extend(kept)
+            if len(kept) < len(events):
+                EVENTS_DROPPED.inc(len(events) - len(kept))
+            return len(kept)
+        with self._drain_lock:
+            for start in range(0, len(events), self.batch_size):
+                self._process(events[start:start + self.batch_size])
+        return len(events)
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="prediction-event-sink",
+                                            daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            self._wake.set()
+            thread.join()
+        self.flush()
+
+    def flush(self):
+        """Drain everything currently buffered; returns the number of events flushed."""
+        flushed = 0
+        with self._drain_lock:
+            while self._buffer:
+                batch = []
+                while self._buffer and len(batch) < self.batch_size:
+                    batch.append(self._buffer.popleft())
+                self._process(batch)
+                flushed += len(batch)
+            EVENTS_BUFFERED.set(len(self._buffer))
+        return flushed
+
+    def _process(self, batch):
+        # Imported here: src.monitoring imports this module
+        from src.monitoring import MODEL_CONFIDENCE, PREDICTION_COUNT, PREDICTION_DURATION
+
+        if self.writer is not None:
+            try:
+                self.writer.write(batch)
+            except Exception:
+                logger.exception("Failed to write %d prediction events to the audit log",
+                                 len(batch))
+        for level, n in _Tally(e[4] for e in batch).items():
+            PREDICTION_COUNT.labels(status="success", risk_level=level).inc(n)
+        for e in batch:
+            PREDICTION_DURATION.observe(e[7])
+            MODEL_CONFIDENCE.observe(e[6])
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
@@ -0,0 +1,97 @@
+"""Stage-level request timing and sampled profiling.
+
+``span("stage")`` times a block and observes it in STAGE_DURATION. Inside a
+request (see ``start_timeline``) each stage is also appended to the request's
+timeline, which the API turns into a ``Server-Timing`` header. ``record_gap``
+attributes the time since the previous stage ended to a named stage, for work
+that happens inside the framework (body validation, response serialization).
+"""
+import contextvars
+import cProfile
+import itertools
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import Histogram
+
+STAGE_DURATION = Histogram(
+    "request_stage_duration_seconds", "Time spent per request stage", ["stage"],
+    buckets=[0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0],
+)
+
+SERVER_TIMING = os.getenv("SERVER_TIMING", "false").lower() in ("1", "true", "yes")
+PROFILE_SAMPLE_RATE = int(os.getenv("PROFILE_SAMPLE_RATE", "0"))  # profile 1-in-N requests, 0 = off
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+_timeline = contextvars.ContextVar("request_timeline", default=None)
+_request_counter = itertools.count(1)
+
+
+class Timeline:
+    __slots__ = ("stages", "mark")
+
+    def __init__(self):
+        self.stages = []
+        self.mark = time.perf_counter()
+
+    def server_timing(self):
+        return ", ".join(f"{stage};dur={seconds * 1000:.3f}" for stage, seconds in self.stages)
+
+
+def start_timeline():
+    timeline = Timeline()
+    _timeline.set(timeline)
+    return timeline
+
+
+def _observe(stage, seconds, end):
+    STAGE_DURATION.labels(stage=stage).observe(seconds)
+    timeline = _timeline.get()
+    if timeline is not None:
+        timeline.stages.append((stage, seconds))
+        timeline.mark = end
+
+
+@contextmanager
+def span(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        _observe(stage, end - start, end)
+
+
+def record_gap(stage):
+    """Attribute the time since the last stage ended (or the request started) to ``stage``."""
+    timeline = _timeline.get()
+    if timeline is not None:
+        now = time.perf_counter()
+        _observe(stage, now - timeline.mark, now)
+
+
+@contextmanager
+def sampled_profile(name):
+    """Run the block under cProfile for 1-in-PROFILE_SAMPLE_RATE calls and dump the stats.
+
+    The profiler follows the calling thread, so for async handlers it captures
+    everything the event loop ran meanwhile, not just this request.
+    """
+    if not PROFILE_SAMPLE_RATE or next(_request_counter) % PROFILE_SAMPLE_RATE:
+        yield
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # another sampled request is already being profiled on this thread
+        yield
+        return
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        slug = name.strip("/").replace("/", "_") or "root"
+        filename = f"{time.time_ns()}-{os.getpid()}-{slug}.prof"
+        profiler.dump_stats(os.path.join(PROFILE_DIR, filename))
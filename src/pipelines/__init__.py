@@ -1,12 +1,13 @@
 import os
 import logging
-from datetime import datetime
-
-import mlflow
-import mlflow.sklearn
+import shutil
+import tempfile
 
 from src.data import load_patient_data, preprocess_features
 from src.models import train_model, save_model
+from src.models.neighbors import build_index
+from src.pipelines.cache import StageCache, code_fingerprint, data_fingerprint, stage_key
+from src.pipelines.tracking import Tracker
 
 logger = logging.getLogger(__name__)
 
@@ -14,27 +15,137 @@ MLFLOW_URI = os.getenv("MLFLOW_TRACKING_URI", "http://localhost:5000")
 EXPERIMENT = os.getenv("MLFLOW_EXPERIMENT_NAME", "healthalliance-readmission")
 DATA_PATH_DEFAULT = os.getenv("TRAINING_DATA_PATH", "data/processed/patients.csv")
 MODEL_PATH = os.getenv("MODEL_OUTPUT_PATH", "models/readmission_model.pkl")
+SNAPSHOT_CACHE_DIR = os.getenv("SNAPSHOT_CACHE_DIR", "data/cache/snapshots")
+TRACKING_TIMEOUT = float(os.getenv("MLFLOW_TRACKING_TIMEOUT", "120"))
+TRACKING_SPOOL_DIR = os.getenv("MLFLOW_SPOOL_DIR", "logs/mlflow_spool")
+PIPELINE_CACHE_DIR = os.getenv("PIPELINE_CACHE_DIR", "data/cache/pipeline")
+
+
+def load_training_data(data_path, as_of=None):
+    """A patient CSV, or a snapshot store (``s3://bucket/prefix`` or a local directory)
+    streamed shard by shard."""
+    from src.data.loader import is_snapshot_store, read_training_frame
+    if is_snapshot_store(data_path):
+        return read_training_frame(data_path, day=as_of, cache_dir=SNAPSHOT_CACHE_DIR)
+    return load_patient_data(data_path)
+
+
+def _load_features(data_path, as_of):
+    df = load_training_data(data_path, as_of)
+    features_df = preprocess_features(df)
+    features_df["readmitted"] = df["readmitted"]
+    if "institution" in df.columns:
+        features_df["institution"] = df["institution"]
+    return features_df
+
+
+def run_training_pipeline(data_path, federated=False, strategy="trees", optimize=False, tune=False,
+                          evaluate=False, as_of=None, cache_dir=PIPELINE_CACHE_DIR):
+    """Train, log to MLflow and save the model; returns the MLflow run ID.
+
+    With a ``cache_dir``, stages are memoized on the fingerprint of the data, the
+    training code and the options (see src/pipelines/cache.py): when all three
+    match an earlier run, its model is restored to MODEL_PATH and its run ID
+    returned without training. Pass ``cache_dir=None`` to always retrain.
+    """
+    cache = StageCache(cache_dir) if cache_dir else None
+    if cache is not None:
+        fingerprints = {"data": data_fingerprint(data_path, as_of), "code": code_fingerprint()}
+        features_key = stage_key("features", fingerprints)
+        options = {"federated": federated, "strategy": strategy, "optimize": optimize, "tune": tune,
+                   "evaluate": evaluate}
+        training_key = stage_key("training", features_key, options)
+        hit = cache.get("training", training_key)
+        # An entry without a run ID never reached MLflow, so there is no registered model to reuse
+        if hit and hit["run_id"]:
+            os.makedirs(os.path.dirname(MODEL_PATH) or ".", exist_ok=True)
+            shutil.copyfile(cache.file("training", training_key, "model.pkl"), MODEL_PATH)
+            logger.info("Skipping training: data %s, code %s and options %s are unchanged "
+                        "since run %s (%s, ROC-AUC=%.4f); reusing its model",
+                        fingerprints["data"][:12], fingerprints["code"][:12], options,
+                        hit["run_id"], hit["created_at"], hit["roc_auc"])
+            return hit["run_id"]
+
+    # Params and metrics are batched and uploads run in the background;
+    # see src/pipelines/tracking.py
+    with Tracker(MLFLOW_URI, EXPERIMENT, timeout=TRACKING_TIMEOUT,
+                 spool_dir=TRACKING_SPOOL_DIR) as run:
+        if cache is None:
+            features_df = _load_features(data_path, as_of)
+        elif cache.get("features", features_key):
+            import pandas as pd
+            logger.info("Reusing preprocessed features %s", features_key[:12])
+            features_df = pd.read_pickle(cache.file("features", features_key, "features.pkl"))
+        else:
+            features_df = _load_features(data_path, as_of)
+            with tempfile.TemporaryDirectory() as tmp:
+                features_df.to_pickle(os.path.join(tmp, "features.pkl"))
+                cache.put("features", features_key,
+                          {"data_path": data_path, "as_of": as_of, **fingerprints},
+                          files={"features.pkl": os.path.join(tmp, "features.pkl")})
 
+        params = {}
+        if tune:
+            from src.models.tuning import successive_halving
+            params, search = successive_halving(features_df)
+            run.log_params({f"tuned_{k}": v for k, v in params.items()})
+            run.log_metrics({"tuning_val_roc_auc": search["best"]["roc_auc"],
+                             "tuning_latency_ms": search["best"]["latency_ms"]})
+            run.log_dict(search, "tuning/search.json")
+            run.log_dict({"pareto_front": search["pareto_front"]}, "tuning/pareto_front.json")
 
-def run_training_pipeline(data_path):
-    mlflow.set_tracking_uri(MLFLOW_URI)
-    mlflow.set_experiment(EXPERIMENT)
+        if federated:
+            from src.pipelines.federated import run_federated_training
+            model, scaler, metrics = run_federated_training(features_df, strategy=strategy,
+                                                            params=params)
+            run.log_params({"training_mode": "federated", "merge_strategy": strategy,
+                            "n_sites": len(metrics["sites"])})
+        else:
+            model, scaler, metrics = train_model(features_df, **params)
 
-    run_name = f"training-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}"
-    with mlflow.start_run(run_name=run_name) as run:
-        df = load_patient_data(data_path)
-        features_df = preprocess_features(df)
-        features_df["readmitted"] = df["readmitted"]
+        run.log_params({"data_path": data_path, "n_samples": len(features_df),
+                        "model_type": type(model).__name__})
+        if cache is not None:
+            run.log_params({"data_fingerprint": fingerprints["data"],
+                            "code_fingerprint": fingerprints["code"]})
+        if as_of:
+            run.log_param("data_as_of", as_of)
+        run.log_metric("roc_auc", metrics["roc_auc"])
+        run.log_metrics({
+            f"importance_{feat}": imp for feat, imp in metrics["feature_importance"].items()
+        })
 
-        model, scaler, metrics = train_model(features_df)
+        if evaluate:
+            from src.models.evaluation import evaluate_model
+            metrics["evaluation"] = evaluate_model(features_df, params=params)
+            run.log_metrics({
+                f"cv_{name}{suffix}": m[key]
+                for name, m in metrics["evaluation"]["overall"].items()
+                for key, suffix in (("value", ""), ("ci_low", "_ci_low"), ("ci_high", "_ci_high"))
+                if m[key] is not None
+            })
+            run.log_dict(metrics["evaluation"], "evaluation/cross_validation.json")
 
-        mlflow.log_params({"data_path": data_path, "n_samples": len(df), "model_type": "RandomForestClassifier"})
-        mlflow.log_metric("roc_auc", metrics["roc_auc"])
-        for feat, imp in metrics["feature_importance"].items():
-            mlflow.log_metric(f"importance_{feat}", imp)
+        metadata = None
+        if optimize:
+            from src.models.optimize import optimize_model
+            model, report = optimize_model(model, scaler, features_df)
+            run.log_metrics({
+                "optimized_roc_auc": report["roc_auc"][1],
+                "optimized_n_trees": report["n_trees"][1],
+                "optimized_size_bytes": report["size_bytes"][1],
+                "optimized_latency_ms": report["latency_ms"][1],
+            })
+            metadata = {"optimization": report}
 
-        save_model(model, scaler, MODEL_PATH)
-        mlflow.sklearn.log_model(model, artifact_path="model")
+        save_model(model, scaler, MODEL_PATH, metadata=metadata,
+                   index=build_index(features_df, scaler))
+        run.log_model_file(MODEL_PATH)
 
-        logger.info("Training done. ROC-AUC=%.4f run_id=%s", metrics["roc_auc"], run.info.run_id)
-        return run.info.run_id
+    if cache is not None:
+        cache.put("training", training_key,
+                  {"run_id": run.run_id, "roc_auc": metrics["roc_auc"], "options": options,
+                   "features": features_key, **fingerprints},
+                  files={"model.pkl": MODEL_PATH})
+    logger.info("Training done. ROC-AUC=%.4f run_id=%s", metrics["roc_auc"], run.run_id)
+    return run.run_id
@@ -0,0 +1,101 @@
+"""Content-addressed memoization of training pipeline stages.
+
+A stage's key is a SHA-256 of everything that determines its output:
+
+- data: the bytes of a CSV, or, for a snapshot store, the chunk digests and
+  as-of dates of the manifests the run would read. Manifests are already
+  content-addressed, so no chunk is downloaded to fingerprint a store.
+- code: the source of the packages that turn data into a model
+  (src/data, src/models, src/pipelines).
+- params: the stage's options, e.g. tuning or federated settings.
+
+Two stages are cached under ``<directory>/<stage>/<key>``. The ``features`` stage
+stores the preprocessed training frame, so a run whose parameters changed
+but whose data did not skips loading and preprocessing. The ``training`` stage
+stores the model pickle with its MLflow run ID and ROC-AUC. A hit means the
+run reuses that model, which the DAG already registered, instead of retraining.
+
+Entries are written to a temporary name and renamed, so a crashed run
+never leaves a partial entry behind.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+CODE_PACKAGES = ["src/data", "src/models", "src/pipelines"]
+
+
+def _digest(obj):
+    return hashlib.sha256(json.dumps(obj, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def file_digest(path, block_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def data_fingerprint(data_path, as_of=None):
+    """Fingerprint of the training data ``load_training_data(data_path, as_of)`` would read."""
+    from src.data.loader import ShardedReader, is_snapshot_store, open_store
+    if is_snapshot_store(data_path):
+        shards = ShardedReader(open_store(data_path), day=as_of).shards()
+        return _digest([[inst, digest, day.isoformat()] for inst, digest, day in shards])
+    return file_digest(data_path)
+
+
+def code_fingerprint(packages=CODE_PACKAGES, root=ROOT):
+    """Fingerprint of the training code: every ``.py`` file under ``packages``, by path and
+    content."""
+    h = hashlib.sha256()
+    for package in packages:
+        for dirpath, dirnames, filenames in os.walk(os.path.join(root, package)):
+            dirnames[:] = sorted(d for d in dirnames if d != "__pycache__")
+            for name in sorted(f for f in filenames if f.endswith(".py")):
+                path = os.path.join(dirpath, name)
+                h.update(os.path.relpath(path, root).encode() + b"\0" + file_digest(path).encode())
+    return h.hexdigest()
+
+
+def stage_key(*parts):
+    """Key of a stage from its input fingerprints and parameters (any JSON-serializable values)."""
+    return _digest(parts)
+
+
+class StageCache:
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, stage, key):
+        return os.path.join(self.directory, stage, key)
+
+    def get(self, stage, key):
+        """The entry's metadata dict, or None on a miss."""
+        path = os.path.join(self._path(stage, key), "entry.json")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def file(self, stage, key, name):
+        return os.path.join(self._path(stage, key), name)
+
+    def put(self, stage, key, metadata, files=None):
+        """Store ``metadata`` and copies of ``files`` (``{name: source path}``) as the entry
+        of ``key``."""
+        final = self._path(stage, key)
+        os.makedirs(os.path.dirname(final), exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=os.path.dirname(final), prefix=f".{key[:12]}-")
+        for name, source in (files or {}).items():
+            shutil.copyfile(source, os.path.join(tmp, name))
+        with open(os.path.join(tmp, "entry.json"), "w") as f:
+            created_at = datetime.now(timezone.utc).isoformat()
+            json.dump({**metadata, "key": key, "created_at": created_at}, f, indent=2)
+        shutil.rmtree(final, ignore_errors=True)
+        os.replace(tmp, final)
@@ -0,0 +1,177 @@
+"""Offline bulk scoring of patient files.
+
+The input (CSV or Parquet) is read in chunks of ``chunk_size`` rows. Each
+chunk goes through ``preprocess_features`` and ``score_batch`` in a pool of
+worker processes. The model is loaded once in the parent before the pool
+forks, so workers share its pages instead of unpickling their own copy.
+Results are written in input order as soon as the oldest chunk is done, and
+at most ``2 * workers`` chunks are in flight, so memory stays bounded by the
+chunk size whatever the file size.
+
+Passthrough columns (``patient_id``, ``institution``/``institution_id``)
+stay in the parent. Workers only receive the raw feature columns and return
+three arrays per chunk.
+
+pandas and the model loader are imported when a file is scored, so
+``scripts/score.py --help`` starts without them.
+"""
+import itertools
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict
+
+import numpy as np
+
+from src.data import preprocess_features
+from src.models import FEATURES, RISK_LEVELS, score_batch
+
+logger = logging.getLogger(__name__)
+
+PASSTHROUGH = ["patient_id", "institution", "institution_id"]
+INPUT_COLUMNS = FEATURES + ["gender", "conditions", "medications"]
+# Features that can also be derived from another input column
+SOURCES = {
+    "num_conditions": "conditions", "num_medications": "medications", "gender_encoded": "gender",
+}
+LEVEL_NAMES = np.array([level for _, level in RISK_LEVELS])
+
+_model: Dict[str, Any] = {}
+
+
+class MissingColumnsError(ValueError):
+    """The input lacks feature columns; scoring it would zero-fill them."""
+
+
+def missing_columns(columns):
+    """The FEATURES that ``columns`` neither contains nor can derive, e.g.
+    ``num_conditions (or conditions)``."""
+    columns = set(columns)
+    return [f"{col} (or {SOURCES[col]})" if col in SOURCES else col for col in FEATURES
+            if col not in columns and SOURCES.get(col) not in columns]
+
+
+def _is_parquet(path):
+    return str(path).lower().endswith((".parquet", ".pq"))
+
+
+def read_chunks(path, chunk_size):
+    """Yield DataFrames of at most ``chunk_size`` rows from a CSV or Parquet file."""
+    if _is_parquet(path):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        import pandas as pd
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+
+def _count_items(column):
+    """``num_conditions``/``num_medications`` from comma-separated lists, as in scripts/train.py."""
+    return column.fillna("").astype(str).map(lambda x: len([v for v in x.split(",") if v.strip()]))
+
+
+def _init_worker(model_path):
+    # Under fork the parent's model is inherited; only spawned workers load their own
+    if not _model:
+        from src.models import load_model
+        _model["model"], _model["scaler"] = load_model(model_path)
+
+
+def _score_chunk(df):
+    df = df.assign(**{f"num_{name}": _count_items(df[name])
+                      for name in ("conditions", "medications")
+                      if f"num_{name}" not in df.columns and name in df.columns})
+    features = preprocess_features(df)
+    X = features.reindex(columns=FEATURES, fill_value=0).to_numpy(dtype=float)
+    risk, prob, levels, _ = score_batch(_model["model"], _model["scaler"], X)
+    return risk, prob, levels
+
+
+class _Writer:
+    def __init__(self, path):
+        self.path = path
+        self._parquet = None
+        self._first = True
+
+    def write(self, df):
+        if _is_parquet(self.path):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._parquet is None:
+                self._parquet = pq.ParquetWriter(self.path, table.schema)
+            self._parquet.write_table(table)
+        else:
+            df.to_csv(self.path, mode="w" if self._first else "a", header=self._first, index=False)
+        self._first = False
+
+    def close(self):
+        if self._parquet is not None:
+            self._parquet.close()
+        elif self._first:  # empty input: still leave a file with the header
+            import pandas as pd
+            header = pd.DataFrame(columns=["readmission_risk", "risk_level", "probability"])
+            header.to_csv(self.path, index=False)
+
+
+def score_file(input_path, output_path, model_path, workers=None, chunk_size=20_000,
+               progress_every=10):
+    """Score every row of ``input_path`` with the model at ``model_path`` into ``output_path``.
+
+    Output rows are in input order: the passthrough columns present in the
+    input, then ``readmission_risk``, ``risk_level`` and ``probability``.
+    ``workers=1`` scores in this process. Returns ``{rows, seconds, rows_per_sec, workers}``.
+    Raises MissingColumnsError when the first chunk lacks a feature column.
+    """
+    workers = workers or os.cpu_count() or 1
+    chunks_in = read_chunks(input_path, chunk_size)
+    first = next(chunks_in, None)
+    missing = missing_columns(first.columns) if first is not None else []
+    if missing:
+        raise MissingColumnsError(f"{input_path} is missing columns: {', '.join(missing)}")
+    from src.models import load_model
+    _model["model"], _model["scaler"] = load_model(model_path)
+    writer = _Writer(output_path)
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    pending = deque()
+    rows, chunks = 0, 0
+    t = time.perf_counter()
+
+    def write_oldest():
+        nonlocal rows, chunks
+        passthrough, result = pending.popleft()
+        risk, prob, levels = result.result() if hasattr(result, "result") else result
+        writer.write(passthrough.assign(readmission_risk=risk, risk_level=LEVEL_NAMES[levels],
+                                        probability=np.round(prob, 4)))
+        rows, chunks = rows + len(risk), chunks + 1
+        if progress_every and chunks % progress_every == 0:
+            logger.info("Scored %d rows (%.0f rows/s)", rows, rows / (time.perf_counter() - t))
+
+    pool = None
+    if workers > 1:
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("fork" if "fork" in methods else None)
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                   initargs=(model_path,), mp_context=context)
+    try:
+        for df in itertools.chain([first] if first is not None else [], chunks_in):
+            passthrough = df[[c for c in PASSTHROUGH if c in df.columns]].reset_index(drop=True)
+            df = df[[c for c in INPUT_COLUMNS if c in df.columns]]
+            scored = pool.submit(_score_chunk, df) if pool else _score_chunk(df)
+            pending.append((passthrough, scored))
+            while len(pending) > (2 * workers if pool else 0):
+                write_oldest()
+        while pending:
+            write_oldest()
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        writer.close()
+
+    seconds = time.perf_counter() - t
+    return {"rows": rows, "seconds": round(seconds, 3),
+            "rows_per_sec": round(rows / seconds) if seconds else 0, "workers": workers}
@@ -0,0 +1,196 @@
+"""Batched, non-blocking MLflow tracking for training runs.
+
+The pipeline calls ``log_*`` and keeps going. Params and metrics are
+buffered and sent as ``log_batch`` calls, and every call to the tracking
+server (run creation, batches, artifacts) runs in order on one background
+thread. ``end()`` waits for them, bounded by a timeout, and returns the run
+ID, or None when the server could not be reached. A failing or slow server
+costs a warning and that timeout, never the training run itself; what could
+not be sent is spooled to a local JSON file.
+
+The model is logged from the pickle ``save_model`` already wrote, next to an
+``MLmodel`` file for the ``python_function`` flavor (loader
+``src.models._load_pyfunc``), so ``runs:/<id>/model`` registers and loads
+without serializing the forest a second time.
+"""
+import json
+import logging
+import os
+import platform
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# log_batch limits of the tracking server
+MAX_PARAMS = 100
+MAX_ENTITIES = 1000
+
+
+class Tracker:
+    def __init__(self, uri, experiment, run_name=None, tags=None, timeout=120, spool_dir=None):
+        self.uri = uri
+        self.experiment = experiment
+        started = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+        self.run_name = run_name or f"training-{started}"
+        self.tags = tags or {}
+        self.timeout = timeout
+        self.spool_dir = spool_dir
+        self.run_id = None  # None after end() when tracking failed
+        self.error = None
+        self._params = {}
+        self._metrics = {}
+        self._logged = {"params": {}, "metrics": {}}
+        self._sent = {"params": set(), "metrics": set()}
+        self._tmp = tempfile.TemporaryDirectory(prefix="tracking-")
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mlflow")
+        self._jobs = []
+        self._client = None
+        self._submit(self._start)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end("FAILED" if exc_type else "FINISHED")
+
+    # -- pipeline side: never blocks on the server ---------------------------------------
+
+    def log_param(self, key, value):
+        self._params[key] = self._logged["params"][key] = str(value)
+
+    def log_params(self, params):
+        for key, value in params.items():
+            self.log_param(key, value)
+
+    def log_metric(self, key, value):
+        self._metrics[key] = self._logged["metrics"][key] = float(value)
+
+    def log_metrics(self, metrics):
+        for key, value in metrics.items():
+            self.log_metric(key, value)
+
+    def flush(self):
+        """Send buffered params and metrics in the background."""
+        if self._params or self._metrics:
+            params, metrics, self._params, self._metrics = self._params, self._metrics, {}, {}
+            self._submit(self._log_batch, params, metrics, int(time.time() * 1000))
+
+    def log_dict(self, obj, artifact_file):
+        # Serialized now, so later changes to obj don't leak into the upload
+        path = os.path.join(self._tmp.name, uuid.uuid4().hex, os.path.basename(artifact_file))
+        os.makedirs(os.path.dirname(path))
+        with open(path, "w") as f:
+            json.dump(obj, f, indent=2, default=str)
+        self._submit(self._log_artifact, path, os.path.dirname(artifact_file) or None)
+
+    def log_model_file(self, model_path, artifact_path="model"):
+        """Log an existing ``save_model`` pickle as an MLflow pyfunc model under
+        ``artifact_path``."""
+        self._submit(self._log_model_file, model_path, artifact_path)
+
+    def end(self, status="FINISHED"):
+        """Flush, wait for pending uploads (bounded by ``timeout``) and close the run;
+        returns the run ID or None."""
+        self.flush()
+        self._submit(self._terminate, status)
+        deadline = time.monotonic() + self.timeout
+        for job in self._jobs:
+            try:
+                job.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeout:
+                self._fail(f"tracking server did not respond within {self.timeout}s")
+                break
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        if self.error:
+            self._spool()
+            self.run_id = None
+        return self.run_id
+
+    # -- background thread ---------------------------------------------------------------
+
+    def _submit(self, fn, *args):
+        self._jobs.append(self._pool.submit(self._guard, fn, *args))
+
+    def _guard(self, fn, *args):
+        if self.error and fn is not self._terminate:
+            return
+        try:
+            fn(*args)
+        except Exception as e:
+            self._fail(e)
+
+    def _fail(self, error):
+        if self.error is None:
+            self.error = error
+            logger.warning("MLflow tracking at %s degraded, continuing without it: %s",
+                           self.uri, error)
+
+    def _start(self):
+        from mlflow.tracking import MlflowClient
+
+        self._client = MlflowClient(tracking_uri=self.uri)
+        experiment = self._client.get_experiment_by_name(self.experiment)
+        if experiment:
+            experiment_id = experiment.experiment_id
+        else:
+            experiment_id = self._client.create_experiment(self.experiment)
+        run = self._client.create_run(experiment_id, run_name=self.run_name, tags=self.tags)
+        self.run_id = run.info.run_id
+
+    def _log_batch(self, params, metrics, timestamp):
+        from mlflow.entities import Metric, Param
+
+        params = [Param(k, v) for k, v in params.items()]
+        metrics = [Metric(k, v, timestamp, 0) for k, v in metrics.items()]
+        while params or metrics:
+            p, params = params[:MAX_PARAMS], params[MAX_PARAMS:]
+            m, metrics = metrics[:MAX_ENTITIES - len(p)], metrics[MAX_ENTITIES - len(p):]
+            self._client.log_batch(self.run_id, metrics=m, params=p)
+            self._sent["params"].update(x.key for x in p)
+            self._sent["metrics"].update(x.key for x in m)
+
+    def _log_artifact(self, path, artifact_path):
+        self._client.log_artifact(self.run_id, path, artifact_path)
+
+    def _log_model_file(self, model_path, artifact_path):
+        import mlflow
+        import yaml  # type: ignore[import-untyped]
+
+        mlmodel = {
+            "artifact_path": artifact_path,
+            "flavors": {"python_function": {
+                "loader_module": "src.models", "data": os.path.basename(model_path),
+                "python_version": platform.python_version(),
+            }},
+            "mlflow_version": mlflow.__version__,
+            "model_uuid": uuid.uuid4().hex,
+            "run_id": self.run_id,
+            "utc_time_created": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f"),
+        }
+        path = os.path.join(self._tmp.name, "MLmodel")
+        with open(path, "w") as f:
+            yaml.safe_dump(mlmodel, f, sort_keys=False)
+        self._client.log_artifact(self.run_id, path, artifact_path)
+        self._client.log_artifact(self.run_id, model_path, artifact_path)
+
+    def _terminate(self, status):
+        if self.run_id is not None:
+            self._client.set_terminated(self.run_id, "FAILED" if self.error else status)
+
+    def _spool(self):
+        if not self.spool_dir:
+            return
+        # Whatever the server did not confirm, for a later re-log
+        unsent = {kind: {k: v for k, v in logged.items() if k not in self._sent[kind]}
+                  for kind, logged in self._logged.items()}
+        os.makedirs(self.spool_dir, exist_ok=True)
+        path = os.path.join(self.spool_dir, f"{self.run_name}.json")
+        with open(path, "w") as f:
+            json.dump({"experiment": self.experiment, "run_name": self.run_name,
+                       "run_id": self.run_id, "error": str(self.error), **unsent}, f, indent=2)
+        logger.warning("Unsent tracking data spooled to %s", path)
@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+@pytest.fixture(autouse=True, scope="session")
+def _log_dirs(tmp_path_factory):
+    """Keep audit logs and the MLflow spool of test runs out of the repo tree."""
+    import src.pipelines
+
+    spool = str(tmp_path_factory.mktemp("mlflow_spool"))
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("AUDIT_LOG_DIR", str(tmp_path_factory.mktemp("audit")))
+        mp.setenv("AUDIT_HASH_SALT", "test-salt")
+        mp.setenv("MLFLOW_SPOOL_DIR", spool)
+        mp.setattr(src.pipelines, "TRACKING_SPOOL_DIR", spool)
+        yield
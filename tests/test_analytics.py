@@ -0,0 +1,142 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import numpy as np
+import pytest
+from src.analytics import PopulationAnalytics
+from src.data import generate_training_data
+from src.data.feature_store import FeatureStore
+from src.models import FEATURES, train_model
+
+
+@pytest.fixture(scope="module")
+def fitted():
+    model, scaler, _ = train_model(generate_training_data(300, seed=1), n_estimators=10)
+    return model, scaler
+
+
+def _observe(analytics, fitted, keys, X):
+    X = np.asarray(X, dtype=float)
+    analytics.observe(keys, X, fitted[0].predict_proba(fitted[1].transform(X))[:, 1])
+
+
+def test_observe_moves_patients_between_cells(tmp_path, fitted):
+    analytics = PopulationAnalytics(str(tmp_path))
+    _observe(analytics, fitted, [("DKFZ", "P1"), ("ukhd", "P2")],
+             [[30, 1, 2, 0, 0], [85, 9, 20, 3, 1]])
+    summary = analytics.summary()
+    assert summary["patients"] == 2
+    assert summary["institutions"]["dkfz"]["risk_levels"] == {"LOW": 1, "MEDIUM": 0, "HIGH": 0}
+    assert analytics.institution("UKHD")["age_bands"]["80+"]["risk_levels"]["HIGH"] == 1
+
+    # Same patient again: the old observation is replaced, not counted twice
+    _observe(analytics, fitted, [("dkfz", "P1")], [[70, 9, 20, 3, 0]])
+    dkfz = analytics.institution("dkfz")
+    assert dkfz["patients"] == 1 and dkfz["risk_levels"]["HIGH"] == 1
+    assert dkfz["age_bands"]["18-39"]["patients"] == 0
+    assert analytics.institution("embl") is None
+
+
+def test_observe_skips_non_finite_ages(tmp_path, fitted):
+    analytics = PopulationAnalytics(str(tmp_path))
+    _observe(analytics, fitted, [("ukhd", "P1")], [[10, 1, 2, 0, 0]])
+    analytics.observe([("dkfz", "P2"), ("dkfz", "P3")],
+                      [[np.nan, 1, 2, 0, 0], [30, 1, 2, 0, 0]], [0.1, np.nan])
+    summary = analytics.summary()
+    assert summary["patients"] == 1 and summary["institutions"]["ukhd"]["patients"] == 1
+    assert summary["institutions"].get("dkfz", {"patients": 0})["patients"] == 0
+    assert len(analytics) == 1
+
+
+def test_observe_skips_bad_keys_and_buckets_unknown_institutions(tmp_path, fitted):
+    analytics = PopulationAnalytics(str(tmp_path))
+    keys = [("dkfz", "P\t1"), ("dkfz", "P2")] + [(f"made-up-{i}", "P3") for i in range(300)]
+    _observe(analytics, fitted, keys, [[30, 1, 2, 0, 0]] * len(keys))
+    summary = analytics.summary()
+    assert summary["patients"] == 301
+    assert set(summary["institutions"]) == {"dkfz", "unknown"}
+    assert summary["institutions"]["unknown"]["patients"] == 300
+    assert len(analytics) == 301
+
+
+def test_incremental_aggregates_match_a_rescore(tmp_path, fitted):
+    analytics = PopulationAnalytics(str(tmp_path / "a"))
+    X = generate_training_data(200, seed=3)[FEATURES].to_numpy(dtype=float)
+    keys = [(["dkfz", "ukhd", None][i % 3], f"P{i % 150}") for i in range(len(X))]
+    for start in range(0, len(X), 40):
+        _observe(analytics, fitted, keys[start:start + 40], X[start:start + 40])
+    incremental = analytics.summary()
+    assert incremental["patients"] == len(set(keys))
+
+    assert analytics.rescore(*fitted, version="v1")
+    assert not analytics.rescore(*fitted, version="v1")
+    rebuilt = analytics.summary()
+    assert rebuilt["model_version"] == "v1"
+    for name, expected in incremental["institutions"].items():
+        assert rebuilt["institutions"][name]["risk_levels"] == expected["risk_levels"]
+        mean = rebuilt["institutions"][name]["mean_probability"]
+        assert mean == pytest.approx(expected["mean_probability"], abs=1e-3)
+    assert "unknown" in rebuilt["institutions"]
+
+
+def test_rescore_seeds_from_feature_store_and_submit_flushes(tmp_path, fitted):
+    store = FeatureStore(str(tmp_path / "features"))
+    store.upsert([("embl", f"P{i}") for i in range(4)], [[40 + i, 1, 1, 0, 0] for i in range(4)])
+    analytics = PopulationAnalytics(str(tmp_path / "analytics"), flush_interval=60)
+    assert analytics.rescore(*fitted, version="v1", seed=store)
+    assert analytics.institution("embl")["patients"] == 4
+
+    analytics.submit(("embl", "P9"), [50, 1, 1, 0, 0], 0.5)
+    analytics.stop()
+    assert analytics.institution("embl")["patients"] == 5
+    assert PopulationAnalytics(str(tmp_path / "analytics")).summary()["patients"] == 5
+
+
+def test_queries_during_observe_register_each_institution_once(tmp_path, fitted, monkeypatch):
+    import threading
+    import time
+
+    getsize = os.path.getsize
+
+    def slow_getsize(path):  # widen the window between checking and reading institutions.tsv
+        time.sleep(0.001)
+        size = getsize(path)
+        time.sleep(0.001)
+        return size
+
+    monkeypatch.setattr(os.path, "getsize", slow_getsize)
+    # Each round registers the institutions afresh while other threads query
+    for attempt in range(10):
+        directory = str(tmp_path / str(attempt))
+        analytics = PopulationAnalytics(directory)
+        done = threading.Event()
+        errors = []
+
+        def write():
+            try:
+                for i, inst in enumerate(["dkfz", "ukhd", "embl", None]):
+                    _observe(analytics, fitted, [(inst, f"P{i}")], [[30 + i, 1, 2, 0, 0]])
+            except Exception as e:
+                errors.append(e)
+            finally:
+                done.set()
+
+        def read():
+            while not done.is_set():
+                analytics.summary()
+                analytics.institution("embl")
+
+        threads = [threading.Thread(target=write)]
+        threads += [threading.Thread(target=read) for _ in range(3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=60)
+
+        assert not errors
+        assert sorted(analytics._institutions) == ["dkfz", "embl", "ukhd", "unknown"]
+        summary = PopulationAnalytics(directory).summary()
+        assert summary["patients"] == 4
+        assert all(s["patients"] == 1 for s in summary["institutions"].values())
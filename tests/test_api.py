@@ -1,9 +1,14 @@
 import pytest
 import sys
 import os
+import tempfile
+import json
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 os.environ.setdefault("API_KEYS", "dev-key-dkfz,dev-key-ukhd,dev-key-embl")
+os.environ.setdefault("FEATURE_STORE_PATH", tempfile.mkdtemp(prefix="features-"))
+os.environ.setdefault("ANALYTICS_PATH", tempfile.mkdtemp(prefix="analytics-"))
+os.environ.setdefault("INGEST_QUEUE_PATH", tempfile.mkdtemp(prefix="ingest-"))
 
 from fastapi.testclient import TestClient
 from src.api.main import app
@@ -106,16 +111,38 @@ def test_institutions_contains_expected_ids():
     assert {i["id"] for i in r["institutions"]} == {"dkfz", "ukhd", "embl"}
 
 
+def test_similar_patients_returns_k_nearest_with_outcomes():
+    body = {k: BASE[k] for k in ("age", "gender", "conditions", "medications", "recent_encounters")}
+    r = client.post("/api/v1/patients/similar", json={**body, "k": 15}, headers=AUTH)
+    assert r.status_code == 200
+    result = r.json()
+    assert result["patients"] == sum(n["patients"] for n in result["neighbors"]) == 15
+    distances = [n["distance"] for n in result["neighbors"]]
+    assert distances == sorted(distances)
+    assert 0.0 <= result["readmission_rate"] <= 1.0
+    r = client.post("/api/v1/patients/similar", json={**body, "k": 0}, headers=AUTH)
+    assert r.status_code == 422
+    assert client.post("/api/v1/patients/similar", json=body).status_code == 403
+
+
+def _ingest(records):
+    r = client.post("/api/v1/data/ingest", json=records, headers=AUTH)
+    assert r.status_code == 202 and r.json()["status"] == "queued"
+    from src.api.main import _ingest_queue
+    assert _ingest_queue().wait(r.json()["job_id"])
+    return client.get(r.headers["Location"], headers=AUTH).json()
+
+
 def test_ingest_valid_fhir_records():
     records = [{"resourceType": "Patient", "id": "test-001", "gender": "male", "birthDate": "1960-01-01"}]
-    r = client.post("/api/v1/data/ingest", json=records, headers=AUTH).json()
+    r = _ingest(records)
     assert r["accepted"] == 1
     assert r["rejected"] == 0
 
 
 def test_ingest_invalid_resource_type():
     records = [{"resourceType": "Observation", "id": "obs-001", "gender": "female", "birthDate": "1970-05-10"}]
-    r = client.post("/api/v1/data/ingest", json=records, headers=AUTH).json()
+    r = _ingest(records)
     assert r["rejected"] == 1
     assert len(r["errors"]) == 1
 
@@ -123,3 +150,546 @@ def test_ingest_invalid_resource_type():
 def test_ingest_missing_api_key_returns_403():
     records = [{"resourceType": "Patient", "id": "x", "gender": "male", "birthDate": "1960-01-01"}]
     assert client.post("/api/v1/data/ingest", json=records).status_code == 403
+
+
+def test_ingest_rejects_invalid_birth_date():
+    records = [{"resourceType": "Patient", "id": "bad-date", "gender": "male",
+                "birthDate": "03/14/1955"}]
+    r = _ingest(records)
+    assert r["rejected"] == 1
+
+
+def test_ingest_rejects_keys_with_tabs_and_keeps_the_rest():
+    records = [{"resourceType": "Patient", "id": "bad\tid", "gender": "male",
+                "birthDate": "1960-01-01"},
+               {"resourceType": "Patient", "id": "TAB-OK", "gender": "male",
+                "birthDate": "1960-01-01", "institution_id": "dkfz"}]
+    r = _ingest(records)
+    assert r["status"] == "done" and (r["accepted"], r["rejected"]) == (1, 1)
+    assert "tabs or newlines" in r["errors"][0]
+    key = {"patient_id": "TAB-OK", "institution_id": "dkfz"}
+    assert client.post("/api/v1/predict/by-id", json=key, headers=AUTH).status_code == 200
+
+
+def test_predict_by_id_scores_ingested_patient():
+    record = {"resourceType": "Patient", "id": "BYID-001", "gender": "male",
+              "birthDate": "1940-02-01", "institution_id": "dkfz", "conditions": ["c"] * 9,
+              "medications": ["m"] * 20, "recent_encounters": 3}
+    _ingest([record])
+    from src.data import age_from_birth_date
+    raw = client.post("/api/v1/predict", headers=AUTH, json={
+        **BASE, "patient_id": "BYID-001", "age": age_from_birth_date("1940-02-01"),
+        "conditions": record["conditions"], "medications": record["medications"]}).json()
+
+    key = {"patient_id": "BYID-001", "institution_id": "DKFZ"}
+    r = client.post("/api/v1/predict/by-id", json=key, headers=AUTH)
+    assert r.status_code == 200
+    assert r.json() == raw
+
+
+def test_predict_by_id_bulk_reports_missing():
+    records = [{"resourceType": "Patient", "id": f"BULK-{i}", "gender": "female",
+                "birthDate": "1990-06-01", "institution_id": "ukhd"} for i in range(3)]
+    _ingest(records)
+    keys = [{"patient_id": f"BULK-{i}", "institution_id": "ukhd"} for i in range(4)]
+    r = client.post("/api/v1/predict/by-id", json=keys, headers=AUTH).json()
+    assert [p["patient_id"] for p in r["predictions"]] == ["BULK-0", "BULK-1", "BULK-2"]
+    assert all(p["risk_level"] == "LOW" for p in r["predictions"])
+    assert r["not_found"] == [{"patient_id": "BULK-3", "institution_id": "ukhd"}]
+
+
+def test_analytics_follow_ingest_and_predictions():
+    from src.api.main import _analytics
+    records = [
+        {"resourceType": "Patient", "id": f"POP-{i}", "gender": "male", "birthDate": "1930-01-01",
+         "institution_id": "embl", "conditions": ["c"] * 9, "medications": ["m"] * 20,
+         "recent_encounters": 3}
+        for i in range(3)
+    ]
+    _ingest(records)
+    before = client.get("/api/v1/analytics/institutions/EMBL", headers=AUTH).json()
+    assert before["age_bands"]["80+"]["risk_levels"]["HIGH"] >= 3
+
+    client.post("/api/v1/predict", headers=AUTH, json={
+        **BASE, "patient_id": "POP-0", "institution_id": "embl", "age": 30, "recent_encounters": 0,
+    })
+    _analytics().flush()
+    after = client.get("/api/v1/analytics/institutions/embl", headers=AUTH).json()
+    assert after["patients"] == before["patients"]
+    assert after["age_bands"]["80+"]["patients"] == before["age_bands"]["80+"]["patients"] - 1
+
+    summary = client.get("/api/v1/analytics/summary", headers=AUTH).json()
+    assert summary["institutions"]["embl"]["patients"] == after["patients"]
+    institutions = client.get("/api/v1/institutions", headers=AUTH).json()["institutions"]
+    embl = next(i for i in institutions if i["id"] == "embl")
+    assert embl["patient_count"] == after["patients"]
+    assert client.get("/api/v1/analytics/institutions/nowhere", headers=AUTH).status_code == 404
+
+
+def test_predict_by_id_unknown_patient_returns_404():
+    key = {"patient_id": "nobody", "institution_id": "embl"}
+    r = client.post("/api/v1/predict/by-id", json=key, headers=AUTH)
+    assert r.status_code == 404
+
+
+BATCH = {"patient_id": ["B1", "B2"], "age": [80, 30], "gender": ["male", "female"],
+         "conditions": [["c"] * 9, []], "medications": [["m"] * 20, ["m"]],
+         "recent_encounters": [3, 0]}
+
+
+def test_predict_batch_json_matches_single_predictions():
+    r = client.post("/api/v1/predict/batch", json=BATCH, headers=AUTH)
+    assert r.status_code == 200 and r.headers["content-type"] == "application/json"
+    body = r.json()
+    for i, pid in enumerate(BATCH["patient_id"]):
+        single = client.post("/api/v1/predict", headers=AUTH, json={
+            "patient_id": pid, **{k: v[i] for k, v in BATCH.items() if k != "patient_id"}}).json()
+        assert body["patient_id"][i] == pid
+        assert body["readmission_risk"][i] == single["readmission_risk"]
+        assert body["risk_level"][i] == single["risk_level"]
+        assert body["confidence"][i] == single["confidence"]
+
+
+def test_predict_batch_arrow_roundtrip():
+    pa = pytest.importorskip("pyarrow")
+    table = pa.table({"patient_id": ["A1", "A2"], "age": pa.array([80, 30], pa.int16()),
+                      "gender_encoded": [1, 0], "num_conditions": [9, 0],
+                      "num_medications": [20, 1], "recent_encounters": [3, 0]})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    r = client.post("/api/v1/predict/batch", content=sink.getvalue().to_pybytes(),
+                    headers={**AUTH, "Content-Type": "application/vnd.apache.arrow.stream"})
+    assert r.headers["content-type"] == "application/vnd.apache.arrow.stream"
+    out = pa.ipc.open_stream(r.content).read_all().to_pydict()
+    expected = client.post("/api/v1/predict/batch", json={**BATCH, "patient_id": ["A1", "A2"]},
+                           headers=AUTH).json()
+    assert out == expected
+
+
+def test_predict_batch_msgpack_typed_columns():
+    msgpack = pytest.importorskip("msgpack")
+    import numpy as np
+    age = {"dtype": "<i4", "data": np.array([80, 30], "<i4").tobytes()}
+    body = {"patient_id": ["M1", "M2"], "age": age,
+            **{k: v for k, v in BATCH.items() if k not in ("patient_id", "age")}}
+    r = client.post("/api/v1/predict/batch", content=msgpack.packb(body),
+                    headers={**AUTH, "Content-Type": "application/msgpack"})
+    out = msgpack.unpackb(r.content)
+    risk = np.frombuffer(out["readmission_risk"]["data"], out["readmission_risk"]["dtype"])
+    assert out["patient_id"] == ["M1", "M2"] and out["risk_level"] == ["HIGH", "LOW"]
+    assert risk.tolist() == [1.0, 0.0]
+
+
+def test_predict_batch_rejects_null_features():
+    pa = pytest.importorskip("pyarrow")
+    msgpack = pytest.importorskip("msgpack")
+    import numpy as np
+    table = pa.table({"patient_id": ["A1", "A2"], "age": pa.array([80, None], pa.int16()),
+                      "gender_encoded": [1, 0], "num_conditions": [9, 0],
+                      "num_medications": [20, 1], "recent_encounters": [3, 0]})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    nan_age = {"dtype": "<f8", "data": np.array([80, np.nan], "<f8").tobytes()}
+    bodies = {
+        "application/vnd.apache.arrow.stream": sink.getvalue().to_pybytes(),
+        "application/msgpack": msgpack.packb({**BATCH, "age": nan_age}),
+        "application/json": json.dumps({**BATCH, "age": [80, None]}).encode(),
+    }
+    for media, body in bodies.items():
+        r = client.post("/api/v1/predict/batch", content=body,
+                        headers={**AUTH, "Content-Type": media})
+        assert r.status_code == 422, media
+        assert r.json()["detail"] == "Column age has a null or non-finite value at row 1"
+
+
+def test_predict_batch_survives_bad_analytics_keys():
+    from src.api.main import _analytics
+    body = {**BATCH, "patient_id": ["BAD\tKEY", "OK-KEY"],
+            "institution_id": ["dkfz", "not-a-partner"]}
+    assert client.post("/api/v1/predict/batch", json=body, headers=AUTH).status_code == 200
+    client.post("/api/v1/predict", headers=AUTH, json={**BASE, "patient_id": "BAD\nKEY"})
+    client.post("/api/v1/predict", headers=AUTH,
+                json={**BASE, "patient_id": "FLUSHED", "institution_id": "embl"})
+    _analytics().flush()
+    assert ("embl", "FLUSHED") in _analytics().patients
+    assert "not-a-partner" not in _analytics().summary()["institutions"]
+
+
+def test_predict_explanation_adds_up():
+    plain = client.post("/api/v1/predict", json=BASE, headers=AUTH).json()
+    assert "explanation" not in plain
+    r = client.post("/api/v1/predict", json={**BASE, "explain": True}, headers=AUTH).json()
+    e = r["explanation"]
+    assert set(e["contributions"]) == {
+        "age", "num_conditions", "num_medications", "recent_encounters", "gender_encoded",
+    }
+    assert sum(e["rules"].values()) == pytest.approx(r["readmission_risk"])
+    # confidence is derived from the model probability the contributions add up to
+    prob = e["base_value"] + sum(e["contributions"].values())
+    assert round(abs(prob - 0.5) * 2 * 0.5 + 0.5, 2) == pytest.approx(r["confidence"], abs=0.011)
+
+
+def test_predict_batch_explain_columns_match_single():
+    body = client.post("/api/v1/predict/batch?explain=true", json=BATCH, headers=AUTH).json()
+    for i, pid in enumerate(BATCH["patient_id"]):
+        features = {k: v[i] for k, v in BATCH.items() if k != "patient_id"}
+        single = client.post("/api/v1/predict", headers=AUTH, json={
+            "patient_id": pid, "explain": True, **features}).json()
+        e = single["explanation"]
+        assert body["base_value"][i] == e["base_value"]
+        assert {k: body[f"contribution_{k}"][i] for k in e["contributions"]} == e["contributions"]
+        assert {k: body[f"rule_{k}"][i] for k in e["rules"]} == e["rules"]
+
+
+def test_predict_batch_rejects_bad_requests():
+    assert client.post("/api/v1/predict/batch", json=BATCH).status_code == 403
+    assert client.post("/api/v1/predict/batch", content=b"a,b",
+                       headers={**AUTH, "Content-Type": "text/csv"}).status_code == 415
+    assert client.post("/api/v1/predict/batch", json=BATCH,
+                       headers={**AUTH, "Accept": "text/csv"}).status_code == 406
+    assert client.post("/api/v1/predict/batch", json={"patient_id": ["x"]},
+                       headers=AUTH).status_code == 422
+    short = {**BATCH, "age": [80]}
+    assert client.post("/api/v1/predict/batch", json=short, headers=AUTH).status_code == 422
+    for bad in ({"patient_id": 5}, {**BATCH, "patient_id": [1, 2]},
+                {**BATCH, "institution_id": "dkfz"}, {**BATCH, "age": [80, 1e300]}):
+        assert client.post("/api/v1/predict/batch", json=bad, headers=AUTH).status_code == 422, bad
+
+
+def test_predict_server_timing_header(monkeypatch):
+    from src.monitoring import timing
+    monkeypatch.setattr(timing, "SERVER_TIMING", True)
+    r = client.post("/api/v1/predict", json=BASE, headers=AUTH)
+    stages = [part.split(";")[0] for part in r.headers["Server-Timing"].split(", ")]
+    for stage in ("parse", "auth", "validation", "ensure_model", "scaler_transform",
+                  "predict_proba", "serialize"):
+        assert stage in stages
+    body = {k: BASE[k] for k in ("age", "gender", "conditions", "medications", "recent_encounters")}
+    r = client.post("/api/v1/patients/similar", json=body, headers=AUTH)
+    stages = [part.split(";")[0] for part in r.headers["Server-Timing"].split(", ")]
+    assert "ensure_model" in stages and "similar_patients" in stages
+
+
+def test_server_timing_header_off_by_default():
+    assert "Server-Timing" not in client.get("/").headers
+
+
+def test_predict_is_written_to_audit_log():
+    import gzip
+    import json
+    from src.monitoring import event_sink
+    from src.monitoring.events import hash_patient_id
+
+    client.post("/api/v1/predict", json={**BASE, "patient_id": "AUDIT-001"}, headers=AUTH)
+    event_sink().flush()
+    with gzip.open(event_sink().writer.path, "rt") as f:
+        events = [json.loads(line) for line in f]
+    event = next(e for e in events if e["patient_id"] == hash_patient_id("AUDIT-001"))
+    assert event["principal"].startswith("key:") and "dev-key" not in event["principal"]
+    assert event["risk_level"] in {"LOW", "MEDIUM", "HIGH"}
+
+
+def test_rate_limited_tenant_gets_429(monkeypatch):
+    from src.api.main import ADMISSION
+    monkeypatch.setattr(ADMISSION, "limits", {"interactive": (0.01, 2), "bulk": (0.01, 2)})
+    monkeypatch.setattr(ADMISSION, "_buckets", {})
+    headers = {"X-API-Key": "dev-key-embl"}
+    codes = [
+        client.post("/api/v1/predict", json=BASE, headers=headers).status_code
+        for _ in range(3)
+    ]
+    assert codes == [200, 200, 429]
+    r = client.post("/api/v1/predict", json=BASE, headers=headers)
+    assert int(r.headers["Retry-After"]) >= 1
+    # Other tenants keep their own budget
+    assert client.post("/api/v1/predict", json=BASE, headers=AUTH).status_code == 200
+
+
+def test_predict_by_id_key_lists_are_admitted_as_bulk(monkeypatch):
+    from src.api.main import ADMISSION
+    monkeypatch.setattr(ADMISSION, "limits", {"interactive": (1000, 1000), "bulk": (0.01, 1)})
+    monkeypatch.setattr(ADMISSION, "_buckets", {})
+    keys = [{"institution_id": "dkfz", "patient_id": f"LIST-{i}"} for i in range(3)]
+    assert client.post("/api/v1/predict/by-id", json=keys, headers=AUTH).status_code == 200
+    assert client.post("/api/v1/predict/by-id", json=keys, headers=AUTH).status_code == 429
+    single = client.post("/api/v1/predict/by-id", json=keys[0], headers=AUTH)
+    assert single.status_code == 404  # interactive budget untouched; the key is not stored
+
+
+def _controller(**kwargs):
+    from src.api.admission import AdmissionController
+    limits = {"interactive": (1000, 1000), "bulk": (1000, 1000)}
+    return AdmissionController(limits, concurrency=1, **kwargs)
+
+
+def test_admission_serves_interactive_first_then_tenants_fairly():
+    import asyncio
+
+    async def scenario():
+        ctl = _controller(targets={"interactive": 5, "bulk": 5})
+        await ctl.acquire("busy", "bulk")
+        order = []
+
+        async def request(tenant, priority, name):
+            await ctl.acquire(tenant, priority)
+            order.append(name)
+            ctl.release(priority, 0.0)
+
+        tasks = [asyncio.create_task(request("ukhd", "bulk", f"ukhd-{i}")) for i in range(3)]
+        tasks.append(asyncio.create_task(request("dkfz", "bulk", "dkfz-0")))
+        tasks.append(asyncio.create_task(request("embl", "interactive", "embl-0")))
+        await asyncio.sleep(0)
+        ctl.release("bulk", 0.0)
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(scenario()) == ["embl-0", "ukhd-0", "dkfz-0", "ukhd-1", "ukhd-2"]
+
+
+def test_admission_sheds_and_times_out():
+    import asyncio
+    from src.api.admission import Rejected
+
+    async def scenario():
+        ctl = _controller(targets={"interactive": 0.05, "bulk": 0.05})
+        await ctl.acquire("a", "interactive")
+        with pytest.raises(Rejected) as timeout:
+            await ctl.acquire("b", "interactive")
+        ctl._service["interactive"] = 1.0  # recent requests took 1s: waiting cannot meet 50ms
+        with pytest.raises(Rejected) as shed:
+            await ctl.acquire("b", "interactive")
+        ctl.release("interactive", 0.0)
+        assert ctl.in_flight == 0 and ctl._waiting == {"interactive": 0, "bulk": 0}
+        return timeout.value, shed.value
+
+    timeout, shed = asyncio.run(scenario())
+    assert timeout.status == shed.status == 503
+    assert timeout.reason != shed.reason and shed.retry_after >= 1
+
+
+def test_admission_charges_by_rows():
+    import asyncio
+    from src.api.admission import AdmissionController, Rejected
+
+    async def scenario():
+        ctl = AdmissionController({"interactive": (10, 10), "bulk": (10, 10)}, concurrency=1,
+                                  rows_per_token=100)
+        await ctl.acquire("big", "bulk")
+        ctl.charge("big", "bulk", 5000)  # 50 tokens: 40 in debt after the burst of 10
+        ctl.release("bulk", 0.0)
+        with pytest.raises(Rejected) as limited:
+            await ctl.acquire("big", "bulk")
+        await ctl.acquire("small", "bulk")  # other tenants keep their own budget
+        ctl.charge("small", "bulk", 50)  # under one token: nothing more to pay
+        ctl.release("bulk", 0.0)
+        return limited.value, ctl
+
+    limited, ctl = asyncio.run(scenario())
+    assert limited.status == 429 and limited.retry_after >= 4
+    # The rest of the cost moves "big" back in the fair queue as if it had queued 49 more
+    assert ctl._last_start[("big", "bulk")] == pytest.approx(49.0)
+    assert ("small", "bulk") not in ctl._last_start
+
+
+def _candidate(tmp_path):
+    from src.data import generate_training_data
+    from src.models import save_model, train_model
+    model, scaler, _ = train_model(generate_training_data(300, seed=7), n_estimators=10)
+    path = str(tmp_path / "candidate.pkl")
+    save_model(model, scaler, path)
+    return path
+
+
+def test_canary_serves_candidate_for_sticky_share_of_patients(tmp_path, monkeypatch):
+    from src.api.main import SHADOW
+    monkeypatch.setattr(SHADOW, "path", _candidate(tmp_path))
+    monkeypatch.setattr(SHADOW, "_model", None)
+    monkeypatch.setattr(SHADOW, "canary_percent", 100)
+    r = client.post("/api/v1/predict", json=BASE, headers=AUTH)
+    assert r.status_code == 200 and r.headers["X-Model-Variant"] == "candidate"
+
+    monkeypatch.setattr(SHADOW, "canary_percent", 30)
+    routed = [SHADOW.routes_to_candidate(f"P{i}") for i in range(2000)]
+    assert routed == [SHADOW.routes_to_candidate(f"P{i}") for i in range(2000)]
+    assert 0.25 < sum(routed) / len(routed) < 0.35
+
+
+def test_shadow_scoring_is_recorded_and_bounded(tmp_path):
+    from prometheus_client import REGISTRY
+    from src.api.shadow import ShadowScorer
+
+    def count(outcome):
+        return REGISTRY.get_sample_value("shadow_predictions_total", {"outcome": outcome}) or 0
+
+    scored, dropped = count("scored"), count("dropped")
+    features = {
+        "age": 80, "num_conditions": 9, "num_medications": 20,
+        "recent_encounters": 4, "gender_encoded": 1,
+    }
+    shadow = ShadowScorer(_candidate(tmp_path), fraction=1.0, max_pending=1)
+    try:
+        shadow.preload()
+        assert shadow.maybe_submit(features, 0.1, 0.001)
+        assert not shadow.maybe_submit(features, 0.1, 0.001)  # one job already outstanding
+        shadow._executor.shutdown(wait=True)
+    finally:
+        shadow.shutdown()
+    assert count("scored") == scored + 1 and count("dropped") == dropped + 1
+    assert shadow._pending == 0
+    assert REGISTRY.get_sample_value("shadow_probability_delta_count") >= 1
+
+
+def test_shadow_pool_is_rebuilt_after_it_breaks(tmp_path):
+    import time
+    from src.api.shadow import ShadowScorer
+
+    features = {
+        "age": 80, "num_conditions": 9, "num_medications": 20,
+        "recent_encounters": 4, "gender_encoded": 1,
+    }
+    shadow = ShadowScorer(_candidate(tmp_path), fraction=1.0, max_restarts=1)
+
+    def kill_worker():
+        executor = shadow._executor
+        executor.submit(os.getpid).result(timeout=60)  # wait for the worker to start
+        for process in list(executor._processes.values()):
+            process.kill()
+        deadline = time.monotonic() + 30
+        while shadow._executor is executor and time.monotonic() < deadline:
+            shadow.maybe_submit(features, 0.1, 0.001)
+            time.sleep(0.05)
+        assert shadow._executor is not executor
+
+    try:
+        shadow.preload()
+        kill_worker()
+        deadline = time.monotonic() + 30
+        while shadow._executor is None and time.monotonic() < deadline:
+            time.sleep(0.05)  # rebuilt in the background, not by a sample
+        assert shadow.maybe_submit(features, 0.1, 0.001)  # a new pool took over
+        kill_worker()
+        assert not shadow.maybe_submit(features, 0.1, 0.001)  # out of restarts
+    finally:
+        shadow.shutdown()
+
+
+def test_serve_backs_off_workers_crashing_on_startup():
+    from src.api.serve import MAX_RESTART_BACKOFF, _restart_delay
+    delays = [_restart_delay(n) for n in range(12)]
+    assert delays[0] == 0.0 and delays[1] > 0
+    assert all(a < b or b == MAX_RESTART_BACKOFF for a, b in zip(delays[1:], delays[2:]))
+    assert delays[-1] == MAX_RESTART_BACKOFF
+
+
+def _collect(seen):
+    def process(records):
+        seen.extend(r["id"] for r in records)
+        return len(records), 0, []
+    return process
+
+
+def test_ingest_queue_batches_fsyncs_under_sustained_load(tmp_path):
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from src.api.ingest_queue import IngestQueue
+
+    seen = []
+    q = IngestQueue(str(tmp_path), _collect(seen), workers=4, batch_size=7, segment_bytes=64 << 10)
+    jobs = 400
+    t = time.perf_counter()
+    with ThreadPoolExecutor(16) as pool:
+        ids = list(pool.map(lambda j: q.submit([{"id": f"{j}-{i}"} for i in range(20)])["job_id"],
+                            range(jobs)))
+    statuses = [q.wait(job_id) for job_id in ids]
+    elapsed = time.perf_counter() - t
+    q.stop()
+
+    assert all(s["status"] == "done" and s["accepted"] == s["processed"] == 20 for s in statuses)
+    assert sorted(seen) == sorted(f"{j}-{i}" for j in range(jobs) for i in range(20))
+    # Concurrent appends shared fsyncs
+    assert q._log.stats["appends"] == jobs and q._log.stats["fsyncs"] < jobs
+    assert len(q._log.segments()) == 1  # rolled segments were deleted once fully acknowledged
+    assert jobs * 20 / elapsed > 1000, f"{jobs * 20 / elapsed:.0f} records/s"
+
+
+def test_ingest_queue_retries_io_errors_and_rejects_bad_records(tmp_path):
+    from src.api.ingest_queue import IngestQueue
+
+    seen, calls = [], []
+
+    def process(records):
+        calls.append(len(records))
+        if len(calls) == 1:
+            raise OSError("store lock unavailable")
+        if any(r["id"] == "bad" for r in records):
+            raise ValueError("Invalid patient key")
+        return _collect(seen)(records)
+
+    q = IngestQueue(str(tmp_path), process, workers=1, retry_delay=0.01)
+    status = q.wait(q.submit([{"id": "good"}, {"id": "bad"}, {"id": "also-good"}])["job_id"])
+    q.stop()
+    assert status["status"] == "done" and status["attempts"] == 2
+    assert (status["accepted"], status["rejected"]) == (2, 1)
+    assert status["errors"] == ["Record 'bad': Invalid patient key"]
+    assert sorted(seen) == ["also-good", "good"]
+
+
+def test_ingest_queue_fails_jobs_on_unexpected_errors_and_prunes_statuses(tmp_path):
+    import time
+    from src.api.ingest_queue import IngestQueue
+
+    q = IngestQueue(str(tmp_path), lambda records: None, workers=1, status_ttl=60)
+    job_id = q.submit([{"id": "a"}])["job_id"]
+    status = q.wait(job_id)
+    running = q.submit([])["job_id"]
+    q.wait(running)
+    q.stop()
+    assert status["status"] == "failed" and status["errors"][-1].startswith("TypeError")
+
+    q._write_status({**q.status(running), "status": "processing"})
+    assert q.prune_statuses() == 0  # nothing is older than the TTL yet
+    assert q.prune_statuses(now=time.time() + 120) == 1  # the finished job only
+    assert q.status(job_id) is None and q.status(running)["status"] == "processing"
+
+
+def test_ingest_queue_recovers_jobs_of_a_crashed_process(tmp_path):
+    import subprocess
+    from src.api.ingest_queue import IngestQueue
+
+    # The child accepts 5 jobs, starts processing the first and dies without acknowledging any
+    # of them
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    script = f"""
+import os, sys, time
+sys.path.insert(0, {root!r})
+from src.api.ingest_queue import IngestQueue
+q = IngestQueue({str(tmp_path)!r}, lambda records: time.sleep(60), workers=1)
+ids = [q.submit([{{"id": f"{{j}}-{{i}}"}} for i in range(3)])["job_id"] for j in range(5)]
+while q.status(ids[0])["status"] != "processing":
+    time.sleep(0.01)
+with open(q._log._path(q._log._segment), "ab") as f:
+    f.write(b"\\x10\\x00\\x00\\x00torn")
+print(",".join(ids), flush=True)
+os._exit(1)
+"""
+    child = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True,
+                           timeout=60)
+    ids = child.stdout.strip().split(",")
+    assert len(ids) == 5, child.stderr
+
+    seen = []
+    q = IngestQueue(str(tmp_path), _collect(seen), workers=2)
+    q.start()
+    statuses = [q.wait(job_id) for job_id in ids]
+    q.stop()
+    assert [s["status"] for s in statuses] == ["done"] * 5
+    assert statuses[0]["attempts"] == 2 and statuses[1]["attempts"] == 1
+    assert sorted(seen) == sorted(f"{j}-{i}" for j in range(5) for i in range(3))
+    assert os.listdir(tmp_path / "segments") == []  # the adopted log was drained and removed
+
+
+def test_ingest_status_unknown_job_returns_404():
+    assert client.get("/api/v1/data/ingest/0123abcd", headers=AUTH).status_code == 404
+    assert client.get("/api/v1/data/ingest/..%2Fsecrets", headers=AUTH).status_code == 404
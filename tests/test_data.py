@@ -74,3 +74,155 @@ def test_parse_institution_data_empty_records():
     df = parse_institution_data("embl", [])
     assert isinstance(df, pd.DataFrame)
     assert len(df) == 0
+
+
+def test_feature_store_upserts_grow_and_reload(tmp_path):
+    from src.data.feature_store import FeatureStore
+
+    store = FeatureStore(str(tmp_path), initial_capacity=2)
+    keys = [("DKFZ", f"P{i}") for i in range(5)]
+    assert store.upsert(keys, [[i, 1, 2, 3, 0] for i in range(5)]) == 5
+    assert store.upsert([("dkfz", "P0")], [[99, 1, 2, 3, 1]]) == 0
+
+    reopened = FeatureStore(str(tmp_path))
+    assert len(reopened) == 5
+    assert reopened.get("dkfz", "P0")["age"] == 99
+    vectors, found = reopened.lookup([("dkfz", "P4"), ("embl", "P4")])
+    assert found.tolist() == [True, False] and vectors[0, 0] == 4
+
+    store.upsert([("embl", "P4")], [[50, 0, 0, 0, 0]])
+    assert reopened.get("embl", "P4")["age"] == 50
+
+
+def test_feature_store_lookups_during_upserts_keep_rows_aligned(tmp_path, monkeypatch):
+    import threading
+    import time
+    from src.data.feature_store import FeatureStore
+
+    store = FeatureStore(str(tmp_path), initial_capacity=4)
+    getsize = os.path.getsize
+
+    def slow_getsize(path):  # widen the window between checking and indexing the keys file
+        time.sleep(0.0005)
+        size = getsize(path)
+        time.sleep(0.0005)
+        return size
+
+    monkeypatch.setattr(os.path, "getsize", slow_getsize)
+    n = 200
+    done = threading.Event()
+    errors, mismatches = [], []
+
+    def write():
+        try:
+            for i in range(n):
+                store.upsert([("dkfz", f"P{i}")], [[i, 1, 2, 3, 0]])
+        except Exception as e:
+            errors.append(e)
+        finally:
+            done.set()
+
+    def read():
+        while not done.is_set():
+            vectors, found = store.lookup([("dkfz", "P5")])
+            if found[0] and vectors[0, 0] != 5:
+                mismatches.append(vectors[0, 0])
+
+    threads = [threading.Thread(target=write)] + [threading.Thread(target=read) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=60)
+
+    assert not errors and not mismatches
+    assert len(store) == n
+    keys, vectors = FeatureStore(str(tmp_path)).items()
+    assert len(keys) == n
+    assert all(vectors[row, 0] == int(pid[1:]) for row, (_, pid) in enumerate(keys))
+
+
+def test_age_from_birth_date():
+    from datetime import date
+    from src.data import age_from_birth_date
+
+    assert age_from_birth_date("1960-06-15", today=date(2020, 6, 14)) == 59
+    assert age_from_birth_date("1960-06-15", today=date(2020, 6, 15)) == 60
+    with pytest.raises(ValueError):
+        age_from_birth_date("15/06/1960")
+
+
+def test_snapshots_upload_only_changed_chunks_and_rebuild_history(tmp_path):
+    from src.data.snapshots import LocalObjectStore, load_records, rebuild_dataset, snapshot
+
+    store = LocalObjectStore(str(tmp_path))
+    day1 = [
+        {"resourceType": "Patient", "id": f"dkfz-{i:05d}", "gender": "male",
+         "birthDate": "1960-01-01"}
+        for i in range(2000)
+    ]
+    first = snapshot(store, "dkfz", "2024-01-01", day1, chunk_records=32)
+    assert first["records"] == 2000 and first["stats"]["chunks_uploaded"] == len(first["chunks"])
+
+    changed = [dict(day1[7], gender="female"), {**day1[0], "id": "dkfz-99999"}]
+    second = snapshot(store, "dkfz", "2024-01-02", changed, chunk_records=32)
+    assert second["records"] == 2001 and second["parent"] == "2024-01-01"
+    assert second["stats"]["chunks_uploaded"] <= 2 < len(second["chunks"])
+    assert second["stats"]["bytes_uploaded"] < first["stats"]["bytes_uploaded"] / 10
+
+    # A rerun of the same day replaces its manifest without new uploads
+    rerun = snapshot(store, "dkfz", "2024-01-02", changed, chunk_records=32)
+    assert rerun["chunks"] == second["chunks"]
+
+    assert load_records(store, "dkfz", "2024-01-01") == day1
+    latest = load_records(store, "dkfz")
+    assert latest[7]["gender"] == "female" and latest[-1]["id"] == "dkfz-99999"
+    assert load_records(store, "dkfz", "2023-12-31") == []
+    assert len(rebuild_dataset(store, "2024-01-05")) == 2001
+
+
+def test_sharded_reader_streams_snapshots_through_cache(tmp_path):
+    from src.data.loader import ShardedReader, read_training_frame
+    from src.data.snapshots import LocalObjectStore, snapshot
+
+    store = LocalObjectStore(str(tmp_path / "store"))
+    for inst in ("dkfz", "ukhd"):
+        records = [
+            {"resourceType": "Patient", "id": f"{inst}-{i:04d}", "gender": "male",
+             "birthDate": "1960-06-15", "conditions": ["c"] * (i % 5),
+             "recent_encounters": i % 3, "readmitted": i % 2}
+            for i in range(300)
+        ]
+        records.append({"resourceType": "Patient", "id": f"{inst}-unlabelled", "gender": "female",
+                        "birthDate": "1990-01-01"})
+        snapshot(store, inst, "2024-01-01", records, chunk_records=16)
+
+    cache = str(tmp_path / "cache")
+    reader = ShardedReader(store, day="2024-01-01", institutions=["dkfz", "ukhd", "embl"],
+                           cache_dir=cache, prefetch=2)
+    batches = list(reader)
+    assert len(batches) == reader.stats["shards"] == reader.stats["fetched"] > 2
+    df = pd.concat(batches, ignore_index=True)
+    assert len(df) == 602 and df["readmitted"].isna().sum() == 2
+    row = df[df["patient_id"] == "dkfz-0004"].iloc[0]
+    features = ("age", "num_conditions", "recent_encounters", "gender_encoded")
+    assert tuple(row[f] for f in features) == (63, 4, 1, 1)
+
+    again = ShardedReader(store, cache_dir=cache)
+    train = again.read()
+    assert again.stats["fetched"] == 0 and again.stats["cached"] == reader.stats["shards"]
+    assert len(train) == 600 and set(train["readmitted"]) == {0, 1}
+
+    frame = read_training_frame(str(tmp_path / "store"), cache_dir=cache)
+    assert "patient_id" not in frame.columns and set(frame["institution"]) == {"dkfz", "ukhd"}
+
+
+def test_read_training_frame_rejects_unlabelled_snapshots(tmp_path):
+    from src.data.loader import read_training_frame
+    from src.data.snapshots import LocalObjectStore, snapshot
+
+    store = str(tmp_path / "store")
+    records = [{"resourceType": "Patient", "id": f"dkfz-{i}", "gender": "male",
+                "birthDate": "1960-06-15"} for i in range(20)]
+    snapshot(LocalObjectStore(store), "dkfz", "2024-01-01", records)
+    with pytest.raises(ValueError, match="No labelled records in .*store as of 2024-01-01"):
+        read_training_frame(store, day="2024-01-01")
@@ -75,3 +75,215 @@ def test_save_load_model_roundtrip():
         assert abs(predict_risk(model, scaler, features) - predict_risk(loaded_model, loaded_scaler, features)) < 1e-9
     finally:
         os.unlink(path)
+
+
+def test_merge_scaler_stats_matches_global_fit():
+    from src.models import FEATURES
+    from src.models.federated import merge_scaler_stats
+
+    df = _sample_df(300)[FEATURES]
+    parts = [df.iloc[:50], df.iloc[50:180], df.iloc[180:]]
+    stats = [(len(p), p.mean().to_numpy(), p.var(ddof=0).to_numpy()) for p in parts]
+    merged = merge_scaler_stats(stats, FEATURES)
+    reference = StandardScaler().fit(df)
+    assert np.allclose(merged.mean_, reference.mean_)
+    assert np.allclose(merged.scale_, reference.scale_)
+
+
+def test_merge_forests_concatenates_trees():
+    from src.models.federated import merge_forests
+
+    m1, scaler, _ = train_model(_sample_df(seed=1))
+    m2, _, _ = train_model(_sample_df(seed=2), scaler=scaler)
+    merged = merge_forests([m1, m2])
+    assert merged.n_estimators == m1.n_estimators + m2.n_estimators
+    assert 0.0 <= predict_risk(merged, scaler, {"age": 70}) <= 1.0
+
+
+def test_merge_forests_weighted_averages_probabilities():
+    from src.models.federated import merge_forests
+
+    m1, scaler, _ = train_model(_sample_df(seed=1))
+    m2, _, _ = train_model(_sample_df(seed=2), scaler=scaler)
+    ensemble = merge_forests([m1, m2], weights=[1, 3], strategy="weighted")
+    X = scaler.transform(_sample_df(5)[list(scaler.feature_names_in_)])
+    expected = 0.25 * m1.predict_proba(X) + 0.75 * m2.predict_proba(X)
+    assert np.allclose(ensemble.predict_proba(X), expected)
+
+
+def _expected_value(tree, x, coalition, node=0):
+    """Path-dependent expectation of one tree given the features in ``coalition``
+    (TreeSHAP Algorithm 1)."""
+    left, right = tree.children_left[node], tree.children_right[node]
+    if left == -1:
+        return tree.value[node][0][1] / tree.value[node][0].sum()
+    if tree.feature[node] in coalition:
+        child = left if x[tree.feature[node]] <= tree.threshold[node] else right
+        return _expected_value(tree, x, coalition, child)
+    cover = tree.weighted_n_node_samples
+    return (cover[left] * _expected_value(tree, x, coalition, left)
+            + cover[right] * _expected_value(tree, x, coalition, right)) / cover[node]
+
+
+def test_tree_explainer_matches_brute_force_shapley_values():
+    from itertools import combinations
+    from math import factorial
+
+    from src.models import FEATURES
+    from src.models.explain import TreeExplainer
+    from src.models.federated import merge_forests
+
+    m1, scaler, _ = train_model(_sample_df(seed=1), n_estimators=4, max_depth=4)
+    m2, _, _ = train_model(_sample_df(seed=2), scaler=scaler, n_estimators=3, max_depth=5)
+    model = merge_forests([m1, m2], weights=[1, 3], strategy="weighted")
+    X = _sample_df(6, seed=3)[FEATURES].to_numpy(dtype=float)
+    explainer = TreeExplainer(model, scaler)
+    phi = explainer.contributions(X)
+
+    Xs = scaler.transform(X).astype(np.float32)
+    M = len(FEATURES)
+
+    def v(x, coalition):
+        return sum(
+            w * np.mean([_expected_value(est.tree_, x, coalition) for est in forest.estimators_])
+            for forest, w in zip(model.forests, model.weights)
+        )
+
+    for x, row in zip(Xs[:3], phi):
+        for j in range(M):
+            others = [k for k in range(M) if k != j]
+            exact = sum(
+                factorial(r) * factorial(M - r - 1) / factorial(M) * (v(x, {*S, j}) - v(x, set(S)))
+                for r in range(M) for S in combinations(others, r)
+            )
+            assert row[j] == pytest.approx(exact, abs=1e-6)
+    assert explainer.base_value == pytest.approx(v(None, set()))
+    prob = model.predict_proba(scaler.transform(X))[:, 1]
+    assert np.allclose(explainer.base_value + phi.sum(axis=1), prob, atol=1e-6)
+
+
+def test_tree_explainer_rejects_compact_forest():
+    from src.models.explain import TreeExplainer
+    from src.models.optimize import CompactForest
+
+    model, scaler, _ = train_model(_sample_df(), n_estimators=5)
+    with pytest.raises(TypeError):
+        TreeExplainer(CompactForest.from_trees(model.estimators_), scaler)
+
+
+def test_compact_forest_matches_sklearn_forest():
+    from src.data import generate_training_data
+    from src.models.optimize import CompactForest
+
+    df = generate_training_data(1500)
+    model, scaler, _ = train_model(df)
+    X = scaler.transform(df.drop(columns="readmitted"))
+    compact = CompactForest.from_trees(model.estimators_)
+    # Only the uint8 leaf quantization may differ
+    assert np.abs(compact.predict_proba(X)[:, 1] - model.predict_proba(X)[:, 1]).max() < 1 / 255
+    assert compact.n_nodes < sum(est.tree_.node_count for est in model.estimators_)
+
+
+def test_optimize_model_report_and_roundtrip():
+    from src.data import generate_training_data
+    from src.models.optimize import CompactForest, optimize_model
+
+    df = generate_training_data(1500)
+    model, scaler, _ = train_model(df)
+    compact, report = optimize_model(model, scaler, df, tolerance=0.01)
+    assert isinstance(compact, CompactForest)
+    assert report["n_trees"][1] <= report["n_trees"][0]
+    assert report["size_bytes"][1] < report["size_bytes"][0]
+    assert report["roc_auc"][1] >= report["roc_auc"][0] - 0.05
+
+    with tempfile.NamedTemporaryFile(suffix=".pkl", delete=False) as f:
+        path = f.name
+    try:
+        save_model(compact, scaler, path, metadata={"optimization": report})
+        loaded_model, loaded_scaler = load_model(path)
+        prob = predict_risk(loaded_model, loaded_scaler, {"age": 70, "recent_encounters": 3})
+        assert 0.0 <= prob <= 1.0
+    finally:
+        os.unlink(path)
+
+
+def test_train_model_accepts_hyperparameters():
+    model, _, _ = train_model(_sample_df(200), n_estimators=7, max_depth=3)
+    assert model.n_estimators == 7 and model.max_depth == 3
+
+
+def test_successive_halving_returns_pareto_front():
+    from src.data import generate_training_data
+    from src.models.tuning import SEARCH_SPACE, pareto_front, successive_halving
+
+    best, search = successive_halving(generate_training_data(1500), n_candidates=4, eta=2,
+                                      min_rows=200, max_workers=2)
+    assert all(best[k] in SEARCH_SPACE[k] for k in SEARCH_SPACE)
+    rounds = sorted({t["round"] for t in search["trials"]})
+    assert rounds == [0, 1]
+    assert len([t for t in search["trials"] if t["round"] == 1]) == 2
+    assert search["pareto_front"] and search["best"]["params"] == best
+    trials = [{"roc_auc": 0.7, "latency_ms": 1.0}, {"roc_auc": 0.6, "latency_ms": 2.0}]
+    assert pareto_front(trials) == [{"roc_auc": 0.7, "latency_ms": 1.0}]
+
+
+def test_bootstrap_metrics_match_sklearn():
+    from sklearn.metrics import average_precision_score, brier_score_loss, roc_auc_score
+    from src.models.evaluation import bootstrap_metrics
+
+    rng = np.random.default_rng(0)
+    y = rng.integers(0, 2, 3000)
+    prob = np.round(np.clip(0.3 * y + 0.7 * rng.random(3000), 0, 1), 2)  # rounded: plenty of ties
+    subset = np.arange(3000) < 1000
+
+    overall, part = bootstrap_metrics(y, prob, n_bootstrap=200, subsets=[subset])
+    assert overall["roc_auc"]["value"] == round(roc_auc_score(y, prob), 4)
+    assert overall["pr_auc"]["value"] == round(average_precision_score(y, prob), 4)
+    assert overall["brier"]["value"] == round(brier_score_loss(y, prob), 4)
+    assert part["roc_auc"]["value"] == round(roc_auc_score(y[subset], prob[subset]), 4)
+    for m in overall.values():
+        assert m["ci_low"] <= m["value"] <= m["ci_high"]
+
+
+def test_evaluate_model_reports_groups_with_intervals():
+    from src.data import INSTITUTIONS, generate_training_data
+    from src.models.evaluation import evaluate_model
+
+    df = generate_training_data(1200)
+    df["institution"] = np.resize(INSTITUTIONS, len(df))
+    result = evaluate_model(df, params={"n_estimators": 10}, n_splits=3, n_bootstrap=100,
+                            max_workers=2)
+    assert len(result["fold_roc_auc"]) == 3
+    assert set(result["overall"]) == {"roc_auc", "pr_auc", "brier", "ece"}
+    assert set(result["groups"]["institution"]) == {"dkfz", "ukhd", "embl"}
+    assert sum(g["n"] for g in result["groups"]["age_band"].values()) == len(df)
+    assert sum(b["n"] for b in result["calibration_curve"]) == len(df)
+
+
+def test_patient_index_matches_brute_force_neighbors(tmp_path):
+    from src.models import FEATURES, load_artifact
+    from src.models.neighbors import build_index
+
+    df = _sample_df(2000, seed=3)
+    df["age"] = df["age"] // 10 * 10  # coarse ages, so many patients share a profile
+    scaler = StandardScaler().fit(df[FEATURES])
+    index = build_index(df, scaler)
+    assert index.n_patients == 2000 and index.n_profiles < 2000
+    save_model(RandomForestClassifier(), scaler, tmp_path / "model.pkl", index=index)
+    index = load_artifact(tmp_path / "model.pkl")["index"]
+
+    Z = scaler.transform(df[FEATURES])
+    for x in df[FEATURES].to_numpy()[:20] + [1, 0, 1, 0, 0]:
+        result = index.query(x, k=25)
+        d = np.sqrt(((Z - (x - scaler.mean_) / scaler.scale_) ** 2).sum(axis=1))
+        assert result["patients"] == sum(n["patients"] for n in result["neighbors"]) == 25
+        # The k-th neighbor's distance matches brute force, and every closer patient is included
+        assert result["neighbors"][-1]["distance"] == pytest.approx(np.sort(d)[24], abs=1e-4)
+        last = result["neighbors"][-1]["distance"]
+        assert (d < last - 1e-4).sum() <= sum(n["patients"] for n in result["neighbors"][:-1])
+        assert (d <= last + 1e-4).sum() >= 25
+        first = result["neighbors"][0]
+        same = (df[FEATURES] == pd.Series(first["features"])).all(axis=1)
+        assert first["profile_patients"] == same.sum()
+        expected = df.loc[same, "readmitted"].mean()
+        assert first["readmission_rate"] == pytest.approx(expected, abs=1e-4)
@@ -0,0 +1,109 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from prometheus_client import REGISTRY
+from src.monitoring.timing import record_gap, sampled_profile, span, start_timeline
+from src.monitoring import timing
+from src.monitoring.events import AuditLog, PredictionEventSink, hash_patient_id
+
+
+def test_span_observes_stage_histogram():
+    with span("unit_test_stage"):
+        pass
+    count = REGISTRY.get_sample_value("request_stage_duration_seconds_count",
+                                      {"stage": "unit_test_stage"})
+    assert count == 1
+
+
+def test_timeline_collects_spans_and_gaps():
+    timeline = start_timeline()
+    record_gap("parse")
+    with span("auth"):
+        pass
+    record_gap("serialize")
+    assert [s for s, _ in timeline.stages] == ["parse", "auth", "serialize"]
+    header = timeline.server_timing()
+    assert header.startswith("parse;dur=") and "auth;dur=" in header
+
+
+def test_sampled_profile_writes_one_in_n(tmp_path, monkeypatch):
+    monkeypatch.setattr(timing, "PROFILE_SAMPLE_RATE", 2)
+    monkeypatch.setattr(timing, "PROFILE_DIR", str(tmp_path))
+    for _ in range(4):
+        with sampled_profile("/api/v1/predict"):
+            sum(range(1000))
+    files = list(tmp_path.iterdir())
+    assert len(files) == 2
+    assert all(f.name.endswith("api_v1_predict.prof") for f in files)
+
+
+def _emit(sink, n, level="LOW"):
+    return [sink.emit("user:test", f"P{i}", "dkfz", level, 0.1, 0.9, 0.001) for i in range(n)]
+
+
+def test_event_sink_drops_instead_of_blocking_when_full():
+    sink = PredictionEventSink(capacity=5, autostart=False)
+    before = REGISTRY.get_sample_value("prediction_events_dropped_total") or 0
+    assert _emit(sink, 8) == [True] * 5 + [False] * 3
+    assert REGISTRY.get_sample_value("prediction_events_dropped_total") == before + 3
+
+
+def test_event_sink_emit_many_drops_rows_beyond_capacity():
+    sink = PredictionEventSink(capacity=5, autostart=False)
+    before = REGISTRY.get_sample_value("prediction_events_dropped_total") or 0
+    ids = [f"P{i}" for i in range(3)]
+    assert sink.emit_many("user:test", ids, ["dkfz"] * 3, ["LOW"] * 3, [0.1] * 3, [0.8] * 3,
+                          0.001) == 3
+    assert sink.emit_many("user:test", ids, ["dkfz"] * 3, ["LOW"] * 3, [0.1] * 3, [0.8] * 3,
+                          0.001) == 2
+    assert len(sink._buffer) == 5
+    assert REGISTRY.get_sample_value("prediction_events_dropped_total") == before + 1
+
+
+def test_event_sink_emit_many_can_write_oversized_batches_synchronously():
+    sink = PredictionEventSink(capacity=5, autostart=False, overflow="write")
+    labels = {"status": "success", "risk_level": "HIGH"}
+    before = REGISTRY.get_sample_value("predictions_total", labels) or 0
+    ids = [f"P{i}" for i in range(3)]
+    sink.emit_many("user:test", ids, ["dkfz"] * 3, ["HIGH"] * 3, [0.9] * 3, [0.8] * 3, 0.001)
+    assert len(sink._buffer) == 3
+    assert sink.emit_many("user:test", ids * 4, ["dkfz"] * 12, ["HIGH"] * 12, [0.9] * 12,
+                          [0.8] * 12, 0.001) == 12
+    assert len(sink._buffer) == 3
+    assert REGISTRY.get_sample_value("predictions_total", labels) == before + 12
+
+
+def test_event_sink_flush_updates_metrics():
+    sink = PredictionEventSink(autostart=False)
+    labels = {"status": "success", "risk_level": "MEDIUM"}
+    before = REGISTRY.get_sample_value("predictions_total", labels) or 0
+    _emit(sink, 10, level="MEDIUM")
+    assert sink.flush() == 10
+    assert REGISTRY.get_sample_value("predictions_total", labels) == before + 10
+
+
+def test_audit_log_appends_and_rotates(tmp_path):
+    import gzip
+    import json
+
+    log = AuditLog(str(tmp_path), max_bytes=200)
+    sink = PredictionEventSink(log, batch_size=3, autostart=False)
+    _emit(sink, 9)
+    sink.flush()
+    files = sorted(tmp_path.iterdir())
+    assert len(files) >= 2
+    events = []
+    for f in files:
+        with gzip.open(f, "rt") as fh:
+            events += [json.loads(line) for line in fh]
+    expected = sorted(hash_patient_id(f"P{i}") for i in range(9))
+    assert sorted(e["patient_id"] for e in events) == expected
+
+
+def test_event_sink_background_thread_drains():
+    sink = PredictionEventSink(flush_interval=0.01)
+    _emit(sink, 3)
+    sink.stop()
+    assert len(sink._buffer) == 0
@@ -0,0 +1,194 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest
+from src.data import generate_training_data
+from src.models import predict_risk
+from src.pipelines.federated import run_federated_training
+
+
+def test_federated_training_merges_all_sites():
+    df = generate_training_data(900, seed=7)
+    model, scaler, metrics = run_federated_training(df, max_workers=2)
+    assert set(metrics["sites"]) == {"dkfz", "ukhd", "embl"}
+    assert model.n_estimators == 300
+    assert 0.0 <= metrics["roc_auc"] <= 1.0
+    assert sum(m["n_samples"] for m in metrics["sites"].values()) == len(df)
+
+
+def test_federated_training_respects_institution_column():
+    df = generate_training_data(600, seed=7)
+    df["institution"] = ["dkfz"] * 400 + ["embl"] * 200
+    model, scaler, metrics = run_federated_training(df, strategy="weighted", max_workers=2)
+    assert set(metrics["sites"]) == {"dkfz", "embl"}
+    assert list(model.weights.round(3)) == [0.667, 0.333]
+    assert 0.0 <= predict_risk(model, scaler, {"age": 70, "recent_encounters": 3}) <= 1.0
+
+
+def test_federated_training_without_data_names_the_institutions():
+    df = generate_training_data(50, seed=7)
+    df["institution"] = "elsewhere"
+    with pytest.raises(ValueError, match="dkfz, ukhd, embl"):
+        run_federated_training(df)
+
+
+def test_tracker_batches_logs_and_reuses_saved_model(tmp_path, monkeypatch):
+    # MLflow 3 needs an opt-in for file stores
+    monkeypatch.setenv("MLFLOW_ALLOW_FILE_STORE", "true")
+    import mlflow
+    from mlflow.tracking import MlflowClient
+    from src.data import generate_training_data
+    from src.models import save_model, train_model
+    from src.pipelines.tracking import Tracker
+
+    df = generate_training_data(300, seed=7)
+    model, scaler, _ = train_model(df, n_estimators=10)
+    model_path = str(tmp_path / "readmission_model.pkl")
+    save_model(model, scaler, model_path)
+
+    batches = []
+    log_batch = MlflowClient.log_batch
+
+    def counting_log_batch(self, run_id, metrics=(), params=(), **kw):
+        batches.append((len(metrics), len(params)))
+        return log_batch(self, run_id, metrics=metrics, params=params)
+
+    monkeypatch.setattr(MlflowClient, "log_batch", counting_log_batch)
+
+    uri = f"file://{tmp_path / 'mlruns'}"
+    with Tracker(uri, "test-experiment") as run:
+        run.log_params({f"p{i}": i for i in range(150)})
+        run.log_metrics({f"importance_{i}": i / 10 for i in range(20)})
+        run.log_dict({"folds": 5}, "evaluation/cross_validation.json")
+        run.log_model_file(model_path)
+    assert run.run_id and run.error is None
+    assert batches == [(20, 100), (0, 50)]
+
+    client = MlflowClient(tracking_uri=uri)
+    logged = client.get_run(run.run_id)
+    assert logged.info.status == "FINISHED" and len(logged.data.params) == 150
+    artifacts = {a.path for a in client.list_artifacts(run.run_id, "model")}
+    assert artifacts == {"model/MLmodel", "model/readmission_model.pkl"}
+    mlflow.set_tracking_uri(uri)
+    pyfunc = mlflow.pyfunc.load_model(f"runs:/{run.run_id}/model")
+    X = df.drop(columns="readmitted").head(5)
+    expected = model.predict_proba(scaler.transform(X))[:, 1].round(6)
+    assert list(pyfunc.predict(X).round(6)) == list(expected)
+
+
+def test_tracker_degrades_when_server_is_down(tmp_path, monkeypatch):
+    monkeypatch.setenv("MLFLOW_HTTP_REQUEST_MAX_RETRIES", "0")
+    import json
+    from src.pipelines.tracking import Tracker
+
+    run = Tracker("http://127.0.0.1:9", "test-experiment", run_name="offline", timeout=30,
+                  spool_dir=str(tmp_path))
+    run.log_params({"n_samples": 300})
+    run.log_metric("roc_auc", 0.8)
+    run.log_model_file(str(tmp_path / "missing.pkl"))
+    assert run.end() is None and run.error is not None
+    spooled = json.loads((tmp_path / "offline.json").read_text())
+    assert spooled["params"] == {"n_samples": "300"} and spooled["metrics"] == {"roc_auc": 0.8}
+
+
+def test_score_file_keeps_input_order_across_workers(tmp_path):
+    import pandas as pd
+    from src.models import FEATURES, save_model, score_batch, train_model
+    from src.pipelines.scoring import score_file
+
+    model, scaler, _ = train_model(generate_training_data(300, seed=1), n_estimators=10)
+    save_model(model, scaler, tmp_path / "model.pkl")
+    df = generate_training_data(1000, seed=2).drop(columns=["readmitted", "gender_encoded"])
+    df.insert(0, "patient_id", [f"P{i}" for i in range(len(df))])
+    df["gender"] = "male"
+    df.to_csv(tmp_path / "patients.csv", index=False)
+
+    stats = score_file(tmp_path / "patients.csv", tmp_path / "serial.csv", tmp_path / "model.pkl",
+                       workers=1, chunk_size=97)
+    assert stats["rows"] == 1000
+    score_file(tmp_path / "patients.csv", tmp_path / "parallel.csv", tmp_path / "model.pkl",
+               workers=2, chunk_size=97)
+    serial, parallel = pd.read_csv(tmp_path / "serial.csv"), pd.read_csv(tmp_path / "parallel.csv")
+    pd.testing.assert_frame_equal(serial, parallel)
+    assert serial["patient_id"].tolist() == df["patient_id"].tolist()
+
+    X = df.assign(gender_encoded=1)[FEATURES]
+    risk, prob, _, _ = score_batch(model, scaler, X.to_numpy(dtype=float))
+    assert serial["readmission_risk"].tolist() == risk.tolist()
+    assert serial["probability"].tolist() == pytest.approx(prob, abs=1e-4)
+
+
+def test_score_file_rejects_missing_feature_columns(tmp_path):
+    import subprocess
+    from src.models import save_model, train_model
+    from src.pipelines.scoring import MissingColumnsError, score_file
+
+    model, scaler, _ = train_model(generate_training_data(300, seed=1), n_estimators=10)
+    save_model(model, scaler, tmp_path / "model.pkl")
+    (tmp_path / "patients.csv").write_text("age,gender\n70,male\n")
+    missing = r"num_conditions \(or conditions\), num_medications"
+    with pytest.raises(MissingColumnsError, match=missing):
+        score_file(tmp_path / "patients.csv", tmp_path / "out.csv", tmp_path / "model.pkl",
+                   workers=1)
+    assert not (tmp_path / "out.csv").exists()
+
+    script = os.path.join(os.path.dirname(__file__), "..", "scripts", "score.py")
+    cli = subprocess.run([sys.executable, script, str(tmp_path / "patients.csv"),
+                          str(tmp_path / "out.csv"), "--model", str(tmp_path / "model.pkl"),
+                          "--workers", "1"], capture_output=True, text=True)
+    assert cli.returncode == 2 and "recent_encounters" in cli.stderr
+
+
+def test_training_pipeline_skips_unchanged_runs(tmp_path, monkeypatch, caplog):
+    monkeypatch.setenv("MLFLOW_ALLOW_FILE_STORE", "true")
+    import src.pipelines as pipelines
+    from src.models import load_model
+
+    monkeypatch.setattr(pipelines, "MLFLOW_URI", f"file://{tmp_path / 'mlruns'}")
+    monkeypatch.setattr(pipelines, "MODEL_PATH", str(tmp_path / "model.pkl"))
+    data = tmp_path / "patients.csv"
+    generate_training_data(300, seed=4).assign(gender="male").to_csv(data, index=False)
+    trained, train_model = [], pipelines.train_model
+    monkeypatch.setattr(pipelines, "train_model",
+                        lambda df, **kw: trained.append(len(df)) or train_model(df, **kw))
+    cache = str(tmp_path / "cache")
+
+    run_id = pipelines.run_training_pipeline(str(data), cache_dir=cache)
+    assert run_id and trained == [300]
+    (tmp_path / "model.pkl").unlink()
+    with caplog.at_level("INFO", logger="src.pipelines"):
+        assert pipelines.run_training_pipeline(str(data), cache_dir=cache) == run_id
+    assert trained == [300] and "Skipping training" in caplog.text
+    assert load_model(tmp_path / "model.pkl")[0].n_estimators == 100
+
+    # Changed data misses both stages; changed options retrain on the cached features
+    generate_training_data(200, seed=5).assign(gender="male").to_csv(data, index=False)
+    assert pipelines.run_training_pipeline(str(data), cache_dir=cache) != run_id
+    monkeypatch.setattr(pipelines, "load_training_data",
+                        lambda *a: pytest.fail("features should be cached"))
+    pipelines.run_training_pipeline(str(data), strategy="weighted", cache_dir=cache)
+    assert trained == [300, 200, 200]
+
+
+def test_pipeline_benchmark_measures_stages_and_flags_regressions(tmp_path):
+    from benchmarks.bench_pipeline import compare, measure
+
+    ctx = {"df": generate_training_data(500, seed=3), "workdir": str(tmp_path),
+           "model_path": str(tmp_path / "model.pkl")}
+    stages = ("preprocess_features", "save_model", "load_model")
+    results = {"results": [measure(stage, ctx) for stage in stages]}
+    assert [r.get("error") for r in results["results"]] == [None, None, None]
+    assert all(r["rows"] == 500 and r["seconds"] > 0 and r["rss_peak_mb"] >= r["rss_growth_mb"] >= 0
+               and r["alloc_peak_mb"] is not None for r in results["results"])
+    save, load = results["results"][1:]
+    saved_bytes = (tmp_path / "saved.pkl").stat().st_size
+    assert save["artifact_bytes"] == load["artifact_bytes"] == saved_bytes
+
+    assert compare(results, results) == []
+    baseline = {"results": [{**r, "artifact_bytes": 1000} if r["stage"] == "save_model" else r
+                            for r in results["results"]]}
+    results["results"][2] = {**load, "error": "exited with code -9"}
+    regressions = [(r["stage"], r["metric"]) for r in compare(results, baseline)]
+    assert regressions == [("save_model", "artifact_bytes"), ("load_model", "error")]
@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+HEAVY = ("sklearn", "scipy", "pandas", "mlflow", "requests", "jose", "pyarrow")
+
+# Entry point -> packages it only needs on first use, so must not import at startup.
+# Millisecond budgets are checked by `python benchmarks/bench_import_time.py --check`.
+ENTRY_POINTS = {
+    "api": (["-c", "import src.api.main"], HEAVY),
+    "serve": (["-c", "import src.api.serve"], HEAVY + ("fastapi",)),
+    "pipelines": (["-c", "import src.pipelines"], HEAVY),
+    "train --help": (["scripts/train.py", "--help"], HEAVY),
+    "score --help": (["scripts/score.py", "--help"], HEAVY),
+    "prepare_data": (
+        ["-c", "import sys; sys.path.insert(0, 'scripts'); import prepare_data"],
+        ("sklearn", "mlflow"),
+    ),
+}
+
+
+@pytest.mark.parametrize("target", list(ENTRY_POINTS))
+def test_entry_point_does_not_import_heavy_packages(target):
+    args, forbidden = ENTRY_POINTS[target]
+    proc = subprocess.run([sys.executable, "-X", "importtime", *args], cwd=ROOT,
+                          capture_output=True, text=True, env={**os.environ, "PYTHONPATH": ROOT})
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    imported = {
+        line.rsplit("|", 1)[1].strip()
+        for line in proc.stderr.splitlines()
+        if line.startswith("import time:")
+    }
+    loaded = [pkg for pkg in forbidden if pkg in imported]
+    assert not loaded, (f"{target} imports {', '.join(loaded)} at startup "
+                        "(profile: python benchmarks/bench_import_time.py)")